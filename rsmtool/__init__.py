@@ -14,7 +14,24 @@ except ImportError:
 else:
     HAS_RSMEXTRA = True
 
-from .rsmtool import run_experiment
+
+def run_experiment(config_file, output_dir, resume=False, profile=False):
+    """
+    Run RSMTool experiment using the given configuration
+    file and generate all outputs in the given directory.
+    If `resume` is True, the stages of the experiment that
+    have already been completed are not run again.
+    If `profile` is True, the time and memory used by
+    each stage of the experiment are saved as well.
+    The experiment code is only imported when it is needed
+    so that lightweight modules such as `rsmtool.scorer`
+    can be imported without pandas and SKLL.
+    """
+    from .rsmtool import run_experiment as _run_experiment
+    return _run_experiment(config_file, output_dir, resume=resume,
+                           profile=profile)
+
+
 __all__ = ['run_experiment']
 
 # Make sure that DeprecationWarnings are always shown
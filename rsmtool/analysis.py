@@ -1,40 +1,143 @@
 import numpy as np
 import pandas as pd
 
-from scipy.stats import kurtosis, pearsonr
+from scipy.special import betainc
 from sklearn.decomposition import PCA
 from sklearn.metrics import confusion_matrix
-from skll.metrics import kappa
 
-from rsmtool.utils import agreement, partial_correlations
+from rsmtool.utils import (agreement_at_tolerances,
+                           covariance_to_correlation,
+                           partial_correlations_from_covariance)
 
-def compute_basic_descriptives(df, selected_features):
+class FeatureStatistics:
     """
-    Compute basic descriptive statistics for the columns
-    in the given data frame.
+    The sufficient statistics for the given columns of a
+    data frame, computed in a single pass over a contiguous
+    float64 array. This includes the moments of each column,
+    the sorted columns for computing percentiles and the
+    covariance and correlation matrices. All of the training
+    set descriptive analyses are derived from these so that
+    the data only need to be scanned once. The columns must
+    not contain any missing values.
     """
 
-    # select only feature columns
-    df_desc = df[selected_features]
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        self.values = np.ascontiguousarray(df[self.columns].values, dtype=np.float64)
+        self.num_observations = num_observations = len(self.values)
+
+        # compute the moments from the centered values
+        self.means = self.values.mean(axis=0)
+        centered = self.values - self.means
+        squared = centered ** 2
+        second_moments = squared.mean(axis=0)
+        third_moments = (squared * centered).mean(axis=0)
+        fourth_moments = (squared ** 2).mean(axis=0)
+
+        # the covariance matrix shares the centered values
+        self.covariance = centered.T.dot(centered) / (num_observations - 1)
+        self.sds = np.sqrt(np.diag(self.covariance))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # the bias-corrected skewness as computed by pandas
+            self.skewness = (np.sqrt(num_observations * (num_observations - 1)) /
+                             (num_observations - 2) *
+                             third_moments / second_moments ** 1.5)
+            self.skewness[second_moments == 0] = 0
+            if num_observations < 3:
+                self.skewness[:] = np.nan
+
+            # the (non-Fisher) kurtosis as computed by scipy
+            self.kurtosis = fourth_moments / second_moments ** 2
+
+            self.correlation = covariance_to_correlation(self.covariance)
+
+        # sort each column for the minimums, maximums and percentiles
+        self.sorted_values = np.sort(self.values, axis=0)
+        self.mins = self.sorted_values[0]
+        self.maxs = self.sorted_values[-1]
+
+    def indices(self, columns):
+        """
+        Return the positions of the given columns.
+        """
+        return [self.columns.index(column) for column in columns]
+
+    def covariance_frame(self, columns=None):
+        """
+        Return the covariance matrix for the given
+        columns (or all columns) as a data frame.
+        """
+        columns = self.columns if columns is None else list(columns)
+        indices = self.indices(columns)
+        return pd.DataFrame(self.covariance[np.ix_(indices, indices)],
+                            index=columns,
+                            columns=columns)
+
+    def correlation_frame(self, columns=None):
+        """
+        Return the correlation matrix for the given
+        columns (or all columns) as a data frame.
+        """
+        columns = self.columns if columns is None else list(columns)
+        indices = self.indices(columns)
+        return pd.DataFrame(self.correlation[np.ix_(indices, indices)],
+                            index=columns,
+                            columns=columns)
+
+    def percentiles(self, percentiles, columns):
+        """
+        Return the given percentiles of the given columns
+        using the same 'lower' interpolation as `np.percentile()`,
+        i.e., by indexing the sorted columns directly. The
+        returned array has one row per percentile.
+        """
+        positions = np.floor(np.asarray(percentiles) / 100.0 * (self.num_observations - 1)).astype(int)
+        return self.sorted_values[np.ix_(positions, self.indices(columns))]
+
+    def pearson_correlations(self, columns, target):
+        """
+        Return the pearson correlation coefficients of the given
+        columns with the `target` column along with their
+        two-tailed p-values, computed the same way as
+        `scipy.stats.pearsonr()`.
+        """
+        correlations = self.correlation[self.columns.index(target), self.indices(columns)]
+        degrees_of_freedom = self.num_observations - 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_squared = correlations ** 2 * (degrees_of_freedom / ((1.0 - correlations) * (1.0 + correlations)))
+            pvalues = betainc(0.5 * degrees_of_freedom, 0.5,
+                              degrees_of_freedom / (degrees_of_freedom + t_squared))
+        return correlations, pvalues
+
+
+def compute_basic_descriptives(df, selected_features, feature_statistics=None):
+    """
+    Compute basic descriptive statistics for the columns
+    in the given data frame. If `feature_statistics` is given,
+    it must be a `FeatureStatistics` instance for the selected
+    features and sc1 and all of the statistics are derived from it.
+    """
 
-    # get the H1 scores
-    scores = df['sc1']
+    # compute the sufficient statistics if we weren't given any
+    if feature_statistics is None:
+        feature_statistics = FeatureStatistics(df, selected_features + ['sc1'])
+    indices = feature_statistics.indices(selected_features)
 
-    # compute correlations and p-values separately for efficiency
-    cor_series = df_desc.apply(lambda s: pearsonr(s, scores))
-    cors = cor_series.apply(lambda t: t[0])
-    pvalues = cor_series.apply(lambda t: t[1])
+    # get the correlations with the H1 scores and their p-values
+    cors, pvalues = feature_statistics.pearson_correlations(selected_features, 'sc1')
 
     # create a data frame with all the descriptives
-    df_output = pd.DataFrame({'mean': df_desc.mean(),
-                              'min': df_desc.min(),
-                              'max': df_desc.max(),
-                              'std. dev.': df_desc.std(),
-                              'skewness': df_desc.skew(),
-                              'kurtosis': df_desc.apply(lambda s: kurtosis(s, fisher=False)),
+    df_output = pd.DataFrame({'mean': feature_statistics.means[indices],
+                              'min': feature_statistics.mins[indices],
+                              'max': feature_statistics.maxs[indices],
+                              'std. dev.': feature_statistics.sds[indices],
+                              'skewness': feature_statistics.skewness[indices],
+                              'kurtosis': feature_statistics.kurtosis[indices],
                               'Correlation': cors,
                               'p': pvalues,
-                              'N': len(df_desc)})
+                              'N': feature_statistics.num_observations},
+                             index=selected_features)
 
     # reorder the columns to make it look better
     df_output = df_output[['mean', 'std. dev.', 'min', 'max',
@@ -44,21 +147,23 @@ def compute_basic_descriptives(df, selected_features):
     return df_output
 
 
-def compute_percentiles(df, selected_features):
+def compute_percentiles(df, selected_features, feature_statistics=None):
     """
     Compute percentiles and outlier descriptives for the
-    given data frame using the columns with the given names
+    given data frame using the columns with the given names.
+    If `feature_statistics` is given, the percentiles are
+    derived from its sorted columns.
     """
 
-    # select only feature columns
-    df_desc = df[selected_features]
+    # compute the sufficient statistics if we weren't given any
+    if feature_statistics is None:
+        feature_statistics = FeatureStatistics(df, selected_features)
 
     # compute the various percentile levels
     percentiles = [1, 5, 25, 50, 75, 95, 99]
-    percentile_func = lambda series: pd.Series(np.percentile(series,
-                                                             percentiles,
-                                                             interpolation='lower'))
-    df_output = df_desc.apply(percentile_func).transpose()
+    df_output = pd.DataFrame(feature_statistics.percentiles(percentiles,
+                                                            selected_features).transpose(),
+                             index=selected_features)
 
     # change the column names to be more readable
     df_output.columns = ['{}%'.format(p) for p in percentiles]
@@ -73,59 +178,311 @@ def compute_percentiles(df, selected_features):
     extreme_upper = df_output['75%'] + 3 * df_output['IQR']
     extreme_bottom = df_output['25%'] - 3 * df_output['IQR']
 
-    # compute the mild and extreme outliers
-    num_mild_outliers = {}
-    num_extreme_outliers = {}
-    for c in df_desc.columns:
-        is_extreme = (df_desc[c] <= extreme_bottom[c]) | (df_desc[c] >= extreme_upper[c])
+    # count the mild and extreme outliers for all of the columns
+    # at once by comparing the whole array against the bounds
+    values = feature_statistics.values[:, feature_statistics.indices(selected_features)]
+    is_extreme = (values <= extreme_bottom.values) | (values >= extreme_upper.values)
 
-        is_mild = ((df_desc[c] > extreme_bottom[c]) & (df_desc[c] <= mild_bottom[c]))
-        is_mild = is_mild | ((df_desc[c] >= mild_upper[c]) & (df_desc[c] < extreme_upper[c]))
-        num_mild_outliers[c] = len(df_desc[is_mild])
-        num_extreme_outliers[c] = len(df_desc[is_extreme])
+    is_mild = (values > extreme_bottom.values) & (values <= mild_bottom.values)
+    is_mild |= (values >= mild_upper.values) & (values < extreme_upper.values)
 
     # add those to the output data frame
-    df_output['Mild outliers'] = pd.Series(num_mild_outliers)
-    df_output['Extreme outliers'] = pd.Series(num_extreme_outliers)
+    df_output['Mild outliers'] = is_mild.sum(axis=0)
+    df_output['Extreme outliers'] = is_extreme.sum(axis=0)
 
     return df_output
 
 
-def compute_outliers(df, selected_features):
+def compute_outliers(df, selected_features, feature_statistics=None):
     """
     Compute the number and percentage of outliers
     outside mean +/- 4 SD for the given columns with
-    in the given data frame
+    in the given data frame. If `feature_statistics`
+    is given, the means and standard deviations are
+    taken from it.
     """
 
-    # select only feature columns
-    df_desc = df[selected_features]
-
-    # compute the means and standard deviations
-    means = df_desc.mean()
-    stds = df_desc.std()
+    # get the means and standard deviations
+    if feature_statistics is None:
+        feature_statistics = FeatureStatistics(df, selected_features)
+    indices = feature_statistics.indices(selected_features)
+    means = feature_statistics.means[indices]
+    stds = feature_statistics.sds[indices]
 
-    # compute the number of upper and lower outliers
-    lower_outliers = {}
-    upper_outliers = {}
-    for c in df_desc.columns:
-        lower_outliers[c] = len(df_desc[df_desc[c] < means[c] - 4 * stds[c]])
-        upper_outliers[c] = len(df_desc[df_desc[c] > means[c] + 4 * stds[c]])
+    # count the upper and lower outliers for all of the columns
+    # at once by comparing the whole array against the bounds
+    values = feature_statistics.values[:, indices]
+    lower_outliers = (values < means - 4 * stds).sum(axis=0)
+    upper_outliers = (values > means + 4 * stds).sum(axis=0)
 
     # generate the output data frame
-    lower_s = pd.Series(lower_outliers)
-    upper_s = pd.Series(upper_outliers)
+    num_observations = feature_statistics.num_observations
+    lower_s = pd.Series(dict(zip(selected_features, lower_outliers)))
+    upper_s = pd.Series(dict(zip(selected_features, upper_outliers)))
     both_s = lower_s + upper_s
     df_output = pd.DataFrame({'lower': lower_s,
                               'upper': upper_s,
                               'both': both_s,
-                              'lowerperc': round(lower_s / len(df_desc) * 100, 2),
-                              'upperperc': round(upper_s / len(df_desc) * 100, 2),
-                              'bothperc': round(both_s / len(df_desc) * 100, 2)})
+                              'lowerperc': round(lower_s / num_observations * 100, 2),
+                              'upperperc': round(upper_s / num_observations * 100, 2),
+                              'bothperc': round(both_s / num_observations * 100, 2)})
 
     return df_output
 
 
+def _first_order_partial_correlations(target_correlations,
+                                      length_correlations,
+                                      target_length_correlations,
+                                      num_observations):
+    """
+    Compute the partial correlations against the target partialling
+    out only length from the marginal correlations of each column
+    with the target and with length and the marginal correlation of
+    the target with length, using the closed-form formula for the
+    first-order partial correlations. The arguments are arrays with
+    one row per group; `num_observations` has the number of
+    responses in each group.
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        numerator = target_correlations - length_correlations * target_length_correlations
+        denominator = np.sqrt((1 - length_correlations ** 2) * (1 - target_length_correlations ** 2))
+        partial_correlations_no_length = np.clip(numerator / denominator, -1.0, 1.0)
+
+    # we cannot partial out length with fewer than three
+    # responses or if either correlation with length is perfect
+    partial_correlations_no_length[np.asarray(num_observations) < 3] = np.nan
+    partial_correlations_no_length[denominator == 0] = np.nan
+    return partial_correlations_no_length
+
+
+def _correlations_by_group_from_arrays(values,
+                                       target_index,
+                                       group_codes,
+                                       num_groups,
+                                       length_index=None):
+    """
+    Compute the marginal and the partial correlations of all of
+    the columns of the 2-D array `values` against the column at
+    `target_index`, separately for each of the groups given by the
+    integer codes (0 to `num_groups` - 1) in `group_codes`. The
+    marginal correlations for all groups and columns come from the
+    segmented sums of the centered cross-products. The partial
+    correlations, which partial out all of the other columns
+    except the one at `length_index`, require the inverse of one
+    covariance matrix per group. If `length_index` is given, also
+    compute the partial correlations of each column against the
+    target partialling out only length. Returns three arrays
+    with one row per group and one column per column in `values`.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    group_codes = np.asarray(group_codes, dtype=np.int64)
+    num_columns = values.shape[1]
+
+    # make the rows for each of the groups contiguous
+    order, group_sizes, group_starts = _group_segments(group_codes, num_groups)
+    if order is not None:
+        values = values[order]
+        group_codes = group_codes[order]
+
+    # center the values within each group; any NaNs propagate
+    # to the correlations just like they would for `pearsonr()`
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = _segmented_reduce(np.add, values, group_sizes, group_starts) / group_sizes[:, np.newaxis]
+        centered = values - means[group_codes]
+        sums_of_squares = _segmented_reduce(np.add, centered ** 2, group_sizes, group_starts)
+
+        # the marginal correlations against the target
+        target_cross_products = _segmented_reduce(np.add,
+                                                  centered * centered[:, [target_index]],
+                                                  group_sizes,
+                                                  group_starts)
+        marginal_correlations = np.clip(target_cross_products /
+                                        np.sqrt(sums_of_squares * sums_of_squares[:, [target_index]]),
+                                        -1.0, 1.0)
+
+    # the partial correlations against the target, partialling
+    # out all of the other columns except length
+    partial_indices = [idx for idx in range(num_columns) if idx != length_index]
+    target_position = partial_indices.index(target_index)
+    target_partial_correlations = np.full((num_groups, num_columns), np.nan)
+    group_offsets = np.cumsum(group_sizes) - group_sizes
+    for group_code in np.flatnonzero(group_sizes >= len(partial_indices)):
+        group_start = group_offsets[group_code]
+        group_size = group_sizes[group_code]
+        group_centered = centered[group_start:group_start + group_size, partial_indices]
+        group_covariance = group_centered.T.dot(group_centered) / (group_size - 1)
+        pcor, _ = partial_correlations_from_covariance(group_covariance, group_size)
+        target_partial_correlations[group_code, partial_indices] = pcor[target_position]
+
+    # the partial correlations against the target partialling out length
+    partial_correlations_no_length = None
+    if length_index is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            length_cross_products = _segmented_reduce(np.add,
+                                                      centered * centered[:, [length_index]],
+                                                      group_sizes,
+                                                      group_starts)
+            length_correlations = np.clip(length_cross_products /
+                                          np.sqrt(sums_of_squares * sums_of_squares[:, [length_index]]),
+                                          -1.0, 1.0)
+        partial_correlations_no_length = _first_order_partial_correlations(marginal_correlations,
+                                                                           length_correlations,
+                                                                           length_correlations[:, [target_index]],
+                                                                           group_sizes)
+
+    return (marginal_correlations,
+            target_partial_correlations,
+            partial_correlations_no_length)
+
+
+def _correlations_from_covariance(covariance,
+                                  num_observations,
+                                  target_index,
+                                  length_index=None):
+    """
+    Compute the same correlations as `_correlations_by_group_from_arrays()`
+    for a single group directly from the given covariance matrix of
+    all of the columns estimated from `num_observations` responses.
+    """
+
+    covariance = np.asarray(covariance, dtype=np.float64)
+    num_columns = len(covariance)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlations = np.clip(covariance_to_correlation(covariance), -1.0, 1.0)
+    marginal_correlations = correlations[[target_index]]
+
+    partial_indices = [idx for idx in range(num_columns) if idx != length_index]
+    target_partial_correlations = np.full((1, num_columns), np.nan)
+    pcor, _ = partial_correlations_from_covariance(covariance[np.ix_(partial_indices, partial_indices)],
+                                                   num_observations)
+    target_partial_correlations[0, partial_indices] = pcor[partial_indices.index(target_index)]
+
+    partial_correlations_no_length = None
+    if length_index is not None:
+        partial_correlations_no_length = _first_order_partial_correlations(marginal_correlations,
+                                                                           correlations[[length_index]],
+                                                                           correlations[[length_index]][:, [target_index]],
+                                                                           [num_observations])
+
+    return (marginal_correlations,
+            target_partial_correlations,
+            partial_correlations_no_length)
+
+
+def _correlation_frames(columns,
+                        correlations,
+                        group_labels,
+                        target_variable,
+                        include_length=False):
+    """
+    Convert the arrays of marginal and partial correlations
+    computed for the given `columns` and groups to data frames
+    with one row per group, sorted by the group labels.
+    """
+
+    (marginal_correlations,
+     target_partial_correlations,
+     partial_correlations_no_length) = correlations
+
+    # exclude the correlation of the target variable with itself
+    # and the correlations with length if we partialled it out
+    excluded_columns = [target_variable, 'length'] if include_length else [target_variable]
+    target_columns = [column for column in columns if column not in excluded_columns]
+    target_indices = [columns.index(column) for column in target_columns]
+
+    df_target_cors = pd.DataFrame(marginal_correlations[:, target_indices],
+                                  index=group_labels,
+                                  columns=target_columns).sort_index()
+    df_target_partcors = pd.DataFrame(target_partial_correlations[:, target_indices],
+                                      index=group_labels,
+                                      columns=target_columns).sort_index()
+
+    df_target_partcors_no_length = pd.DataFrame()
+    if include_length:
+        no_length_columns = sorted(target_columns)
+        no_length_indices = [columns.index(column) for column in no_length_columns]
+        df_target_partcors_no_length = pd.DataFrame(partial_correlations_no_length[:, no_length_indices],
+                                                    index=group_labels,
+                                                    columns=no_length_columns).sort_index()
+
+    return (df_target_cors,
+            df_target_partcors,
+            df_target_partcors_no_length)
+
+
+def _correlation_frames_by_group(df,
+                                 target_variable,
+                                 group_codes,
+                                 group_labels,
+                                 include_length=False,
+                                 include_all_data=False):
+    """
+    Compute the marginal and partial correlations of all the
+    columns in the given data frame against the `target_variable`
+    for each of the groups given by `group_codes` and return them
+    as data frames with one row per group. Responses with negative
+    group codes do not belong to any of the groups. If
+    `include_all_data` is True, also add a row labelled 'All data'
+    with the correlations computed over all of the responses.
+    """
+
+    columns = list(df.columns)
+    values = df.values.astype(np.float64)
+    target_index = columns.index(target_variable)
+    length_index = columns.index('length') if include_length else None
+
+    has_group = group_codes >= 0
+    correlations = _correlations_by_group_from_arrays(values[has_group],
+                                                      target_index,
+                                                      group_codes[has_group],
+                                                      len(group_labels),
+                                                      length_index=length_index)
+    if include_all_data:
+        all_data_correlations = _correlations_by_group_from_arrays(values,
+                                                                   target_index,
+                                                                   np.zeros(len(values), dtype=np.int64),
+                                                                   1,
+                                                                   length_index=length_index)
+        correlations = [None if group_values is None else np.vstack([group_values, all_data_values])
+                        for group_values, all_data_values in zip(correlations, all_data_correlations)]
+        group_labels = group_labels + ['All data']
+
+    return _correlation_frames(columns,
+                               correlations,
+                               group_labels,
+                               target_variable,
+                               include_length=include_length)
+
+
+def correlations_from_covariance(df_covariance,
+                                 num_observations,
+                                 target_variable,
+                                 include_length=False):
+    """
+    Compute the same marginal and partial correlations as
+    `correlation_helper()` over all data from the given
+    covariance matrix `df_covariance` estimated from
+    `num_observations` responses. This allows callers to
+    compute the covariance matrix once and re-use it for
+    different target variables.
+    """
+
+    columns = list(df_covariance.columns)
+    target_index = columns.index(target_variable)
+    length_index = columns.index('length') if include_length else None
+    correlations = _correlations_from_covariance(df_covariance.values,
+                                                 num_observations,
+                                                 target_index,
+                                                 length_index=length_index)
+    return _correlation_frames(columns,
+                               correlations,
+                               ['All data'],
+                               target_variable,
+                               include_length=include_length)
+
+
 def correlation_helper(df, target_variable, grouping_variable, include_length=False):
     """
     A helper function to compute marginal and partial correlations by
@@ -135,39 +492,15 @@ def correlation_helper(df, target_variable, grouping_variable, include_length=Fa
     in the data frame against sc1 only partialling out length.
     """
 
-    # group by the group columns
-    grouped = df.groupby(grouping_variable)
-
-    df_target_cors = pd.DataFrame()
-    df_target_partcors = pd.DataFrame()
-    df_target_partcors_no_length = pd.DataFrame()
-    for group, df_group in grouped:
-        df_group = df_group.drop(grouping_variable, 1)
-        # if we are asked to include length, that means 'length' is
-        # in the data frame which means that we want to exclude that
-        # before computing the regular marginal and partial correlations
-        if not include_length:
-            df_target_cors[group] = df_group.apply(lambda s: pearsonr(s, df_group[target_variable])[0])
-            df_target_partcors[group] = partial_correlations(df_group)[target_variable]
-        else:
-            df_group_no_length = df_group.drop('length', axis=1)
-            df_target_cors[group] = df_group_no_length.apply(lambda s: pearsonr(s, df_group_no_length[target_variable])[0])
-            df_target_partcors[group] = partial_correlations(df_group_no_length)[target_variable]
-            pcor_dict = {}
-            columns = [c for c in df_group.columns if c not in ['sc1', 'length']]
-            for c in columns:
-                pcor_dict[c] = partial_correlations(df_group[[c, 'sc1', 'length']])['sc1'][c]
-            df_target_partcors_no_length[group] = pd.Series(pcor_dict)
-
-    # remove the row containing the correlation of the target variable
-    # with itself and take the transpose
-    df_target_cors = df_target_cors.drop(target_variable).transpose()
-    df_target_partcors = df_target_partcors.drop(target_variable).transpose()
-    df_target_partcors_no_length = df_target_partcors_no_length.transpose()
+    # encode the groups as integer codes so that all
+    # of the groups can be computed at the same time
+    group_codes, group_levels = pd.factorize(df[grouping_variable], sort=True)
+    return _correlation_frames_by_group(df.drop(grouping_variable, axis=1),
+                                        target_variable,
+                                        group_codes,
+                                        list(group_levels),
+                                        include_length=include_length)
 
-    return (df_target_cors,
-            df_target_partcors,
-            df_target_partcors_no_length)
 
 def compute_correlations_by_group(df, selected_features,
                                   target_variable,
@@ -178,43 +511,40 @@ def compute_correlations_by_group(df, selected_features,
     in the given data frame against the `target_variable` for all data
     and for each level of the `grouping_variable`.
     """
-    df_desc = df.copy()
 
-    columns = selected_features + [target_variable, grouping_variable]
+    columns = selected_features + [target_variable]
     if include_length:
         columns.append('length')
-    df_desc = df_desc[columns]
-
-    # create a duplicate data frame to compute correlations
-    # over the whole data, i.e., across all grouping variables
-    df_desc_all = df_desc.copy()
-    df_desc_all[grouping_variable] = 'All data'
-
-    # combine the two data frames
-    df_desc_combined = pd.concat([df_desc, df_desc_all])
-    df_desc_combined.reset_index(drop=True, inplace=True)
 
     # compute the various (marginal and partial) correlations with score
-    ret = correlation_helper(df_desc_combined,
-                             target_variable,
-                             grouping_variable,
-                             include_length=include_length)
+    # for each group as well as over the whole data, i.e., across groups
+    group_codes, group_levels = pd.factorize(df[grouping_variable], sort=True)
+    ret = _correlation_frames_by_group(df[columns],
+                                       target_variable,
+                                       group_codes,
+                                       list(group_levels),
+                                       include_length=include_length,
+                                       include_all_data=True)
 
     return ret
 
 
-def compute_pca(df, selected_features):
+def compute_pca(df, selected_features, feature_statistics=None):
     """
     Compute the PCA decomposition of the given data
-    frame and restrict to the given columns.
+    frame and restrict to the given columns. If
+    `feature_statistics` is given, its array of
+    values is used instead of the data frame.
     """
-    # remove the spkitemid and sc1 column
 
-    df_pca = df[selected_features]
+    if feature_statistics is None:
+        pca_values = df[selected_features].values
+    else:
+        pca_values = feature_statistics.values[:, feature_statistics.indices(selected_features)]
 
     # fit the PCA
     pca = PCA(n_components=len(selected_features))
-    pca.fit(df_pca)
+    pca.fit(pca_values)
 
     df_components = pd.DataFrame(pca.components_)
     df_components.columns = selected_features
@@ -237,65 +567,359 @@ def compute_pca(df, selected_features):
     return df_components, df_variance
 
 
-def metrics_helper(human_scores, system_scores):
+def _group_segments(group_codes, num_groups):
     """
-    This is a helper function that computes some basic
-    metrics for the system_scores against the human_scores.
+    Return the order in which the rows need to be arranged so
+    that the rows for each of the groups are contiguous, along
+    with the number of rows in each group and the position at
+    which each of the non-empty groups starts in that order.
     """
 
-    # compute the kappas
-    unweighted_kappa = kappa(human_scores, system_scores)
-    quadratic_weighted_kappa = kappa(human_scores,
-                                     round(system_scores),
-                                     weights='quadratic')
+    group_sizes = np.bincount(group_codes, minlength=num_groups)
+
+    # the rows for a single group are already contiguous
+    order = None if num_groups == 1 else np.argsort(group_codes, kind='mergesort')
+
+    group_starts = np.concatenate([[0], np.cumsum(group_sizes)[:-1]])
+    return order, group_sizes, group_starts[group_sizes > 0]
+
+
+def _segmented_reduce(ufunc, values, group_sizes, group_starts, fill_value=np.nan):
+    """
+    Reduce the contiguous rows of `values` belonging to each
+    group using the given `ufunc`. Groups without any rows
+    get `fill_value`.
+    """
+
+    non_empty = group_sizes > 0
+    reduced = np.full((len(group_sizes),) + values.shape[1:], fill_value, dtype=np.float64)
+    if non_empty.any():
+        reduced[non_empty] = ufunc.reduceat(values, group_starts, axis=0)
+    return reduced
 
-    # compute the agreement statistics
-    human_system_agreement = agreement(human_scores, system_scores)
-    human_system_adjacent_agreement = agreement(human_scores,
-                                             system_scores,
-                                             tolerance=1)
 
-    # compute the pearson correlation after removing
-    # any cases where either of the scores are NaNs.
-    df = pd.DataFrame({'human': human_scores,
-                       'system': system_scores}).dropna(how='any')
-    correlations = pearsonr(df['human'], df['system'])[0]
+def _column_moments(values, group_codes, group_sizes, group_starts):
+    """
+    Compute the number of non-missing values, the mean, the
+    standard deviation (ddof=1), the minimum and the maximum
+    of each of the columns in the 2-D array `values` for each
+    group, ignoring NaNs the same way pandas does. The rows
+    must already be sorted by group. Also return the array of
+    values centered on the group means (with zeros in place
+    of the NaNs) so that callers can re-use it for computing
+    cross-products.
+    """
 
-    # compute the min/max/mean/std. dev. for the system and human scores
-    min_system_score = np.min(system_scores)
-    min_human_score = np.min(human_scores)
+    valid = ~np.isnan(values)
+    counts = _segmented_reduce(np.add, valid.astype(np.float64),
+                               group_sizes, group_starts, fill_value=0)
 
-    max_system_score = np.max(system_scores)
-    max_human_score = np.max(human_scores)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sums = _segmented_reduce(np.add, np.where(valid, values, 0),
+                                 group_sizes, group_starts, fill_value=0)
+        means = sums / counts
+        centered = np.where(valid, values - means[group_codes], 0)
+        sums_of_squares = _segmented_reduce(np.add, centered ** 2,
+                                            group_sizes, group_starts, fill_value=0)
+        sds = np.sqrt(sums_of_squares / (counts - 1))
 
-    mean_system_score = np.mean(system_scores)
-    mean_human_score = np.mean(human_scores)
+    # `fmin` and `fmax` skip NaNs unless all of the values are NaNs
+    mins = _segmented_reduce(np.fmin, values, group_sizes, group_starts)
+    maxs = _segmented_reduce(np.fmax, values, group_sizes, group_starts)
 
-    system_score_sd = np.std(system_scores, ddof=1)
-    human_score_sd = np.std(human_scores, ddof=1)
+    return counts, means, sds, mins, maxs, centered
+
+
+def _kappas_from_arrays(human_scores, system_scores,
+                        group_codes, group_sizes, group_starts):
+    """
+    Compute the unweighted and the quadratically weighted kappas
+    for each column of the 2-D array `system_scores` against the
+    `human_scores` for each group in the same way as
+    `skll.metrics.kappa()`, i.e., after rounding all scores to the
+    nearest integer. The rows must already be sorted by group. All
+    of the confusion matrices are computed together using a single
+    score range spanning all of the groups and columns; this does
+    not change the kappa values since empty score levels contribute
+    nothing to the observed or the expected agreement.
+    """
+
+    num_groups = len(group_sizes)
+    num_columns = system_scores.shape[1]
+    unweighted_kappas = np.full((num_groups, num_columns), np.nan)
+    quadratic_weighted_kappas = np.full((num_groups, num_columns), np.nan)
+
+    # skll rounds the scores before computing kappa; any responses
+    # with missing scores cannot contribute to the confusion matrices
+    rounded_human_scores = np.round(human_scores)
+    rounded_system_scores = np.round(system_scores)
+    valid = ~np.isnan(rounded_system_scores) & ~np.isnan(rounded_human_scores)[:, np.newaxis]
+    num_valid = _segmented_reduce(np.add, valid.astype(np.float64),
+                                  group_sizes, group_starts, fill_value=0)
+    if not num_valid.any():
+        return unweighted_kappas, quadratic_weighted_kappas
+
+    filled_human_scores = np.where(valid, rounded_human_scores[:, np.newaxis], np.nan)
+    filled_system_scores = np.where(valid, rounded_system_scores, np.nan)
+    min_rating = int(min(np.nanmin(filled_human_scores), np.nanmin(filled_system_scores)))
+    max_rating = int(max(np.nanmax(filled_human_scores), np.nanmax(filled_system_scores)))
+    num_ratings = max_rating - min_rating + 1
+
+    # build the confusion matrices for all of the groups and columns
+    # with a single `bincount` over the flattened (group, column,
+    # human, system) index
+    human_index = np.where(valid, filled_human_scores - min_rating, 0).astype(np.int64)
+    system_index = np.where(valid, filled_system_scores - min_rating, 0).astype(np.int64)
+    matrix_index = (group_codes.astype(np.int64)[:, np.newaxis] * num_columns +
+                    np.arange(num_columns, dtype=np.int64))
+    flat_index = (matrix_index * num_ratings + human_index) * num_ratings + system_index
+    observed = np.bincount(flat_index.ravel(),
+                           weights=valid.ravel().astype(np.float64),
+                           minlength=num_groups * num_columns * num_ratings * num_ratings)
+    observed = observed.reshape(num_groups, num_columns, num_ratings, num_ratings)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = observed / num_valid[:, :, np.newaxis, np.newaxis]
+        hist_human = observed.sum(axis=3)
+        hist_system = observed.sum(axis=2)
+        expected = hist_human[:, :, :, np.newaxis] * hist_system[:, :, np.newaxis, :]
+
+        ratings = np.arange(num_ratings)
+        differences = ratings[:, np.newaxis] - ratings[np.newaxis, :]
+        for weights, kappas in [((differences != 0).astype(float), unweighted_kappas),
+                                (differences.astype(float) ** 2, quadratic_weighted_kappas)]:
+            observed_disagreement = (weights * observed).sum(axis=(2, 3))
+            expected_disagreement = (weights * expected).sum(axis=(2, 3))
+            kappas[:] = 1 - observed_disagreement / expected_disagreement
+
+    # if all of the rounded scores in a group and column are the same,
+    # there is only a single score level and skll defines kappa to be 1
+    human_mins = _segmented_reduce(np.fmin, filled_human_scores, group_sizes, group_starts)
+    human_maxs = _segmented_reduce(np.fmax, filled_human_scores, group_sizes, group_starts)
+    system_mins = _segmented_reduce(np.fmin, filled_system_scores, group_sizes, group_starts)
+    system_maxs = _segmented_reduce(np.fmax, filled_system_scores, group_sizes, group_starts)
+    single_level = (system_mins == system_maxs) & (human_mins == human_maxs) & (human_mins == system_mins)
+    unweighted_kappas[single_level] = 1.0
+    quadratic_weighted_kappas[single_level] = 1.0
+
+    # groups and columns without any valid responses get NaNs
+    unweighted_kappas[num_valid == 0] = np.nan
+    quadratic_weighted_kappas[num_valid == 0] = np.nan
+
+    return unweighted_kappas, quadratic_weighted_kappas
+
+
+def _compute_metrics_by_group_from_arrays(human_scores,
+                                          system_scores,
+                                          group_codes,
+                                          num_groups):
+    """
+    Compute all of the metrics returned by `metrics_helper()`
+    for each column of the 2-D array `system_scores` against
+    the 1-D array `human_scores`, separately for each of the
+    groups given by the integer codes (0 to `num_groups` - 1)
+    in `group_codes`. All groups are computed together using
+    segmented sums over the rows sorted by group. The moments
+    of the human scores are only computed once and the centered
+    values are shared between the descriptives and the
+    correlations. Returns a dictionary mapping the name of each
+    metric to an array with one row per group and one column
+    per set of system scores.
+    """
+
+    human_scores = np.asarray(human_scores, dtype=np.float64)
+    system_scores = np.asarray(system_scores, dtype=np.float64)
+    group_codes = np.asarray(group_codes, dtype=np.int64)
+    num_columns = system_scores.shape[1]
+
+    # make the rows for each of the groups contiguous
+    order, group_sizes, group_starts = _group_segments(group_codes, num_groups)
+    if order is not None:
+        human_scores = human_scores[order]
+        system_scores = system_scores[order]
+        group_codes = group_codes[order]
+    segments = (group_codes, group_sizes, group_starts)
+
+    # compute the descriptives for the system and the human scores
+    (_,
+     system_means,
+     system_sds,
+     system_mins,
+     system_maxs,
+     system_centered) = _column_moments(system_scores, *segments)
+
+    (_,
+     human_means,
+     human_sds,
+     human_mins,
+     human_maxs,
+     human_centered) = _column_moments(human_scores[:, np.newaxis], *segments)
+
+    # compute the kappas
+    unweighted_kappas, quadratic_weighted_kappas = _kappas_from_arrays(human_scores,
+                                                                       system_scores,
+                                                                       *segments)
+
+    # compute the agreement statistics from a single difference array
+    exact_agreements, adjacent_agreements = agreement_at_tolerances(human_scores,
+                                                                    system_scores,
+                                                                    tolerances=[0, 1],
+                                                                    group_codes=group_codes,
+                                                                    num_groups=num_groups)
+
+    # compute the pearson correlation after removing any cases where
+    # either of the scores are NaNs. If there are no NaNs, we can
+    # simply re-use the centered values from the descriptives.
+    pair_valid = ~np.isnan(system_scores) & ~np.isnan(human_scores)[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if pair_valid.all():
+            pair_counts = np.repeat(group_sizes[:, np.newaxis], num_columns, axis=1)
+            centered_pair_human = human_centered
+            centered_pair_system = system_centered
+        else:
+            pair_counts = _segmented_reduce(np.add, pair_valid.astype(np.float64),
+                                            group_sizes, group_starts, fill_value=0)
+            pair_human = np.where(pair_valid, human_scores[:, np.newaxis], 0)
+            pair_system = np.where(pair_valid, system_scores, 0)
+            pair_human_means = _segmented_reduce(np.add, pair_human, *segments[1:]) / pair_counts
+            pair_system_means = _segmented_reduce(np.add, pair_system, *segments[1:]) / pair_counts
+            centered_pair_human = np.where(pair_valid,
+                                           pair_human - pair_human_means[group_codes],
+                                           0)
+            centered_pair_system = np.where(pair_valid,
+                                            pair_system - pair_system_means[group_codes],
+                                            0)
+        cross_products = _segmented_reduce(np.add,
+                                           centered_pair_human * centered_pair_system,
+                                           *segments[1:])
+        sum_of_squares = (_segmented_reduce(np.add, centered_pair_human ** 2, *segments[1:]) *
+                          _segmented_reduce(np.add, centered_pair_system ** 2, *segments[1:]))
+        correlations = np.clip(cross_products / np.sqrt(sum_of_squares), -1.0, 1.0)
+    correlations[pair_counts < 2] = np.nan
 
     # compute standardized mean difference as recommended
     # by Williamson et al (2012)
-    numerator = mean_system_score - mean_human_score
-    denominator = np.sqrt((system_score_sd**2 + human_score_sd**2)/2)
-    SMD = numerator/denominator
+    with np.errstate(divide='ignore', invalid='ignore'):
+        numerator = system_means - human_means
+        denominator = np.sqrt((system_sds**2 + human_sds**2)/2)
+        SMDs = numerator/denominator
+
+    return {'kappa': unweighted_kappas,
+            'wtkappa': quadratic_weighted_kappas,
+            'exact_agr': exact_agreements,
+            'adj_agr': adjacent_agreements,
+            'SMD': SMDs,
+            'corr': correlations,
+            'sys_min': system_mins,
+            'sys_max': system_maxs,
+            'sys_mean': system_means,
+            'sys_sd': system_sds,
+            'h_min': np.repeat(human_mins, num_columns, axis=1),
+            'h_max': np.repeat(human_maxs, num_columns, axis=1),
+            'h_mean': np.repeat(human_means, num_columns, axis=1),
+            'h_sd': np.repeat(human_sds, num_columns, axis=1),
+            'N': np.repeat(group_sizes[:, np.newaxis].astype(np.float64), num_columns, axis=1)}
+
+
+def _compute_metrics_from_arrays(human_scores, system_scores):
+    """
+    Compute all of the metrics returned by `metrics_helper()`
+    for each column of the 2-D array `system_scores` against
+    the 1-D array `human_scores` using vectorized operations.
+    Returns a dictionary mapping the name of each metric to an
+    array with one value per column.
+    """
+
+    group_codes = np.zeros(len(human_scores), dtype=np.int64)
+    metrics = _compute_metrics_by_group_from_arrays(human_scores,
+                                                    system_scores,
+                                                    group_codes,
+                                                    1)
+    return dict([(metric, values[0]) for metric, values in metrics.items()])
+
+
+def batch_metrics_helper(human_scores, df_system_scores):
+    """
+    Compute the same metrics as `metrics_helper()` for every
+    column in the data frame `df_system_scores` against the
+    `human_scores` in a single vectorized pass. This returns a
+    data frame with the metrics as rows and the columns of
+    `df_system_scores` as columns, i.e., the same frame as
+    calling `metrics_helper()` on each column via `apply()`.
+    """
+
+    metrics = _compute_metrics_from_arrays(human_scores,
+                                           df_system_scores.values)
+    df_metrics = pd.DataFrame(metrics, index=df_system_scores.columns)
+    return df_metrics.transpose()
+
+
+def metrics_helper(human_scores, system_scores):
+    """
+    This is a helper function that computes some basic
+    metrics for the system_scores against the human_scores.
+    """
+
+    system_scores = np.asarray(system_scores, dtype=np.float64)
+    metrics = _compute_metrics_from_arrays(human_scores,
+                                           system_scores[:, np.newaxis])
 
     # return everything as a series
-    return pd.Series({'kappa': unweighted_kappa,
-                      'wtkappa': quadratic_weighted_kappa,
-                      'exact_agr': human_system_agreement,
-                      'adj_agr': human_system_adjacent_agreement,
-                      'SMD': SMD,
-                      'corr': correlations,
-                      'sys_min': min_system_score,
-                      'sys_max': max_system_score,
-                      'sys_mean': mean_system_score,
-                      'sys_sd': system_score_sd,
-                      'h_min': min_human_score,
-                      'h_max': max_human_score,
-                      'h_mean': mean_human_score,
-                      'h_sd': human_score_sd,
-                      'N': len(system_scores)})
+    return pd.Series(dict([(metric, values[0]) for metric, values in metrics.items()]))
+
+
+def _filtered_metric_columns(use_scaled_predictions=False,
+                             chosen_metric_dict=None):
+    """
+    Return a list of (column name, metric, score type) tuples
+    for the metrics retained by `filter_metrics()`.
+    """
+
+    # do we want the raw or the scaled metrics
+    score_prefix = 'scale' if use_scaled_predictions else 'raw'
+
+    # what metrics are we choosing to include?
+    if chosen_metric_dict:
+        chosen_metrics = chosen_metric_dict
+    else:
+        chosen_metrics = {'{}_trim'.format(score_prefix): ['N',
+                                                           'h_mean',
+                                                           'h_sd',
+                                                           'sys_mean',
+                                                           'sys_sd',
+                                                           'corr',
+                                                           'SMD'],
+                          '{}_trim_round'.format(score_prefix): ['sys_mean',
+                                                                 'sys_sd',
+                                                                 'wtkappa',
+                                                                 'kappa',
+                                                                 'exact_agr',
+                                                                 'adj_agr',
+                                                                 'SMD']}
+
+    columns = []
+    for score_type in chosen_metrics:
+        for metric in chosen_metrics[score_type]:
+            colname = metric if metric in ['h_mean', 'h_sd', 'N'] else '{}.{}'.format(metric, score_type)
+            columns.append((colname, metric, score_type))
+    return columns
+
+
+def _format_human_human_metrics(df_human_human_eval):
+    """
+    Sort the columns of the given human-human metrics frame,
+    which has one row per set of responses, in the correct
+    order and rename `h_*` -> `h1_*` and `sys_*` -> `h2_*`.
+    """
+
+    df_human_human_eval = df_human_human_eval[['N', 'h_mean', 'h_sd',
+                                               'h_min', 'h_max',
+                                               'sys_mean', 'sys_sd',
+                                               'sys_min', 'sys_max',
+                                               'corr', 'wtkappa',
+                                               'kappa', 'exact_agr',
+                                               'adj_agr', 'SMD']]
+    return df_human_human_eval.rename(columns=lambda c: c.replace('h_', 'h1_').replace('sys_', 'h2_'))
 
 
 def filter_metrics(df_metrics,
@@ -329,35 +953,12 @@ def filter_metrics(df_metrics,
     is False or True.
     """
 
-    # do we want the raw or the scaled metrics
-    score_prefix = 'scale' if use_scaled_predictions else 'raw'
-
-    # what metrics are we choosing to include?
-    if chosen_metric_dict:
-        chosen_metrics = chosen_metric_dict
-    else:
-        chosen_metrics = {'{}_trim'.format(score_prefix): ['N',
-                                                           'h_mean',
-                                                           'h_sd',
-                                                           'sys_mean',
-                                                           'sys_sd',
-                                                           'corr',
-                                                           'SMD'],
-                          '{}_trim_round'.format(score_prefix): ['sys_mean',
-                                                                 'sys_sd',
-                                                                 'wtkappa',
-                                                                 'kappa',
-                                                                 'exact_agr',
-                                                                 'adj_agr',
-                                                                 'SMD']}
-
     # extract the metrics we need from the given metrics frame
     metricdict = {}
-    for score_type in chosen_metrics:
-        for metric in chosen_metrics[score_type]:
-            colname = metric if metric in ['h_mean', 'h_sd', 'N'] else '{}.{}'.format(metric, score_type)
-            values = df_metrics[metric][score_type]
-            metricdict[colname] = values
+    for colname, metric, score_type in _filtered_metric_columns(use_scaled_predictions,
+                                                                chosen_metric_dict):
+        values = df_metrics[metric][score_type]
+        metricdict[colname] = values
 
     df_filtered_metrics = pd.DataFrame([metricdict])
     return df_filtered_metrics
@@ -388,29 +989,18 @@ def compute_metrics(df,
     # metrics only on the data that is double scored.
     df_human_human_eval = pd.DataFrame()
     if include_second_score:
-        df_single_scored = df.drop('sc2', axis=1)
-        df_human_machine_eval = df_single_scored.apply(lambda s: metrics_helper(df_single_scored['sc1'], s))
+        system_columns = [column for column in df if column not in ['sc1', 'sc2']]
+        df_human_machine_eval = batch_metrics_helper(df['sc1'], df[system_columns])
         df_double_scored = df[df['sc2'].notnull()][['sc1', 'sc2']]
-        df_human_human_eval = df_double_scored.apply(lambda s: metrics_helper(df_double_scored['sc1'], s))
-        # drop the sc1 column from the human-human agreement frame
-        df_human_human_eval = df_human_human_eval.drop('sc1', 1)
-        # sort the rows in the correct order
-        df_human_human_eval = df_human_human_eval.reindex(['N', 'h_mean', 'h_sd',
-                                                           'h_min', 'h_max',
-                                                           'sys_mean', 'sys_sd',
-                                                           'sys_min', 'sys_max',
-                                                           'corr','wtkappa',
-                                                           'kappa', 'exact_agr',
-                                                           'adj_agr', 'SMD'])
-        # rename `h_*` -> `h1_*` and `sys_*` -> `h2_*`
-        df_human_human_eval.rename(lambda c: c.replace('h_', 'h1_').replace('sys_', 'h2_'), inplace=True)
-        df_human_human_eval = df_human_human_eval.transpose()
+        df_human_human_eval = batch_metrics_helper(df_double_scored['sc1'],
+                                                   df_double_scored[['sc2']])
+        df_human_human_eval = _format_human_human_metrics(df_human_human_eval.transpose())
         df_human_human_eval.index = ['']
     else:
-        df_human_machine_eval = df.apply(lambda s: metrics_helper(df['sc1'], s))
+        system_columns = [column for column in df if column != 'sc1']
+        df_human_machine_eval = batch_metrics_helper(df['sc1'], df[system_columns])
 
-    # drop 'sc1' column from the human-machine frame and transpose
-    df_human_machine_eval = df_human_machine_eval.drop('sc1', 1)
+    # transpose the human-machine frame so that the score types are rows
     df_human_machine_eval = df_human_machine_eval.transpose()
 
     # sort the columns and rows in the correct order
@@ -453,41 +1043,60 @@ def compute_metrics_by_group(df_test,
     that is selected.
     """
 
-    # create a duplicate data frame to compute evaluations
-    # over the whole data, i.e., across groups
-    df_preds_all = df_test.copy()
-    df_preds_all[grouping_variable] = 'All data'
-
-    # combine the two data frames
-    df_preds_combined = pd.concat([df_test, df_preds_all])
-    df_preds_combined.reset_index(drop=True, inplace=True)
-
-    # group by the grouping_variable columns
-    grouped = df_preds_combined.groupby(grouping_variable)
-
-    df_human_machine_eval_by_group = pd.DataFrame()
+    # we want to exclude the human score(s) and the
+    # grouping variable from the human-machine metrics
+    excluded_columns = ['sc1', grouping_variable]
+    if include_second_score:
+        excluded_columns.append('sc2')
+    system_columns = [column for column in df_test if column not in excluded_columns]
+    column_index = dict([(column, idx) for idx, column in enumerate(system_columns)])
+
+    # encode the groups as integer codes so that all groups
+    # can be computed in a single pass; responses without a
+    # group are only included in the metrics for all data
+    group_codes, group_levels = pd.factorize(df_test[grouping_variable], sort=True)
+    num_groups = len(group_levels)
+    has_group = group_codes >= 0
+    group_labels = list(group_levels) + ['All data']
+
+    human_scores = df_test['sc1'].values
+    system_scores = df_test[system_columns].values
+
+    # compute the metrics for all of the groups and for all of the
+    # data and then stack them so that the last row is for all data
+    group_metrics = _compute_metrics_by_group_from_arrays(human_scores[has_group],
+                                                          system_scores[has_group],
+                                                          group_codes[has_group],
+                                                          num_groups)
+    all_metrics = _compute_metrics_from_arrays(human_scores, system_scores)
+
+    # extract the shortened metrics for each group; the rows
+    # are sorted the same way as `groupby()` would sort them
+    metricdict = {}
+    for colname, metric, score_type in _filtered_metric_columns(use_scaled_predictions):
+        metric_values = np.append(group_metrics[metric][:, column_index[score_type]],
+                                  all_metrics[metric][column_index[score_type]])
+        metricdict[colname] = metric_values
+    df_human_machine_eval_by_group = pd.DataFrame(metricdict, index=group_labels).sort_index()
+
+    # compute the by group human-human metrics frame if
+    # we have the second score column available, using
+    # only the double-scored responses
     df_human_human_eval_by_group = pd.DataFrame()
-
-    for group, df_group in grouped:
-        df_group = df_group.drop(grouping_variable, 1)
-        (df_group_human_machine_metrics,
-         df_group_human_machine_metrics_short,
-         df_group_human_human_metrics)  = compute_metrics(df_group,
-                                                          compute_shortened=True,
-                                                          use_scaled_predictions=use_scaled_predictions,
-                                                          include_second_score=include_second_score)
-
-        # we need to convert the shortened data frame to a series here
-        df_human_machine_eval_by_group[group] = df_group_human_machine_metrics_short.iloc[0]
-
-        # update the by group human-human metrics frame if
-        # we have the second score column available
-        if include_second_score:
-            df_group_human_human_metrics.index = [group]
-            df_human_human_eval_by_group = df_human_human_eval_by_group.append(df_group_human_human_metrics)
-
-    # transpose the by group human-machine metrics frame
-    df_human_machine_eval_by_group = df_human_machine_eval_by_group.transpose()
+    if include_second_score:
+        double_scored = df_test['sc2'].notnull().values
+        double_scored_with_group = double_scored & has_group
+        second_scores = df_test['sc2'].values[:, np.newaxis]
+        group_metrics = _compute_metrics_by_group_from_arrays(human_scores[double_scored_with_group],
+                                                              second_scores[double_scored_with_group],
+                                                              group_codes[double_scored_with_group],
+                                                              num_groups)
+        all_metrics = _compute_metrics_from_arrays(human_scores[double_scored],
+                                                   second_scores[double_scored])
+        metricdict = dict([(metric, np.append(group_metrics[metric][:, 0], all_metrics[metric][0]))
+                           for metric in group_metrics])
+        df_human_human_eval_by_group = pd.DataFrame(metricdict, index=group_labels)
+        df_human_human_eval_by_group = _format_human_human_metrics(df_human_human_eval_by_group).sort_index()
 
     return (df_human_machine_eval_by_group, df_human_human_eval_by_group)
 
@@ -547,11 +1156,6 @@ def run_training_analyses(df_train_all,
 
     assert len(df_train_preprocessed.index) == len(df_train_preprocessed_features.index) == len(df_train_metadata.index)
 
-    # get descriptives, percentiles and outliers for the original feature values
-    df_descriptives = compute_basic_descriptives(df_train, selected_features)
-    df_percentiles = compute_percentiles(df_train, selected_features)
-    df_outliers = compute_outliers(df_train, selected_features)
-
     # set a general boolean flag indicating if we should include length
     include_length = not df_train_length.empty
 
@@ -565,33 +1169,47 @@ def run_training_analyses(df_train_all,
         df_train_with_length = df_train
         df_train_preprocessed_with_length = df_train_preprocessed
 
+    # compute the sufficient statistics for the original and the
+    # pre-processed feature values once and derive all of the
+    # analyses for all data from them
+    original_statistics = FeatureStatistics(df_train_with_length, columns)
+    preprocessed_statistics = FeatureStatistics(df_train_preprocessed_with_length, columns)
+
+    # get descriptives, percentiles and outliers for the original feature values
+    df_descriptives = compute_basic_descriptives(df_train,
+                                                 selected_features,
+                                                 feature_statistics=original_statistics)
+    df_percentiles = compute_percentiles(df_train,
+                                         selected_features,
+                                         feature_statistics=original_statistics)
+    df_outliers = compute_outliers(df_train,
+                                   selected_features,
+                                   feature_statistics=original_statistics)
+
     # get pairwise correlations against the original training features
     # as well as the pre-processed training features
-    df_all_pairwise_cors_orig = df_train_with_length[columns].corr(method='pearson')
-    df_all_pairwise_cors_preprocessed = df_train_preprocessed_with_length[columns].corr(method='pearson')
+    df_all_pairwise_cors_orig = original_statistics.correlation_frame()
+    df_all_pairwise_cors_preprocessed = preprocessed_statistics.correlation_frame()
 
     # get marginal and partial correlations against sc1 for all data
-    # for partial correlations, we partial out all other features
-    df_train_with_group_for_all = df_train_preprocessed_with_length.copy()
-    df_train_with_group_for_all = df_train_with_group_for_all[columns]
-    df_train_with_group_for_all['all_data'] = 'All data'
-    df_margcor_sc1, df_pcor_sc1, df_pcor_sc1_no_length = correlation_helper(df_train_with_group_for_all,
-                                                                            'sc1',
-                                                                            'all_data',
-                                                                            include_length=include_length)
+    # for partial correlations, we partial out all other features.
+    # The covariance matrix is re-used for the correlations against length.
+    df_covariance = preprocessed_statistics.covariance_frame()
+    num_observations = preprocessed_statistics.num_observations
+    df_margcor_sc1, df_pcor_sc1, df_pcor_sc1_no_length = correlations_from_covariance(df_covariance,
+                                                                                      num_observations,
+                                                                                      'sc1',
+                                                                                      include_length=include_length)
 
     # get marginal and partial correlations against length for all data
     # if the length column is available
     df_margcor_length = pd.DataFrame()
     df_pcor_length = pd.DataFrame()
     if include_length:
-        df_train_with_group_for_all = df_train_preprocessed_with_length.copy()
         columns = selected_features + ['length']
-        df_train_with_group_for_all = df_train_with_group_for_all[columns]
-        df_train_with_group_for_all['all_data'] = 'All data'
-        df_margcor_length, df_pcor_length, _ = correlation_helper(df_train_with_group_for_all,
-                                                                  'length',
-                                                                  'all_data')
+        df_margcor_length, df_pcor_length, _ = correlations_from_covariance(df_covariance.loc[columns, columns],
+                                                                            num_observations,
+                                                                            'length')
 
     # get marginal and partial correlations against sc1 by group (preprocessed features)
     # also include partial correlations with length if length is available
@@ -607,7 +1225,9 @@ def run_training_analyses(df_train_all,
             length_correlation_by_group_dict[grouping_variable] = compute_correlations_by_group(df_train_preprocessed_with_length, selected_features, 'length', grouping_variable)
 
     # get PCA information
-    df_pca_components, df_pca_variance = compute_pca(df_train_preprocessed, selected_features)
+    df_pca_components, df_pca_variance = compute_pca(df_train_preprocessed,
+                                                     selected_features,
+                                                     feature_statistics=preprocessed_statistics)
 
     return (df_descriptives,
             df_percentiles,
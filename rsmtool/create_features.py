@@ -7,13 +7,23 @@ Functions dealing with generating feature names and transformations if there is
 """
 
 import logging
+import os
 
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
-from scipy.stats.stats import pearsonr
+import numpy as np
 
 from rsmtool.preprocess import transform_feature
 
+# the transformations considered when generating the feature
+# specifications from the data, in the order of preference
+# when several of them have the same correlation with the score
+candidate_transformations = ['org', 'sqrt', 'addOneInv', 'addOneLn', 'inv']
+
+# the smallest number of features for which the
+# transformations are selected in parallel
+min_features_per_job = 100
+
 
 def select_by_subset(feature_columns, feature_subset_specs, subset):
 
@@ -135,35 +145,147 @@ def find_feature_transformation(feature_name, feature_value, scores):
     highest absolute Pearson correlation with human score.
     """
 
+    feature_values = np.asarray(feature_value, dtype=np.float64).reshape(-1, 1)
+    return find_feature_transformations([feature_name], feature_values, scores)[0]
+
+
+def find_feature_transformations(feature_names, feature_values, scores,
+                                 transform_cache=None):
+
+    """
+    Identify the best transformation for each of the features
+    based on the highest absolute Pearson correlation with human
+    score. `feature_values` is the N x p array with one column per
+    feature. Each transformation is applied to all of the features
+    it can be applied to at once and the correlations of all of the
+    transformed features with the scores are computed with a
+    single matrix product. If `transform_cache` is given, the
+    values transformed with the best transformations are saved
+    in it so that they can be reused for pre-processing.
+    """
+
+    feature_values = np.asarray(feature_values, dtype=np.float64)
+    feature_names = np.asarray(feature_names)
+
+    # center the scores once so that the correlations are
+    # just the normalized dot products with the centered values
+    scores = np.asarray(scores, dtype=np.float64)
+    centered_scores = scores - scores.mean()
+    scores_norm = np.sqrt(np.dot(centered_scores, centered_scores))
+
     # Do not use sqrt and ln for potential negative features.
     # Do not use inv for positive features.
-    if any(feature_value < 0):
-        applicable_transformations = ['org', 'inv']
-    else:
-        applicable_transformations = ['org', 'sqrt', 'addOneInv', 'addOneLn']
+    has_negatives = np.any(feature_values < 0, axis=0)
+
+    # If a transformation cannot be applied to a feature
+    # its correlation is 0 and the transformations that
+    # are not considered for a feature are never chosen
+    correlations = np.full((len(candidate_transformations),
+                            feature_values.shape[1]), -np.inf)
+    transformed = {}
+    for idx, trans in enumerate(candidate_transformations):
+        if trans == 'org':
+            applicable = np.ones(len(feature_names), dtype=bool)
+        elif trans == 'inv':
+            applicable = has_negatives
+        else:
+            applicable = ~has_negatives
+        correlations[idx, applicable] = 0
+        valid = applicable & _can_apply_transformation(feature_values, trans)
+        if not np.any(valid):
+            continue
+
+        transformed_values = transform_feature(feature_names[valid].tolist(),
+                                                feature_values[:, valid],
+                                                trans)
+        if transform_cache is not None and trans != 'org':
+            transformed[trans] = (np.cumsum(valid) - 1, transformed_values)
+        centered_values = transformed_values - transformed_values.mean(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlations[idx, valid] = np.abs(np.dot(centered_scores, centered_values) /
+                                              (np.sqrt(np.sum(centered_values**2, axis=0)) *
+                                               scores_norm))
+
+    best = np.argmax(correlations, axis=0)
+    best_transformations = [candidate_transformations[idx] for idx in best]
+    if transform_cache is not None:
+        _cache_transformed_values(transform_cache,
+                                  feature_names.tolist(),
+                                  feature_values,
+                                  best_transformations,
+                                  transformed)
+    return best_transformations
+
+
+def _cache_transformed_values(transform_cache,
+                              feature_names,
+                              feature_values,
+                              transformations,
+                              transformed):
+
+    """
+    Save the values transformed with the given transformations
+    in the cache, keyed by the parameters that the pre-processor
+    will use to clamp the outliers. Since the transformations
+    were applied to values that were not clamped, we only save
+    the features for which clamping does not change anything.
+    """
+
+    # compute the means and the standard deviations
+    # exactly the same way as the pre-processor
+    values = np.asfortranarray(feature_values)
+    means = values.mean(axis=0)
+    sds = values.std(axis=0, ddof=1)
+    unclamped = ((values.min(axis=0) >= means - 4 * sds) &
+                 (values.max(axis=0) <= means + 4 * sds) &
+                 (means != 0) & (sds != 0))
+
+    for idx, trans in enumerate(transformations):
+        if trans not in transformed or not unclamped[idx]:
+            continue
+        columns, transformed_values = transformed[trans]
+        transform_cache.put(feature_names[idx],
+                            trans,
+                            means[idx],
+                            sds[idx],
+                            transformed_values[:, columns[idx]])
 
-    correlations = []
-    for trans in applicable_transformations:
-        try:
-            transformed_value = transform_feature(feature_name, feature_value, trans)
-            correlations.append(abs(pearsonr(transformed_value, scores)[0]))
-        except ValueError:
-            # If the transformation returns an error, append 0.
-            correlations.append(0)
-    best = np.argmax(correlations)
-    return applicable_transformations[best]
+
+def _can_apply_transformation(feature_values, transform):
+
+    """
+    Return the boolean array indicating for which columns
+    of `feature_values` the given transformation would not
+    raise an error.
+    """
+
+    if transform == 'inv':
+        all_positive = np.all(feature_values >= 0, axis=0)
+        all_negative = np.all(feature_values <= 0, axis=0)
+        return (~np.any(feature_values == 0, axis=0) &
+                (all_positive | all_negative))
+    elif transform in ['sqrt', 'addOneInv', 'addOneLn']:
+        return ~np.any(feature_values < 0, axis=0)
+    else:
+        return np.ones(feature_values.shape[1], dtype=bool)
 
 
 def generate_specs_from_data(feature_names,
                              train_label,
                              df_train,
                              feature_subset_specs=None,
-                             feature_sign=None):
+                             feature_sign=None,
+                             n_jobs=1,
+                             transform_cache=None):
 
     """
     Generate feature specifications using the features.csv
     for sign and the correlation with score to identify
-    the best transformation.
+    the best transformation. If there are many features,
+    the transformations can be selected for chunks of the
+    features using `n_jobs` processes. Otherwise, the
+    transformed values are saved in `transform_cache`,
+    if given.
     """
 
     # get feature sign info if available
@@ -174,11 +296,32 @@ def generate_specs_from_data(feature_names,
     else:
         sign_dict = {}
 
+    # select the transformations for all of the features
+    feature_values = df_train[feature_names].values.astype(np.float64)
+    scores = df_train[train_label].values
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, len(feature_names) // min_features_per_job)
+    if n_jobs > 1:
+        chunks = np.array_split(np.arange(len(feature_names)), n_jobs)
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(find_feature_transformations,
+                                       [feature_names[idx] for idx in chunk],
+                                       feature_values[:, chunk],
+                                       scores)
+                       for chunk in chunks]
+            transformations = [trans for future in futures for trans in future.result()]
+    else:
+        transformations = find_feature_transformations(feature_names,
+                                                       feature_values,
+                                                       scores,
+                                                       transform_cache=transform_cache)
+
     feature_specs = {'features': []}
     feature_dict = {}
-    for feature in feature_names:
+    for feature, transformation in zip(feature_names, transformations):
         feature_dict['feature'] = feature
-        feature_dict['transform'] = find_feature_transformation(feature, df_train[feature], df_train[train_label])
+        feature_dict['transform'] = transformation
         feature_dict['sign'] = find_feature_sign(feature, sign_dict)
 
         # Change the sign for inverse and addOneInv transformations
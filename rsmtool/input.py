@@ -6,15 +6,17 @@ Functions dealing with finding and reading input files.
 :organization: ETS
 """
 
+import hashlib
 import json
 import logging
+import os
 import re
 import warnings
 
 import pandas as pd
 
 from collections import defaultdict
-from os.path import abspath, basename, dirname, exists, join
+from os.path import abspath, basename, dirname, exists, join, splitext
 
 from numpy import nan
 from numpy.random import RandomState
@@ -24,14 +26,44 @@ from rsmtool.create_features import (generate_feature_names,
                                      generate_default_specs,
                                      generate_specs_from_data)
 from rsmtool.model import check_model_name
-from rsmtool.preprocess import (filter_on_column,
-                                filter_on_flag_columns)
+from rsmtool.preprocess import (TransformCache,
+                                filter_on_column,
+                                filter_on_flag_columns,
+                                filter_on_numeric_columns)
 from rsmtool.report import get_ordered_notebook_files
+from rsmtool.version import __version__
 
 if HAS_RSMEXTRA:
     from rsmextra.settings import (default_feature_subset_file,
                                    default_feature_sign)
 
+# do we have pyarrow installed for reading Parquet and Feather files?
+try:
+    from pyarrow import feather, parquet
+except ImportError:
+    HAS_PYARROW = False
+else:
+    HAS_PYARROW = True
+
+# the extensions for the supported formats of the data files
+# and for the compressed CSV and TSV files
+data_file_formats = {'.csv': 'csv',
+                     '.tsv': 'tsv',
+                     '.parquet': 'parquet',
+                     '.feather': 'feather'}
+compression_extensions = ['.gz', '.bz2']
+
+# the compression formats that `pd.read_csv()` cannot read
+unsupported_compression_extensions = ['.xz', '.zip']
+
+# the strings that pandas recognizes as missing values by default;
+# we take these from pandas itself since they differ across versions
+try:
+    from pandas.io.parsers import _NA_VALUES
+except ImportError:
+    from pandas._libs.parsers import STR_NA_VALUES as _NA_VALUES
+default_na_values = sorted(_NA_VALUES)
+
 def locate_custom_sections(custom_report_section_paths, configpath):
     """
     Get the absolute paths for custom report sections
@@ -105,27 +137,38 @@ def normalize_json_fields(json_obj):
                              "to specify prediction scaling:\n "
                              "'use_scaled_predictions': true/false")
 
-    # convert old model names to new ones, if we have them
+    # convert old model names to new ones, if we have them;
+    # we may have been given a list of models
     if 'model' in new_json_obj:
-        model_name = new_json_obj['model']
-
-        if model_name == 'empWtDropNeg':
-        # if someone is using `empWtDropNeg`, we tell them that it is
-        # no longer available and they should be using NNLR instead.
-            logger.error("""The model name "empWtDropNeg" is no """
-                         """longer available, please use the equivalent """
-                         """model "NNLR" instead.""")
-
-        # otherwise, just raise a deprecation warning if they are using
-        # an old model name
-        elif model_name in model_name_mapping:
-            norm_model_name = model_name_mapping[model_name]
-            warnings.warn("""The model name "{}" is deprecated and will be """
-                          """removed  in a future release, please use the """
-                          """new model name "{}" instead.""".format(model_name,
-                                                                    norm_model_name),
-                          category=DeprecationWarning)
-            new_json_obj['model'] = norm_model_name
+        model_names = new_json_obj['model']
+        is_model_list = isinstance(model_names, list)
+        if not is_model_list:
+            model_names = [model_names]
+
+        norm_model_names = []
+        for model_name in model_names:
+
+            if model_name == 'empWtDropNeg':
+            # if someone is using `empWtDropNeg`, we tell them that it is
+            # no longer available and they should be using NNLR instead.
+                logger.error("""The model name "empWtDropNeg" is no """
+                             """longer available, please use the equivalent """
+                             """model "NNLR" instead.""")
+
+            # otherwise, just raise a deprecation warning if they are using
+            # an old model name
+            elif model_name in model_name_mapping:
+                norm_model_name = model_name_mapping[model_name]
+                warnings.warn("""The model name "{}" is deprecated and will be """
+                              """removed  in a future release, please use the """
+                              """new model name "{}" instead.""".format(model_name,
+                                                                        norm_model_name),
+                              category=DeprecationWarning)
+                model_name = norm_model_name
+
+            norm_model_names.append(model_name)
+
+        new_json_obj['model'] = norm_model_names if is_model_list else norm_model_names[0]
 
     return new_json_obj
 
@@ -193,7 +236,10 @@ def validate_and_populate_json_fields(json_obj, context='rsmtool'):
                 'trim_max': None,
                 'subgroups': [],
                 'section_order': None,
-                'flag_column': None}
+                'flag_column': None,
+                'n_jobs': 1,
+                'report_cache_dir': None,
+                'save_other_columns': True}
 
     for field in defaults:
         if field not in new_json_obj:
@@ -244,6 +290,16 @@ def validate_and_populate_json_fields(json_obj, context='rsmtool'):
             raise ValueError("Special sections are only available to ETS"
                              " users by installing the rsmextra package.")
 
+    # 6. Check that the number of jobs is either a positive
+    # integer or -1 (which means using all of the processors)
+    n_jobs = new_json_obj['n_jobs']
+    if (isinstance(n_jobs, bool) or
+            not isinstance(n_jobs, int) or
+            (n_jobs < 1 and n_jobs != -1)):
+        raise ValueError("'n_jobs' must be a positive integer or -1 "
+                         "to use all of the available processors. "
+                         "You specified {}.".format(n_jobs))
+
     return new_json_obj
 
 
@@ -398,6 +454,153 @@ def locate_file(filepath, configpath):
     return retval
 
 
+def get_experiment_fingerprint(main_config_file):
+
+    """
+    Compute the fingerprint of the inputs of the experiment
+    from the version of RSMTool, the contents of the main
+    configuration file and the locations, sizes and modification
+    times of the data files and the feature files it refers to.
+    The contents of the data files are not hashed since they can
+    be very large.
+    """
+
+    config_obj = read_json_file(main_config_file)
+    configpath = dirname(main_config_file)
+
+    hasher = hashlib.sha256()
+    hasher.update(__version__.encode('utf-8'))
+    with open(main_config_file, 'rb') as configf:
+        hasher.update(configf.read())
+
+    # also include the old names of the fields
+    for field in ['train_file', 'train', 'test_file', 'test',
+                  'features', 'feature', 'feature_subset_file']:
+        filepath = config_obj.get(field)
+        if not isinstance(filepath, str):
+            continue
+        file_location = locate_file(filepath, configpath)
+        if file_location:
+            file_stat = os.stat(file_location)
+            hasher.update(json.dumps([field,
+                                      file_location,
+                                      file_stat.st_size,
+                                      file_stat.st_mtime_ns]).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def get_file_format(filename):
+    """
+    Return the format of the given data file based on its extension,
+    ignoring the extension for the compression of CSV and TSV files.
+    Files with any other extension are assumed to be CSV files.
+    Raises a ValueError for unsupported compression formats.
+    """
+    (name, extension) = splitext(filename.lower())
+    if extension in unsupported_compression_extensions:
+        raise ValueError("The data file {} is compressed with an unsupported "
+                         "format. Only gzip (.gz) and bzip2 (.bz2) compressed "
+                         "CSV and TSV files are supported.".format(filename))
+    if extension in compression_extensions:
+        extension = splitext(name)[1]
+    return data_file_formats.get(extension, 'csv')
+
+
+def get_data_columns(filename):
+    """
+    Return the list of the column names in the given
+    data file without reading any of the data.
+    """
+    file_format = get_file_format(filename)
+    if file_format in ['parquet', 'feather']:
+        check_pyarrow(file_format)
+        if file_format == 'parquet':
+            column_names = parquet.read_schema(filename).names
+        else:
+            column_names = feather.read_table(filename, memory_map=True).column_names
+
+        # skip the index columns saved by pandas
+        return [column for column in column_names
+                if not column.startswith('__index_level_')]
+    else:
+        sep = '\t' if file_format == 'tsv' else ','
+        return pd.read_csv(filename, sep=sep, nrows=0).columns.tolist()
+
+
+def read_data_file(filename,
+                   string_columns=[],
+                   usecols=None,
+                   chunksize=None):
+    """
+    Read the given data file into a data frame. The format is chosen
+    based on the file extension: CSV and TSV files, which may also be
+    compressed, are read with `pd.read_csv()` and Parquet and Feather
+    files are read with `pyarrow`. The columns in `string_columns`
+    are read in as strings. If `usecols` is specified, only those
+    columns are read. If `chunksize` is specified, an iterator over
+    data frames with that many rows is returned instead.
+    """
+
+    file_format = get_file_format(filename)
+    if file_format in ['parquet', 'feather']:
+        check_pyarrow(file_format)
+
+        # we always give the list of columns so that
+        # the index columns saved by pandas are skipped
+        columns = usecols if usecols is not None else get_data_columns(filename)
+        if file_format == 'parquet':
+            table = parquet.read_table(filename, columns=columns, memory_map=True)
+        else:
+            table = feather.read_table(filename, columns=columns, memory_map=True)
+
+        if chunksize:
+            return (convert_to_strings(batch.to_pandas(), string_columns)
+                    for batch in table.to_batches(max_chunksize=chunksize))
+        else:
+            return convert_to_strings(table.to_pandas(), string_columns)
+    else:
+        # we read the string columns with the `str` dtype rather than
+        # with converters so that pandas can use its fast C parser and
+        # we only look for missing values in the other columns so that
+        # the strings are read in exactly as they appear in the file
+        sep = '\t' if file_format == 'tsv' else ','
+        columns = usecols if usecols is not None else get_data_columns(filename)
+        dtype_dict = dict([(column, str) for column in string_columns
+                           if column in columns])
+        na_values_dict = dict([(column, default_na_values) for column in columns
+                               if column not in dtype_dict])
+        return pd.read_csv(filename,
+                           sep=sep,
+                           dtype=dtype_dict,
+                           keep_default_na=False,
+                           na_values=na_values_dict,
+                           usecols=usecols,
+                           chunksize=chunksize)
+
+
+def check_pyarrow(file_format):
+    """
+    Raise an error if pyarrow is not available
+    for reading files in the given format.
+    """
+    if not HAS_PYARROW:
+        raise ImportError("The pyarrow package is required "
+                          "to read {} files.".format(file_format))
+
+
+def convert_to_strings(df, string_columns):
+    """
+    Convert the values in the given columns of the data frame to
+    strings, the same way as the converters used for the CSV files.
+    Missing values are converted to empty strings.
+    """
+    for column in string_columns:
+        if column in df:
+            values = df[column]
+            df[column] = values.astype(str).where(values.notnull(), '')
+    return df
+
+
 def check_subgroups(df, subgroups):
 
     """
@@ -442,6 +645,20 @@ def get_trim_min_max(config_obj):
     return(spec_trim_min, spec_trim_max)
 
 
+def get_report_cache_dir(config_obj, configpath):
+
+    """
+    Get the directory for caching the executed report sections,
+    if any. Relative paths are relative to the directory that
+    contains the config file.
+    """
+
+    report_cache_dir = config_obj['report_cache_dir']
+    if report_cache_dir:
+        report_cache_dir = abspath(join(configpath, report_cache_dir))
+    return report_cache_dir
+
+
 def check_flag_column(config_obj):
 
     """
@@ -566,13 +783,27 @@ def load_experiment_data(main_config_file, outdir):
                          "same value.")
 
     # get the name of the model that we want to train and
-    # check that it's valid
+    # check that it's valid; if we were given a list of models
+    # then we want to train and evaluate all of them
     model_name = config_obj['model']
-    model_type = check_model_name(model_name)
+    if isinstance(model_name, list):
+        if not model_name or len(set(model_name)) != len(model_name):
+            raise ValueError("The list of models must contain at least "
+                             "one model and no model can be specified "
+                             "more than once.")
+        model_type = [check_model_name(name) for name in model_name]
+    else:
+        model_type = check_model_name(model_name)
+
+    # how many jobs should we use for training the model?
+    n_jobs = config_obj['n_jobs']
 
     # are we excluding zero scores?
     exclude_zero_scores = config_obj['exclude_zero_scores']
 
+    # should we read in and save the columns not used in the analysis?
+    save_other_columns = config_obj['save_other_columns']
+
     # if we are excluding zero scores but trim_min
     # is set to 0, then we need to warn the user
     if exclude_zero_scores and spec_trim_min == 0:
@@ -610,13 +841,21 @@ def load_experiment_data(main_config_file, outdir):
 
     section_order = config_obj['section_order']
 
-    chosen_notebook_files = get_ordered_notebook_files(general_report_sections,
-                                                       special_report_sections,
-                                                       custom_report_sections,
-                                                       section_order,
-                                                       subgroups,
-                                                       model_type=model_type,
-                                                       context='rsmtool')
+    # are we caching the executed report sections?
+    report_cache_dir = get_report_cache_dir(config_obj, configpath)
+
+    # the model section depends on the type of the model
+    # so we need a separate list of notebooks for each model
+    model_types = model_type if isinstance(model_name, list) else [model_type]
+    notebook_file_lists = [get_ordered_notebook_files(general_report_sections,
+                                                      special_report_sections,
+                                                      custom_report_sections,
+                                                      section_order,
+                                                      subgroups,
+                                                      model_type=mtype,
+                                                      context='rsmtool')
+                           for mtype in model_types]
+    chosen_notebook_files = notebook_file_lists if isinstance(model_name, list) else notebook_file_lists[0]
 
     # Read in the feature configurations.
     # Location of feature file
@@ -738,19 +977,26 @@ def load_experiment_data(main_config_file, outdir):
                                            feature_subset_specs=feature_subset_specs,
                                            feature_subset=feature_subset,
                                            feature_prefix=feature_prefix,
-                                           use_fake_labels=use_fake_train_labels)
+                                           use_fake_labels=use_fake_train_labels,
+                                           save_other_columns=save_other_columns)
 
     # Generate feature specifications now that we
-    # know what features are selected
+    # know what features are selected. If the transformations
+    # are selected automatically, the transformed training
+    # feature values are kept for pre-processing.
+    transform_cache = None
     if select_features_automatically:
         if select_transformations is False:
             feature_specs = generate_default_specs(feature_names)
         else:
+            transform_cache = TransformCache()
             feature_specs = generate_specs_from_data(feature_names,
                                                      'sc1',
                                                      df_train_features,
                                                      feature_subset_specs=feature_subset_specs,
-                                                     feature_sign=feature_sign)
+                                                     feature_sign=feature_sign,
+                                                     n_jobs=n_jobs,
+                                                     transform_cache=transform_cache)
     # Sanity check to make sure the function returned the
     # same feature names as specified in feature json file,
     # if there was one
@@ -801,7 +1047,8 @@ def load_experiment_data(main_config_file, outdir):
                                          subgroups,
                                          exclude_zero_scores=exclude_zero_scores,
                                          exclude_zero_sd=False,
-                                         use_fake_labels=use_fake_test_labels)
+                                         use_fake_labels=use_fake_test_labels,
+                                         save_other_columns=save_other_columns)
 
     return (df_train_features, df_test_features,
             df_train_metadata, df_test_metadata,
@@ -821,7 +1068,10 @@ def load_experiment_data(main_config_file, outdir):
             used_trim_min, used_trim_max,
             use_scaled_predictions, exclude_zero_scores,
             select_features_automatically,
-            chosen_notebook_files)
+            chosen_notebook_files,
+            n_jobs,
+            report_cache_dir,
+            transform_cache)
 
 
 def load_and_filter_data(csv_file,
@@ -841,9 +1091,11 @@ def load_and_filter_data(csv_file,
                          feature_subset_specs=None,
                          feature_subset=None,
                          feature_prefix=None,
-                         use_fake_labels=False):
+                         use_fake_labels=False,
+                         save_other_columns=True):
     """
-    Load the data from `csv_file` and filters it to remove
+    Load the data from `csv_file`, which can be in any of the
+    formats supported by `read_data_file()`, and filters it to remove
     rows that have zero/non-numeric values for `label_column`.
     If feature_names are specified, it checks whether any
     features that are specifically requested in `feature_names`
@@ -854,20 +1106,38 @@ def load_and_filter_data(csv_file,
     `use_fake_parameters` is set to True. Finally, it renames the id
     and label column and splits the data into the data frame with
     feature values and score label and the data frame with other
-    available metadata.
+    available metadata. If `save_other_columns` is False, only the
+    columns used in the analysis are read in and the data frame
+    with the other columns is empty.
     """
 
     logger = logging.getLogger(__name__)
 
-    # read the csv file into a data frame but we want to make
+    # read the data file into a data frame but we want to make
     # sure to read in the `id_column`, `candidate_column` and
     # subgroups (if any) as a string to ensure
     # that we do not lose information, e.g., initial zeros
     string_columns = [id_column, candidate_column] + subgroups
-    converter_dict = dict([(column, str) for column in string_columns if column])
 
-    # read in the CSV file
-    df = pd.read_csv(csv_file, converters=converter_dict)
+    # if we do not need the other columns, only read in
+    # the columns specified in the config file and the features
+    usecols = None
+    if not save_other_columns:
+        config_columns = ([id_column, label_column, length_column,
+                           second_human_score_column, candidate_column] +
+                          subgroups + list(flag_column_dict.keys()))
+        usecols = get_used_columns(csv_file,
+                                   [column for column in config_columns if column],
+                                   requested_feature_names,
+                                   reserved_column_names,
+                                   feature_subset_specs=feature_subset_specs,
+                                   feature_subset=feature_subset,
+                                   feature_prefix=feature_prefix)
+
+    # read in the data file
+    df = read_data_file(csv_file,
+                        string_columns=[column for column in string_columns if column],
+                        usecols=usecols)
 
     # make sure that the columns specified in the config file actually exist
     columns_to_check = [id_column, label_column]
@@ -972,17 +1242,19 @@ def load_and_filter_data(csv_file,
     if not missing_features:
         # make sure all features selected for model building are numeric
         # and also replace any non-numeric feature values in already
-        # excluded data with NaNs for consistency
+        # excluded data with NaNs for consistency. All of the features
+        # are checked in a single pass and the rows excluded because
+        # of the features are added after the ones excluded because
+        # of the labels.
         for feat in feature_names:
             df_excluded[feat] = pd.to_numeric(df_excluded[feat], errors='coerce').astype(float)
-            newdf, newdf_excluded = filter_on_column(df_filtered,
-                                                     feat,
-                                                     'spkitemid',
-                                                     exclude_zeros=False,
-                                                     exclude_zero_sd=exclude_zero_sd)
-            del df_filtered
-            df_filtered = newdf
-            df_excluded = pd.merge(df_excluded, newdf_excluded, how='outer')
+        (df_filtered,
+         df_excluded_features) = filter_on_numeric_columns(df_filtered,
+                                                           feature_names,
+                                                           exclude_zero_sd=exclude_zero_sd)
+        df_excluded = pd.concat([df_excluded,
+                                 df_excluded_features.reindex(columns=df_excluded.columns)],
+                                ignore_index=True)
 
         # make sure that the remaining data frame is not empty
         if len(df_filtered) == 0:
@@ -1062,9 +1334,12 @@ def load_and_filter_data(csv_file,
             df_filtered_human_scores['sc2'] = df_filtered_human_scores['sc2'].replace(0, nan)
 
     # now extract all other columns and add 'spkitemid'
-    other_columns = ['spkitemid'] + [column for column in df_filtered.columns
-                     if column not in not_other_columns]
-    df_filtered_other_columns = df_filtered[other_columns]
+    if save_other_columns:
+        other_columns = ['spkitemid'] + [column for column in df_filtered.columns
+                         if column not in not_other_columns]
+        df_filtered_other_columns = df_filtered[other_columns]
+    else:
+        df_filtered_other_columns = pd.DataFrame()
 
     return (df_filtered_features,
             df_filtered_metadata,
@@ -1078,6 +1353,37 @@ def load_and_filter_data(csv_file,
             feature_names)
 
 
+def get_used_columns(data_file,
+                     config_columns,
+                     requested_feature_names,
+                     reserved_column_names,
+                     feature_subset_specs=None,
+                     feature_subset=None,
+                     feature_prefix=None):
+    """
+    Return the list of the columns in the given data file that are
+    used in the analysis, i.e., the given columns specified in the
+    config file and the features. If no feature names are requested,
+    they are generated from the column names the same way as from the
+    data. Returns None if all of the columns may be used as features.
+    """
+
+    file_columns = get_data_columns(data_file)
+    if requested_feature_names:
+        feature_names = requested_feature_names
+    elif feature_subset is not None or feature_prefix is not None:
+        feature_names = generate_feature_names(pd.DataFrame(columns=file_columns),
+                                               reserved_column_names,
+                                               feature_subset_specs=feature_subset_specs,
+                                               feature_subset=feature_subset,
+                                               feature_prefix=feature_prefix)
+    else:
+        return None
+
+    used_columns = set(config_columns + feature_names)
+    return [column for column in file_columns if column in used_columns]
+
+
 def rename_default_columns(df,
                            requested_feature_names,
                            id_column,
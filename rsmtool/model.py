@@ -17,9 +17,12 @@ import statsmodels.api as sm
 
 from numpy.random import RandomState
 from scipy.optimize import nnls
+from scipy.sparse import csr_matrix
 from sklearn.linear_model import LassoCV
 from skll import FeatureSet, Learner
 
+from rsmtool.scorer import ScoringModel
+
 builtin_models = ['LinearRegression',
                  'EqualWeightsLR',
                  'RebalancedLR',
@@ -42,6 +45,19 @@ skll_models = ['AdaBoostRegressor',
                'SGDRegressor',
                'SVR']
 
+# the SKLL models whose estimators can use multiple jobs; the fitted
+# models do not depend on the number of jobs although the predictions
+# may differ in the last digits since they are summed in parallel
+parallel_skll_models = ['KNeighborsRegressor',
+                        'RandomForestRegressor']
+
+# the SKLL models whose predictions are simply the dot product
+# of the feature values and the coefficients plus the intercept
+linear_skll_model_types = ['ElasticNet',
+                           'Lasso',
+                           'LinearRegression',
+                           'Ridge']
+
 def ols_coefficients_to_dataframe(coefs):
     """
     Take the given series with feature names in the index and
@@ -103,19 +119,127 @@ def skll_learner_params_to_dataframe(learner):
     return df_coef
 
 
-def create_featureset_from_dataframe(df):
+def create_featureset_from_dataframe(df, name='train', vectorizer=None,
+                                     use_feature_matrix=True):
     """
     Take the given dataframe and construct a SKLL FeatureSet instance.
-    It is assumed that the dataframe contains the 'spkitemid' and 'sc1'
-    columns, along with other columns containing the feature values.
+    It is assumed that the dataframe contains the 'spkitemid' column
+    and, optionally, the 'sc1' column, along with other columns
+    containing the feature values. By default, the FeatureSet is
+    built directly from the matrix of feature values with its columns
+    in the order of the given `vectorizer` (or of a new one fitted on
+    the feature names), which avoids converting each row to a
+    dictionary and vectorizing it again. If `use_feature_matrix` is
+    False, the rows are converted to dictionaries instead.
     """
 
     # Separate out the features, ids and labels and create a FeatureSet
     feature_columns = [c for c in df.columns if c not in ['sc1', 'spkitemid']]
-    features = df[feature_columns].to_dict(orient='records')
     ids = df['spkitemid'].tolist()
-    labels = df['sc1'].tolist()
-    return FeatureSet('train', ids=ids, labels=labels, features=features)
+    labels = df['sc1'].tolist() if 'sc1' in df else None
+
+    if not use_feature_matrix:
+        features = df[feature_columns].to_dict(orient='records')
+        return FeatureSet(name, ids=ids, labels=labels, features=features)
+
+    # use the vectorizer of a FeatureSet with a single fake
+    # row if we were not given one so that it is the same as
+    # the one that SKLL would have created
+    if vectorizer is None:
+        fake_features = [dict.fromkeys(feature_columns, 1.0)]
+        fake_fs = FeatureSet('fake', ids=['1'], features=fake_features)
+        vectorizer = fake_fs.vectorizer
+
+    features = csr_matrix(get_feature_matrix(df, vectorizer))
+    return FeatureSet(name, ids=ids, labels=labels, features=features,
+                      vectorizer=vectorizer)
+
+
+def get_feature_matrix(df, vectorizer):
+    """
+    Return the matrix of the feature values in the given data frame
+    with one column for each of the features in the given SKLL
+    feature vectorizer, in the same order. As for SKLL feature
+    dictionaries, any features that are not in the data frame
+    are set to zero and any other columns are ignored.
+    """
+    feature_names = vectorizer.get_feature_names()
+    df_features = df.reindex(columns=feature_names, fill_value=0)
+    return np.ascontiguousarray(df_features.values, dtype=np.float64)
+
+
+def get_linear_model_parameters(learner):
+    """
+    Return the coefficients (one for each of the features in the
+    feature vectorizer of the given SKLL learner) and the intercept
+    if the predictions of the learner are simply the dot product of
+    the feature values and the coefficients plus the intercept. This
+    is the case for the linear models when the features are not
+    scaled. Return None for all other learners.
+    """
+
+    if learner.model_type.__name__ not in linear_skll_model_types:
+        return None
+
+    # the features must not be centered or scaled
+    if learner.scaler.with_mean or learner.scaler.with_std:
+        return None
+
+    # the coefficients of any features that were not
+    # selected during training are set to zero
+    selected_features = learner.feat_selector.get_support()
+    coefficients = np.zeros(len(selected_features))
+    coefficients[selected_features] = learner.model.coef_
+    return coefficients, learner.model.intercept_
+
+
+def create_scoring_model(learner, df_feature_info, df_postproc_params,
+                         experiment_id):
+    """
+    Create the lightweight scoring model with all of the parameters
+    needed to score new responses using the given linear SKLL learner,
+    the feature information data frame (in the same format as the
+    `_feature.csv` file) and the post-processing parameters. Return
+    None if the predictions of the learner cannot be computed from
+    its coefficients or if the outlier clamping depends on the data
+    being scored because some of the training means or standard
+    deviations are zero.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    linear_model_parameters = get_linear_model_parameters(learner)
+    if not linear_model_parameters:
+        return None
+
+    # use the same order of features as the learner
+    coefficients, intercept = linear_model_parameters
+    feature_names = learner.feat_vectorizer.get_feature_names()
+    df_feature_info = df_feature_info.set_index('feature').loc[feature_names]
+
+    train_means = df_feature_info['train_mean'].values
+    train_sds = df_feature_info['train_sd'].values
+    if not (train_means.all() and train_sds.all()):
+        logger.warning("The scoring model will not be saved since the "
+                       "training mean or standard deviation of some of "
+                       "the features is 0.")
+        return None
+
+    model_dict = {'experiment_id': experiment_id,
+                  'features': feature_names,
+                  'transforms': df_feature_info['transform'].tolist(),
+                  'floors': train_means - 4 * train_sds,
+                  'ceilings': train_means + 4 * train_sds,
+                  'transformed_means': df_feature_info['train_transformed_mean'].values,
+                  'transformed_sds': df_feature_info['train_transformed_sd'].values,
+                  'signs': df_feature_info['sign'].values,
+                  'coefficients': coefficients,
+                  'intercept': intercept}
+    for parameter in ScoringModel.postprocessing_parameters:
+        if parameter != 'intercept':
+            model_dict[parameter] = df_postproc_params[parameter].values[0]
+
+    return ScoringModel(model_dict)
 
 
 def create_fake_skll_learner(df_coefficients):
@@ -159,7 +283,8 @@ def create_fake_skll_learner(df_coefficients):
     return learner
 
 
-def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir):
+def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir,
+                        use_feature_matrix=True, n_jobs=1):
 
     # get the columns that actually contain the feature values
     feature_columns = [c for c in df_train.columns if c not in ['spkitemid', 'sc1']]
@@ -259,7 +384,8 @@ def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir):
         p_lambda = sqrt(len(df_train) * log10(len(feature_columns)))
 
         # create a SKLL FeatureSet instance from the given data frame
-        fs_train  = create_featureset_from_dataframe(df_train)
+        fs_train  = create_featureset_from_dataframe(df_train,
+                                                     use_feature_matrix=use_feature_matrix)
 
         # note that 'alpha' in sklearn is different from this lambda
         # so we need to normalize looking at the sklearn objective equation
@@ -293,7 +419,8 @@ def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir):
         # train a LassoCV outside of SKLL since it's not exposed there
         X = df_train[feature_columns].values
         y = df_train['sc1'].values
-        clf = LassoCV(cv=10, positive=True, random_state=1234567890)
+        clf = LassoCV(cv=10, positive=True, random_state=1234567890,
+                      n_jobs=n_jobs)
         model = clf.fit(X, y)
 
         # get the non-zero features from this model
@@ -375,7 +502,8 @@ def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir):
         p_lambda = sqrt(len(df_train) * log10(len(feature_columns)))
 
         # create a SKLL FeatureSet instance from the given data frame
-        fs_train  = create_featureset_from_dataframe(df_train)
+        fs_train  = create_featureset_from_dataframe(df_train,
+                                                     use_feature_matrix=use_feature_matrix)
 
         # note that 'alpha' in sklearn is different from this lambda
         # so we need to normalize looking at the sklearn objective equation
@@ -436,7 +564,8 @@ def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir):
         p_lambda = sqrt(len(df_train) * log10(len(feature_columns)))
 
         # create a SKLL FeatureSet instance from the given data frame
-        fs_train  = create_featureset_from_dataframe(df_train)
+        fs_train  = create_featureset_from_dataframe(df_train,
+                                                     use_feature_matrix=use_feature_matrix)
 
         # note that 'alpha' in sklearn is different from this lambda
         # so we need to normalize looking at the sklearn objective equation
@@ -461,7 +590,8 @@ def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir):
         # train a LassoCV outside of SKLL since it's not exposed there
         X = df_train[feature_columns].values
         y = df_train['sc1'].values
-        clf = LassoCV(cv=10, positive=True, random_state=1234567890)
+        clf = LassoCV(cv=10, positive=True, random_state=1234567890,
+                      n_jobs=n_jobs)
         model = clf.fit(X, y)
 
         # save the non-zero model coefficients and intercept to a data frame
@@ -513,19 +643,21 @@ def train_builtin_model(model_name, df_train, experiment_id, csvdir, figdir):
     return learner
 
 
-def train_skll_model(model_name, df_train, experiment_id, csvdir, figdir):
+def train_skll_model(model_name, df_train, experiment_id, csvdir, figdir,
+                     use_feature_matrix=True, n_jobs=1):
 
-    # instantiate the given SKLL learner
-    learner = Learner(model_name)
-
-    # get the features, IDs, and labels from the given data frame
-    feature_columns = [c for c in df_train.columns if c not in ['spkitemid', 'sc1']]
-    features = df_train[feature_columns].to_dict(orient='records')
-    ids = df_train['spkitemid'].tolist()
-    labels = df_train['sc1'].tolist()
+    # instantiate the given SKLL learner; if the learner itself can use
+    # multiple jobs, we use them for fitting it instead of for the grid
+    # search so that we do not end up with n_jobs * n_jobs processes
+    if model_name in parallel_skll_models:
+        model_kwargs, grid_jobs = {'n_jobs': n_jobs}, 1
+    else:
+        model_kwargs, grid_jobs = {}, n_jobs
+    learner = Learner(model_name, model_kwargs=model_kwargs)
 
-    # create a FeatureSet and train the model
-    fs = FeatureSet('train', ids=ids, labels=labels, features=features)
+    # create a FeatureSet from the given data frame and train the model
+    fs = create_featureset_from_dataframe(df_train,
+                                          use_feature_matrix=use_feature_matrix)
 
     # if it's a regression model, then our grid objective should be
     # pearson and otherwise it should be accuracy
@@ -537,7 +669,7 @@ def train_skll_model(model_name, df_train, experiment_id, csvdir, figdir):
     else:
         objective = 'f1_score_micro'
 
-    learner.train(fs, grid_search=True, grid_objective=objective, grid_jobs=1)
+    learner.train(fs, grid_search=True, grid_objective=objective, grid_jobs=grid_jobs)
 
     # TODO: compute betas for linear SKLL models?
 
@@ -549,10 +681,12 @@ def train_skll_model(model_name, df_train, experiment_id, csvdir, figdir):
     return learner
 
 
-def train_model(model_name, df_train, experiment_id, csvdir, figdir):
+def train_model(model_name, df_train, experiment_id, csvdir, figdir,
+                use_feature_matrix=True, n_jobs=1):
     call_args = [model_name, df_train, experiment_id, csvdir, figdir]
-    model = train_builtin_model(*call_args) if model_name in builtin_models \
-             else train_skll_model(*call_args)
+    call_kwargs = {'use_feature_matrix': use_feature_matrix, 'n_jobs': n_jobs}
+    model = train_builtin_model(*call_args, **call_kwargs) if model_name in builtin_models \
+             else train_skll_model(*call_args, **call_kwargs)
     return model
 
 
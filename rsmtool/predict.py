@@ -10,20 +10,25 @@ import logging
 import numpy as np
 import pandas as pd
 
-from skll import FeatureSet
-
+from rsmtool.model import (create_featureset_from_dataframe,
+                           get_feature_matrix,
+                           get_linear_model_parameters)
 from rsmtool.preprocess import trim
 
-def predict_with_model(model, df):
+def predict_with_model(model, df, use_feature_matrix=True):
     """
     Get the raw predictions of the `model` on the data
-    contained in the data frame `df`.
+    contained in the data frame `df`. By default, the
+    predictions are computed directly from the matrix of
+    feature values: as the dot product with the coefficients
+    for the linear models and using a FeatureSet built from
+    the matrix for all other models. If `use_feature_matrix`
+    is False, each row is converted to a dictionary and
+    vectorized by SKLL instead.
     """
 
     logger = logging.getLogger(__name__)
 
-    feature_columns = [c for c in df.columns if c not in ['spkitemid', 'sc1']]
-    features = df[feature_columns].to_dict(orient='records')
     ids = df['spkitemid'].tolist()
 
     # if we have the labels, save them in the featureset
@@ -31,8 +36,26 @@ def predict_with_model(model, df):
     if 'sc1' in df:
         labels = df['sc1'].tolist()
 
-    fs = FeatureSet('data', ids=ids, labels=labels, features=features)
-    predictions = model.predict(fs)
+    linear_model_parameters = None
+    if use_feature_matrix:
+        linear_model_parameters = get_linear_model_parameters(model)
+
+    if linear_model_parameters:
+        coefficients, intercept = linear_model_parameters
+        features = get_feature_matrix(df, model.feat_vectorizer)
+
+        # add up the products one feature at a time in the same
+        # order as the sparse dot product used by the learner
+        # so that the predictions are exactly the same
+        predictions = np.zeros(len(features))
+        for feature_values, coefficient in zip(features.T, coefficients):
+            predictions += feature_values * coefficient
+        predictions += intercept
+    else:
+        fs = create_featureset_from_dataframe(df, 'data',
+                                              vectorizer=model.feat_vectorizer,
+                                              use_feature_matrix=use_feature_matrix)
+        predictions = model.predict(fs)
 
     df_predictions = pd.DataFrame()
     df_predictions['spkitemid'] = ids
@@ -8,6 +8,8 @@ Functions dealing with preprocessing input data
 
 import logging
 
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 
@@ -27,21 +29,19 @@ def trim(values, trim_min, trim_max):
 def filter_on_flag_columns(df, flag_column_dict):
 
     """
-    Check that all flag_columns are present in the data,
-    convert these columns to strings and
-    filter out the values which do not match the condition in
-    flag_column_dict
+    Check that all flag_columns are present in the data
+    and filter out the values which do not match the condition
+    in flag_column_dict. Each flag column is checked separately
+    and the responses are split using a single boolean mask.
     """
 
-    df_new = df.copy()
-
     flag_columns = list(flag_column_dict.keys())
 
     if not flag_columns:
-        return df_new, pd.DataFrame(columns=df.columns)
+        return df.copy(), pd.DataFrame(columns=df.columns)
     else:
         # check that all columns are present
-        missing_flag_columns = set(flag_columns).difference(df_new.columns)
+        missing_flag_columns = set(flag_columns).difference(df.columns)
         if missing_flag_columns:
             raise KeyError("The data does not contain columns "
                            "for all flag columns specified in the "
@@ -62,15 +62,36 @@ def filter_on_flag_columns(df, flag_column_dict):
         flag_column_dict_to_float = dict([(key, list(map(convert_to_float, value)))
                                          for (key, value) in flag_column_dict.items()])
 
-        # and then the values in the data
+        # and then the values in the flag columns: integer
+        # columns are converted to floats and only the numbers
+        # in the columns that are not numeric are converted
+        converted_columns = {}
+        flagged_mask = np.ones(len(df), dtype=bool)
         for column in flag_columns:
-            df_new[column] = df_new[column].map(convert_to_float)
-
-        # identify responses with values which satisfy the condition
-        full_mask = df_new.isin(flag_column_dict_to_float)
-        flagged_mask = full_mask[list(flag_column_dict_to_float.keys())].all(1)
-        df_responses_with_requested_flags = df_new[flagged_mask]
-        df_responses_with_excluded_flags = df_new[~flagged_mask]
+            values = df[column]
+            if values.dtype.kind in 'iu':
+                values = values.astype(float)
+                converted_columns[column] = values
+            elif values.dtype == object:
+                numeric_values = pd.to_numeric(values, errors='coerce')
+                number_mask = (numeric_values.notnull() &
+                               (values.astype(str) != values))
+                if number_mask.any():
+                    values = values.where(~number_mask, numeric_values)
+                    converted_columns[column] = values
+
+            # identify responses with values which satisfy the condition
+            flagged_mask &= values.isin(flag_column_dict_to_float[column]).values
+
+        df_responses_with_requested_flags = df[flagged_mask]
+        df_responses_with_excluded_flags = df[~flagged_mask]
+        if converted_columns:
+            df_responses_with_requested_flags = df_responses_with_requested_flags.assign(
+                **dict([(column, values.values[flagged_mask])
+                        for column, values in converted_columns.items()]))
+            df_responses_with_excluded_flags = df_responses_with_excluded_flags.assign(
+                **dict([(column, values.values[~flagged_mask])
+                        for column, values in converted_columns.items()]))
 
         # make sure that the remaining data frame is not empty
         if len(df_responses_with_requested_flags) == 0:
@@ -151,6 +172,53 @@ def filter_on_column(df,
     return df_filtered, df_excluded
 
 
+def filter_on_numeric_columns(df, columns, exclude_zero_sd=False):
+
+    """
+    Filter out the rows in the data frame `df` that contain
+    non-numeric values in any of the given `columns` in a
+    single pass. All of the columns are converted to numbers
+    and any non-numeric values in the excluded rows are
+    replaced with NaNs. Both of the returned data frames
+    keep the original order of the rows so that the results
+    do not depend on how the data was split into chunks.
+    If `exclude_zero_sd` is True, any of the columns with
+    stdev == 0 in the remaining rows are dropped from both
+    of the data frames.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # convert all of the columns to numbers
+    df_numeric = df.copy()
+    for column in columns:
+        df_numeric[column] = pd.to_numeric(df_numeric[column], errors='coerce').astype(float)
+
+    # exclude any rows that have a NaN in at least one of the columns
+    bad_rows = df_numeric[columns].isnull().any(axis=1).values
+    df_filtered = df_numeric[~bad_rows].reset_index(drop=True)
+    df_excluded = df_numeric[bad_rows].reset_index(drop=True)
+
+    # Drop the columns where the standard deviation equals zero:
+    # for training set sd == 0 will break normalization.
+    # We set the tolerance level to the 6th digit
+    # to account for a possibility that the exact value
+    # computed by std is not 0
+    if exclude_zero_sd:
+        column_sds = df_filtered[columns].std()
+        zero_sd_columns = [column for column in columns
+                           if np.isclose(column_sds[column], 0, atol=1e-06)]
+        for column in zero_sd_columns:
+            logger.info("Feature {} was excluded from the model"
+                        " because its standard deviation in the "
+                        "training set is equal to 0.".format(column))
+        if zero_sd_columns:
+            df_filtered = df_filtered.drop(zero_sd_columns, axis=1)
+            df_excluded = df_excluded.drop(zero_sd_columns, axis=1)
+
+    return df_filtered, df_excluded
+
+
 def remove_outliers(data, mean=None, sd=None, sd_multiplier=4):
 
     """
@@ -176,30 +244,57 @@ def remove_outliers(data, mean=None, sd=None, sd_multiplier=4):
     return new_data
 
 
+def _feature_names(name, mask):
+    """
+    Return the name(s) of the features for which the
+    given `mask` is True. If the data being transformed is
+    a vector, `name` is the name of the feature and `mask` is
+    a single boolean. If the data is a 2-D array with one column
+    per feature, `name` is the list of feature names and `mask`
+    has one value per column.
+    """
+    if np.ndim(mask) == 0:
+        return name
+    return ', '.join(np.asarray(name)[mask])
+
+
+def _feature_axis(data):
+    """
+    Return the axis along which the checks for each feature
+    should be done: the rows if `data` is a 2-D array with
+    one column per feature and all of the values otherwise.
+    """
+    return 0 if np.ndim(data) == 2 else None
+
+
 def apply_inverse_transform(name, data, sd_multiplier=4):
 
     """
     Apply the inverse transform to `data`.
     """
 
-    if np.any(data == 0):
-        raise ValueError("The inverse transformation should not be applied to feature {} which can have a value of 0".format(name))
+    axis = _feature_axis(data)
+
+    # check if the feature has any zeros
+    has_zeros = np.any(data == 0, axis=axis)
+    if np.any(has_zeros):
+        raise ValueError("The inverse transformation should not be applied to feature {} which can have a value of 0".format(_feature_names(name, has_zeros)))
 
     # check if the floor or ceiling are zero
-    data_mean = np.mean(data)
-    data_sd = np.std(data, ddof=1)
+    data_mean = np.mean(data, axis=axis)
+    data_sd = np.std(data, ddof=1, axis=axis)
     floor = data_mean - sd_multiplier * data_sd
     ceiling = data_mean + sd_multiplier * data_sd
-    if floor == 0 or ceiling == 0:
-        logging.warning('The floor/ceiling for feature {} is zero after applying the inverse transformation'.format(name))
+    zero_floor_or_ceiling = (floor == 0) | (ceiling == 0)
+    if np.any(zero_floor_or_ceiling):
+        logging.warning('The floor/ceiling for feature {} is zero after applying the inverse transformation'.format(_feature_names(name, zero_floor_or_ceiling)))
 
     # check if the feature can be both positive and negative
-    all_positive = np.all(np.abs(data) == data)
-    all_negative = np.all(np.abs(data) == -data)
-    if not (all_positive or all_negative):
-        raise ValueError('The inverse transformation should not be applied to feature {} where the values can have different signs'.format(name))
-
-    # check if the feature has any zeros
+    all_positive = np.all(np.abs(data) == data, axis=axis)
+    all_negative = np.all(np.abs(data) == -data, axis=axis)
+    mixed_signs = ~(all_positive | all_negative)
+    if np.any(mixed_signs):
+        raise ValueError('The inverse transformation should not be applied to feature {} where the values can have different signs'.format(_feature_names(name, mixed_signs)))
 
     return 1/data
 
@@ -210,9 +305,12 @@ def apply_sqrt_transform(name, data):
     Apply the sqrt transform to `data`.
     """
 
+    axis = _feature_axis(data)
+
     # check if the feature has any negative values
-    if np.any(data < 0):
-        raise ValueError("The sqrt transformation should not be applied to feature {} which can have negative values".format(name))
+    has_negatives = np.any(data < 0, axis=axis)
+    if np.any(has_negatives):
+        raise ValueError("The sqrt transformation should not be applied to feature {} which can have negative values".format(_feature_names(name, has_negatives)))
 
     return np.sqrt(data)
 
@@ -223,15 +321,17 @@ def apply_log_transform(name, data):
     Apply the log transform to `data`.
     """
 
-    logger = logging.getLogger(__name__)
+    axis = _feature_axis(data)
 
     # check if the feature has any zeros
-    if np.any(data == 0):
-        raise ValueError("The log transformation should not be applied to feature {} which can have a value of 0".format(name))
+    has_zeros = np.any(data == 0, axis=axis)
+    if np.any(has_zeros):
+        raise ValueError("The log transformation should not be applied to feature {} which can have a value of 0".format(_feature_names(name, has_zeros)))
 
     # check if the feature has any negative values
-    if np.any(data < 0):
-        raise ValueError("The log transformation should not be applied to feature {} which can have negative values".format(name))
+    has_negatives = np.any(data < 0, axis=axis)
+    if np.any(has_negatives):
+        raise ValueError("The log transformation should not be applied to feature {} which can have negative values".format(_feature_names(name, has_negatives)))
 
     return np.log(data)
 
@@ -242,9 +342,12 @@ def apply_add_one_inverse_transform(name, data):
     Apply the add one and invert transform to `data`.
     """
 
+    axis = _feature_axis(data)
+
     # check if the feature has any negative values
-    if np.any(data < 0):
-        raise ValueError("The addOneInv transformation should not be applied to feature {} which can have negative values".format(name))
+    has_negatives = np.any(data < 0, axis=axis)
+    if np.any(has_negatives):
+        raise ValueError("The addOneInv transformation should not be applied to feature {} which can have negative values".format(_feature_names(name, has_negatives)))
 
     return 1/(data + 1)
 
@@ -255,9 +358,12 @@ def apply_add_one_log_transform(name, data):
     Apply the add one and log transform to `data`.
     """
 
+    axis = _feature_axis(data)
+
     # check if the feature has any negative values
-    if np.any(data < 0):
-        raise ValueError("The addOneLn transformation should not be applied to feature {} which can have negative values".format(name))
+    has_negatives = np.any(data < 0, axis=axis)
+    if np.any(has_negatives):
+        raise ValueError("The addOneLn transformation should not be applied to feature {} which can have negative values".format(_feature_names(name, has_negatives)))
 
     return np.log(data + 1)
 
@@ -269,7 +375,9 @@ def transform_feature(name, data, transform):
     feature `name`. Note that many of these transformations
     may be meaningless for features which span both negative
     and positive values. Some transformations may throw errors
-    for negative feature values.
+    for negative feature values. `data` can also be a 2-D array
+    with one column per feature, in which case `name` is the list
+    of the feature names.
     """
     transform_functions = {'inv': apply_inverse_transform,
                            'sqrt': apply_sqrt_transform,
@@ -315,81 +423,354 @@ def preprocess_feature(data, feature_name, feature_transform,
     return transformed_feature
 
 
-def preprocess_train_and_test_features(df_train, df_test, feature_specs):
+class TransformCache:
     """
-    Pre-process those features in the given training and testing
-    data frame `df` whose specifications are contained in
-    `feature_specs`. Also return a third data frame containing the
-    feature specs themselves.
+    A cache for the transformed values of the training features.
+    The values are computed when the transformations are selected
+    automatically and reused when the pre-processor is fitted so
+    that the chosen transformation does not have to be applied
+    again. The entries are keyed by the feature name, the
+    transformation and the mean and standard deviation used to
+    clamp the outliers, and are only added if the clamping does not
+    change any of the values. The least recently used entries are
+    evicted once the cached values take up more than `max_bytes`.
     """
 
-    logger = logging.getLogger(__name__)
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        Create an empty cache that holds
+        at most `max_bytes` of values.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, feature_name, transform, mean, sd):
+        """
+        Return the transformed values of the given feature
+        along with their mean and standard deviation or
+        None if they are not in the cache.
+        """
+        key = (feature_name, transform, mean, sd)
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, feature_name, transform, mean, sd, values):
+        """
+        Add the given transformed values of the feature
+        to the cache and evict the least recently used
+        entries if the cache is too large.
+        """
+
+        values = np.array(values, dtype=np.float64)
+        if values.nbytes > self.max_bytes:
+            return
+
+        key = (feature_name, transform, mean, sd)
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[0].nbytes
+
+        # compute the statistics of the transformed values
+        # the same way as the pre-processor does
+        self._entries[key] = (values, values.mean(), values.std(ddof=1))
+        self.size += values.nbytes
+        while self.size > self.max_bytes:
+            _, (evicted_values, _, _) = self._entries.popitem(last=False)
+            self.size -= evicted_values.nbytes
+
+
+class FeaturePreprocessor:
+    """
+    A compiled feature pre-processing pipeline. It is fitted once
+    on the training set from the feature specifications or loaded
+    from the feature information (`_feature.csv`) saved during
+    training. It then applies all of the pre-processing steps to
+    the full matrix of feature values, one stage at a time: it
+    clamps the outliers, applies the transformations (once per
+    transformation type), standardizes the values and multiplies
+    them by the signs. This is the code path that is used for the
+    training set, the evaluation set and for new predictions.
+    """
 
-    # keep the original data frames and make copies
-    # that only include features used in the model
-    df_train_preprocessed = df_train.copy()
-    df_test_preprocessed = df_test.copy()
-
-    # we also need to create a data frame that includes
-    # all relevant information about each feature
-    df_feature_info = pd.DataFrame()
-
-    # now iterate over each feature
-    for fdict in feature_specs['features']:
-
-        feature_name = fdict['feature']
-        feature_transformation = fdict['transform']
-        feature_sign = fdict['sign']
-
-        train_feature_mean = df_train[feature_name].mean()
-        train_feature_sd = df_train[feature_name].std()
-
-        training_feature_values = df_train[feature_name].values
-        df_train_preprocessed[feature_name] = preprocess_feature(training_feature_values,
-                                                                 feature_name,
-                                                                 feature_transformation,
-                                                                 train_feature_mean,
-                                                                 train_feature_sd,
-                                                                 exclude_zero_sd=True)
-
-        testing_feature_values = df_test[feature_name].values
-        df_test_preprocessed[feature_name] = preprocess_feature(testing_feature_values,
-                                                                feature_name,
-                                                                feature_transformation,
-                                                                train_feature_mean,
-                                                                train_feature_sd)
-
-        # Standardize the features using the mean and sd computed on the
-        # training set. These are computed separately because we need to
-        # get the mean of transformed feature before standardization.
-        train_transformed_mean = df_train_preprocessed[feature_name].mean()
-        train_transformed_sd = df_train_preprocessed[feature_name].std()
-
-        df_train_preprocessed[feature_name] = (df_train_preprocessed[feature_name] - train_transformed_mean) / train_transformed_sd
-        df_test_preprocessed[feature_name] = (df_test_preprocessed[feature_name] - train_transformed_mean) / train_transformed_sd
-
-        # Multiply both train and test feature by weight. Within the
-        # current SR timeline, the mean of the transformed train
+    # the columns of the feature information data frame
+    # that contain the pre-processing parameters
+    parameter_columns = ['train_mean',
+                         'train_sd',
+                         'train_transformed_mean',
+                         'train_transformed_sd']
+
+    def __init__(self, df_feature_info):
+        """
+        Create a pre-processor from the given feature information
+        data frame that has one row per feature and contains the
+        transformation, the sign and the pre-processing parameters.
+        The feature names are either in a column called `feature`
+        or in the index.
+        """
+
+        if 'feature' in df_feature_info:
+            df_feature_info = df_feature_info.set_index('feature')
+
+        self.features = df_feature_info.index.tolist()
+        self.transforms = df_feature_info['transform'].tolist()
+        self.signs = df_feature_info['sign'].values
+        (self.train_means,
+         self.train_sds,
+         self.train_transformed_means,
+         self.train_transformed_sds) = [df_feature_info[column].values.astype(np.float64)
+                                        for column in self.parameter_columns]
+
+        # group the features by transformation so that each
+        # transformation is applied to all of its features at once
+        self.transform_groups = {}
+        for idx, transform in enumerate(self.transforms):
+            self.transform_groups.setdefault(transform, []).append(idx)
+
+        # the outliers for the features with a training mean or
+        # standard deviation of zero are clamped using the mean
+        # and standard deviation of the data being transformed,
+        # unless these have been fitted on all of the data
+        self.fallback_columns = np.flatnonzero((self.train_means == 0) |
+                                               (self.train_sds == 0))
+        self.fallback_means = None
+        self.fallback_sds = None
+
+    @classmethod
+    def from_file(cls, feature_file):
+        """
+        Load the pre-processor from the `_feature.csv` file
+        saved during training.
+        """
+        return cls(pd.read_csv(feature_file, index_col=0))
+
+    @classmethod
+    def fit_transform(cls, df_train, feature_specs, transform_cache=None):
+        """
+        Fit the pre-processor for the features in `feature_specs`
+        on the given training data frame and return it along
+        with the pre-processed training data frame. Any transformed
+        feature values in `transform_cache` are used instead of
+        transforming the features again.
+        """
+
+        feature_names = [fdict['feature'] for fdict in feature_specs['features']]
+        values = np.array(df_train[feature_names].values, dtype=np.float64, order='F')
+
+        # compute the means and the standard deviations of the raw
+        # feature values the same way as pandas does
+        df_feature_info = pd.DataFrame({'feature': feature_names,
+                                        'transform': [fdict['transform'] for fdict in feature_specs['features']],
+                                        'sign': [fdict['sign'] for fdict in feature_specs['features']],
+                                        'train_mean': values.mean(axis=0),
+                                        'train_sd': values.std(axis=0, ddof=1),
+                                        'train_transformed_mean': np.nan,
+                                        'train_transformed_sd': np.nan})
+        preprocessor = cls(df_feature_info)
+
+        # get the transformed values that have already been computed
+        cached_columns = {}
+        if transform_cache is not None:
+            for idx, feature_name in enumerate(preprocessor.features):
+                entry = transform_cache.get(feature_name,
+                                            preprocessor.transforms[idx],
+                                            preprocessor.train_means[idx],
+                                            preprocessor.train_sds[idx])
+                if entry is not None:
+                    cached_columns[idx] = entry
+
+        # the standardization parameters are computed on the
+        # clamped and transformed training feature values
+        preprocessor._clamp_and_transform(values,
+                                          exclude_zero_sd=True,
+                                          transformed_columns=dict((idx, entry[0])
+                                                                   for idx, entry in cached_columns.items()))
+        if cached_columns:
+            for idx in range(values.shape[1]):
+                if idx in cached_columns:
+                    (preprocessor.train_transformed_means[idx],
+                     preprocessor.train_transformed_sds[idx]) = cached_columns[idx][1:]
+                else:
+                    preprocessor.train_transformed_means[idx] = values[:, idx].mean()
+                    preprocessor.train_transformed_sds[idx] = values[:, idx].std(ddof=1)
+        else:
+            preprocessor.train_transformed_means = values.mean(axis=0)
+            preprocessor.train_transformed_sds = values.std(axis=0, ddof=1)
+        preprocessor._standardize(values)
+
+        return preprocessor, preprocessor._replace_features(df_train, values)
+
+    @property
+    def feature_info(self):
+        """
+        The feature information data frame with one row per
+        feature, in the same format as the `_feature.csv` file.
+        """
+        return pd.DataFrame([{"feature": feature_name,
+                              "transform": feature_transformation,
+                              "sign": feature_sign,
+                              "train_mean": train_feature_mean,
+                              "train_sd": train_feature_sd,
+                              "train_transformed_mean": train_transformed_mean,
+                              "train_transformed_sd": train_transformed_sd}
+                             for (feature_name,
+                                  feature_transformation,
+                                  feature_sign,
+                                  train_feature_mean,
+                                  train_feature_sd,
+                                  train_transformed_mean,
+                                  train_transformed_sd) in zip(self.features,
+                                                               self.transforms,
+                                                               self.signs,
+                                                               self.train_means,
+                                                               self.train_sds,
+                                                               self.train_transformed_means,
+                                                               self.train_transformed_sds)])
+
+    def fit_fallback_parameters(self, values):
+        """
+        Compute the means and the standard deviations used to clamp
+        the outliers for the features in `fallback_columns` from the
+        given N x k array of their values. These are then used for
+        all of the data that is transformed instead of the parameters
+        of that data, e.g. when the data is transformed in chunks.
+        """
+        self.fallback_means, self.fallback_sds = self._fallback_parameters(values)
+
+    def _fallback_parameters(self, values):
+        """
+        Return arrays with the means and the standard deviations of
+        the columns of the given N x k array of the values of the
+        features in `fallback_columns` and NaN for the other features.
+        Each column is reduced on its own so that the results do not
+        depend on the memory layout of the array.
+        """
+        means = np.full(len(self.features), np.nan)
+        sds = np.full(len(self.features), np.nan)
+        for idx, column in zip(self.fallback_columns, values.T):
+            column = np.ascontiguousarray(column)
+            means[idx] = column.mean()
+            sds[idx] = column.std()
+        return means, sds
+
+    def _clamp_and_transform(self, values, exclude_zero_sd=False,
+                             transformed_columns={}):
+        """
+        Clamp the outliers in the given N x p array of feature
+        values and transform them, in place. The columns in
+        `transformed_columns` are replaced by the given values,
+        which have already been clamped and transformed.
+        """
+
+        # clamp any outlier values that are 4 standard deviations
+        # away from the mean. Just like `remove_outliers()`, we
+        # use the mean and standard deviation of the data itself
+        # (or the fitted fallback parameters) if the training
+        # parameters are zero
+        means = self.train_means.copy()
+        sds = self.train_sds.copy()
+        if len(self.fallback_columns):
+            if self.fallback_means is None:
+                (fallback_means,
+                 fallback_sds) = self._fallback_parameters(values[:, self.fallback_columns])
+            else:
+                fallback_means, fallback_sds = self.fallback_means, self.fallback_sds
+            means[means == 0] = fallback_means[means == 0]
+            sds[sds == 0] = fallback_sds[sds == 0]
+        floors = means - 4 * sds
+        ceilings = means + 4 * sds
+        np.copyto(values, ceilings, where=values > ceilings)
+        np.copyto(values, floors, where=values < floors)
+
+        # apply each of the requested transformations to
+        # all of the features that use it at the same time
+        for transform, indices in self.transform_groups.items():
+            if transform in ['raw', 'org']:
+                continue
+            for idx in indices:
+                if idx in transformed_columns:
+                    values[:, idx] = transformed_columns[idx]
+            indices = [idx for idx in indices if idx not in transformed_columns]
+            if indices:
+                names = [self.features[idx] for idx in indices]
+                values[:, indices] = transform_feature(names, values[:, indices], transform)
+
+        # check the standard deviation of the transformed features
+        # we set ddof to 1 so that np.std gave the same result as pandas .std
+        # we also set the tolerance limit to account for cases where std
+        # is computed as a very low decimal rather than 0
+        # We only do this for the training set.
+        if exclude_zero_sd:
+            feature_sds = values.std(axis=0, ddof=1)
+            for feature_name, feature_sd in zip(self.features, feature_sds):
+                if np.isclose(feature_sd, 0, atol=1e-06):
+                    raise ValueError("The standard deviation for feature {} is 0 after pre-processing. Please exclude this feature and re-run the experiment.".format(feature_name))
+
+    def _standardize(self, values):
+        """
+        Standardize the given N x p array of transformed feature
+        values using the training parameters and multiply them by
+        the signs, in place.
+        """
+
+        # Within the current SR timeline, the mean of the transformed train
         # feature used to standardize test features has to be
         # computed before multiplying the train feature by the weight.
-        df_train_preprocessed[feature_name] = df_train_preprocessed[feature_name] * feature_sign
-        df_test_preprocessed[feature_name] = df_test_preprocessed[feature_name] * feature_sign
-
-        # update the feature preprocessing metadata frame
-        df_feature = pd.DataFrame([{"feature": feature_name,
-                                    "transform": feature_transformation,
-                                    "sign": feature_sign,
-                                    "train_mean": train_feature_mean,
-                                    "train_sd": train_feature_sd,
-                                    "train_transformed_mean": train_transformed_mean,
-                                    "train_transformed_sd": train_transformed_sd}])
-        df_feature_info = df_feature_info.append(df_feature)
-
-    # reset the index for the feature metadata frame
-    # since we built it up row by row
-    df_feature_info = df_feature_info.reset_index().drop('index', 1)
+        values -= self.train_transformed_means
+        values /= self.train_transformed_sds
+        values *= self.signs
+
+    def _replace_features(self, df, values):
+        """
+        Return a copy of the data frame `df` with the
+        feature columns replaced by the given values.
+        """
+        df_preprocessed = df.copy()
+        df_preprocessed[self.features] = values
+        return df_preprocessed
+
+    def transform_array(self, values):
+        """
+        Pre-process the given N x p array of feature values,
+        with the columns in the same order as `features`, in
+        place and return it.
+        """
+        self._clamp_and_transform(values)
+        self._standardize(values)
+        return values
+
+    def transform(self, df):
+        """
+        Return a copy of the given data frame with
+        all of the features pre-processed.
+        """
+        values = np.array(df[self.features].values, dtype=np.float64, order='F')
+        self.transform_array(values)
+        return self._replace_features(df, values)
+
+
+def preprocess_train_and_test_features(df_train, df_test, feature_specs,
+                                       transform_cache=None):
+    """
+    Pre-process those features in the given training and testing
+    data frame `df` whose specifications are contained in
+    `feature_specs`. Also return a third data frame containing the
+    feature specs themselves. The transformed training feature
+    values in `transform_cache`, if any, are reused.
+    """
+
+    # fit the pre-processor on the training set and
+    # apply the same pre-processing to the test set
+    preprocessor, df_train_preprocessed = FeaturePreprocessor.fit_transform(df_train,
+                                                                            feature_specs,
+                                                                            transform_cache=transform_cache)
+    df_test_preprocessed = preprocessor.transform(df_test)
 
     # return the three data frames
     return (df_train_preprocessed,
             df_test_preprocessed,
-            df_feature_info)
+            preprocessor.feature_info)
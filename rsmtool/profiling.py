@@ -0,0 +1,206 @@
+"""
+Record the time, memory use and data sizes for the stages of a run.
+
+:author: Nitin Madnani (nmadnani@ets.org)
+:author: Anastassia Loukina (aloukina@ets.org)
+:organization: ETS
+"""
+
+import json
+import logging
+import sys
+import time
+
+from collections import OrderedDict
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+from rsmtool.utils import write_experiment_output
+
+# the resource module is not available on Windows
+try:
+    import resource
+except ImportError:
+    HAS_RESOURCE = False
+else:
+    HAS_RESOURCE = True
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of the current process to its
+    current resident set size so that the peak for the next stage can
+    be measured on its own. This is only supported on Linux. Returns
+    whether the peak was reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refsf:
+            clear_refsf.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def get_peak_rss():
+    """
+    Return the peak resident set size in MB of the current process
+    since it was last reset with `reset_peak_rss()`, or NaN if it
+    cannot be determined on this platform.
+    """
+    try:
+        with open('/proc/self/status', 'r') as statusf:
+            for line in statusf:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return np.nan
+
+
+def get_cumulative_peak_rss():
+    """
+    Return the peak resident set size in MB of the current process
+    or of any of its child processes that have finished, whichever
+    is larger, or NaN if it cannot be determined on this platform.
+    On Linux, the peak for the current process is also reset by
+    `reset_peak_rss()`.
+    """
+    if not HAS_RESOURCE:
+        return np.nan
+
+    max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # the maximum RSS is in bytes on macOS and in kilobytes elsewhere
+    units_per_mb = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return max_rss / units_per_mb
+
+
+class Profiler(object):
+    """
+    Record the wall clock time, the peak memory use and any counts
+    (e.g. the number of responses or features) for each of the stages
+    of a run. The peak memory use of each stage is the highest resident
+    set size of the current process during that stage, which can only
+    be measured on Linux. The cumulative peak memory use is the highest
+    resident set size of the process or any of its finished child
+    processes reached by the end of the stage. If the profiler is not
+    enabled, nothing is recorded or saved.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []
+        self._current_stage = None
+        self._start_time = time.perf_counter()
+        self._cumulative_peak_rss_mb = np.nan
+
+    def start_stage(self, name):
+        """
+        Start timing the stage with the given name,
+        ending the current stage first if there is one.
+        """
+        if not self.enabled:
+            return
+        if self._current_stage:
+            self.end_stage()
+
+        # keep track of the cumulative peak ourselves
+        # since resetting the peak for the stage also
+        # resets the peak for the lifetime of the process
+        self._update_cumulative_peak_rss()
+        self._current_stage = (name, time.perf_counter(), reset_peak_rss())
+
+    def end_stage(self, **counts):
+        """
+        End the current stage and record it
+        along with the given counts.
+        """
+        if not self.enabled or not self._current_stage:
+            return
+        name, start_time, peak_rss_reset = self._current_stage
+        self._current_stage = None
+        self.add_stage(name, time.perf_counter() - start_time,
+                       peak_rss_mb=get_peak_rss() if peak_rss_reset else np.nan,
+                       cumulative_peak_rss_mb=self._update_cumulative_peak_rss(),
+                       **counts)
+
+    def _update_cumulative_peak_rss(self):
+        """
+        Update the cumulative peak memory use with the
+        current value and return it.
+        """
+        peak_rss_mb = get_cumulative_peak_rss()
+        if (np.isnan(self._cumulative_peak_rss_mb) or
+                peak_rss_mb > self._cumulative_peak_rss_mb):
+            self._cumulative_peak_rss_mb = peak_rss_mb
+        return self._cumulative_peak_rss_mb
+
+    def add_stage(self, name, seconds, peak_rss_mb=np.nan,
+                  cumulative_peak_rss_mb=np.nan, **counts):
+        """
+        Record a stage that was timed elsewhere, such
+        as a report section executed in parallel.
+        """
+        if not self.enabled:
+            return
+        stage = OrderedDict([('stage', name),
+                             ('seconds', seconds),
+                             ('peak_rss_mb', peak_rss_mb),
+                             ('cumulative_peak_rss_mb', cumulative_peak_rss_mb)])
+        stage.update(sorted(counts.items()))
+        self.stages.append(stage)
+
+    def add_report_sections(self, report_stage, section_times):
+        """
+        Record the execution time of each of the report
+        sections returned by the given report stage.
+        """
+        for section_name, seconds in (section_times or {}).items():
+            self.add_stage('{}/{}'.format(report_stage, section_name), seconds)
+
+    def to_data_frame(self):
+        """
+        Return a data frame with a row for each recorded stage.
+        """
+        columns = ['stage', 'seconds', 'peak_rss_mb', 'cumulative_peak_rss_mb']
+        for stage in self.stages:
+            columns.extend(key for key in stage if key not in columns)
+        return pd.DataFrame(self.stages, columns=columns)
+
+    def save(self, experiment_id, csvdir):
+        """
+        Save the recorded stages to the `<experiment_id>_timings.csv`
+        and `<experiment_id>_timings.json` files under `csvdir`.
+        """
+        if not self.enabled:
+            return
+
+        # end the current stage if it was not ended explicitly
+        self.end_stage()
+
+        logging.getLogger(__name__).info('Saving the stage timings to disk')
+        df_timings = self.to_data_frame()
+        write_experiment_output([df_timings], ['timings'], experiment_id, csvdir)
+
+        # NaN values are not valid JSON so they are saved as null
+        stages = [OrderedDict((key, None if pd.isnull(value) else value)
+                              for key, value in stage.items())
+                  for stage in self.stages]
+        timings = OrderedDict([('experiment_id', experiment_id),
+                               ('total_seconds', time.perf_counter() - self._start_time),
+                               ('stages', stages)])
+        timings_file = join(csvdir, '{}_timings.json'.format(experiment_id))
+        with open(timings_file, 'w') as timingsf:
+            json.dump(timings, timingsf, indent=4, separators=(',', ': '),
+                      default=_json_value)
+
+
+def _json_value(value):
+    """
+    Convert the given NumPy value to a Python
+    value so that it can be serialized.
+    """
+    return value.item()
@@ -7,16 +7,28 @@ Functions dealing with report generation.
 """
 
 import argparse
+import hashlib
 import logging
 import json
 import os
+import shutil
+import tempfile
+import time
 
-from os.path import abspath, basename, dirname, join, splitext
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from os import listdir
+from os.path import abspath, basename, dirname, exists, join, splitext
+
+import nbformat
 
 from traitlets.config import Config
 from nbconvert.exporters import HTMLExporter
+from nbconvert.preprocessors import ExecutePreprocessor
 
 from rsmtool import HAS_RSMEXTRA
+from rsmtool.version import __version__
 
 # Check if we have local add-ons
 if HAS_RSMEXTRA:
@@ -72,6 +84,11 @@ comparison_notebook_path = abspath(join(package_path,
                                         'notebooks',
                                         'comparison'))
 
+# the environment variables with the paths of the files
+# that are read by the report header in addition to the
+# files in the output directory
+report_input_file_variables = ['FEATURE_SUBSET_FILE']
+
 # Define the general section list
 
 general_section_list_rsmtool = [section for section in ordered_section_list_rsmtool
@@ -123,6 +140,263 @@ def merge_notebooks(notebook_files, output_file):
         json.dump(merged_notebook, outf, indent=1)
 
 
+def execute_section(header_file, section_file, path, timeout=600,
+                    figure_dir=None):
+    """
+    Execute the cells of the header notebook followed by the cells
+    of the given section notebook in a new kernel with `path` as the
+    working directory. If `figure_dir` is given, the figures saved by
+    the section are first saved to a temporary directory, by changing
+    the `FIGURE_DIR` environment variable, and then moved to
+    `figure_dir`. Returns the executed notebook as a JSON string, the
+    number of header cells, the execution time in seconds, the error
+    message if any of the cells could not be executed and the list of
+    the names of the saved figure files.
+    """
+
+    notebook = nbformat.read(header_file, as_version=4)
+    num_header_cells = len(notebook.cells)
+    notebook.cells.extend(nbformat.read(section_file, as_version=4).cells)
+
+    # use a separate figure directory for this section so
+    # that we know which figures were saved by the section
+    if figure_dir:
+        section_figure_dir = tempfile.mkdtemp()
+        original_figure_dir = os.environ.get('FIGURE_DIR')
+        os.environ['FIGURE_DIR'] = section_figure_dir
+
+    # the cells are executed in place so if one of them fails,
+    # we still keep the outputs of the cells before it
+    error = None
+    start_time = time.time()
+    try:
+        executor = ExecutePreprocessor(timeout=timeout)
+        executor.preprocess(notebook, {'metadata': {'path': path}})
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    execution_time = time.time() - start_time
+
+    figure_files = []
+    if figure_dir:
+        if original_figure_dir is None:
+            del os.environ['FIGURE_DIR']
+        else:
+            os.environ['FIGURE_DIR'] = original_figure_dir
+        figure_files = sorted(listdir(section_figure_dir))
+        for figure_file in figure_files:
+            shutil.move(join(section_figure_dir, figure_file),
+                        join(figure_dir, figure_file))
+        shutil.rmtree(section_figure_dir)
+
+    return (nbformat.writes(notebook), num_header_cells,
+            execution_time, error, figure_files)
+
+
+def hash_files(files):
+    """
+    Compute the SHA-256 hash of the names and
+    the contents of all of the given files.
+    """
+    hasher = hashlib.sha256()
+    for filename in sorted(files):
+        hasher.update(filename.encode('utf-8'))
+        with open(filename, 'rb') as inputf:
+            for block in iter(lambda: inputf.read(1 << 20), b''):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def get_report_input_files(patterns, environment={}):
+    """
+    Return the files matching the given glob patterns that are
+    read by the report sections, along with the files named by
+    the `environment` variables that the report header reads
+    directly, such as the feature subset file. The stage timings
+    saved by `rsmtool.profiling.Profiler` are skipped since they
+    change with every run and would invalidate the cached sections.
+    """
+    input_files = [filename for pattern in patterns for filename in glob(pattern)
+                   if not splitext(filename)[0].endswith('_timings')]
+    input_files.extend(environment[variable] for variable in report_input_file_variables
+                       if environment.get(variable) and exists(environment[variable]))
+    return input_files
+
+
+def get_section_cache_key(header_file, section_file,
+                          environment, inputs_hash):
+    """
+    Compute the cache key for the outputs of the given section
+    from the contents of the header and the section notebooks,
+    the environment variables used by the notebooks, the hash
+    of the input files and the version of RSMTool.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(__version__.encode('utf-8'))
+    hasher.update(hash_files([header_file, section_file]).encode('utf-8'))
+    hasher.update(json.dumps(sorted(environment.items())).encode('utf-8'))
+    hasher.update(inputs_hash.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def load_cached_section(cache_dir, key, figure_dir=None):
+    """
+    Return the cached results of `execute_section()` for the given
+    key and copy the cached figures to `figure_dir`. Returns None
+    if the section is not in the cache.
+    """
+
+    section_cache_dir = join(cache_dir, key)
+    if not exists(section_cache_dir):
+        return None
+
+    with open(join(section_cache_dir, 'section.json'), 'r') as infof:
+        section_info = json.load(infof)
+    with open(join(section_cache_dir, 'section.ipynb'), 'r') as notebookf:
+        notebook_json = notebookf.read()
+
+    if figure_dir:
+        for figure_file in section_info['figures']:
+            shutil.copyfile(join(section_cache_dir, 'figures', figure_file),
+                            join(figure_dir, figure_file))
+
+    return (notebook_json, section_info['num_header_cells'],
+            0.0, None, section_info['figures'])
+
+
+def save_cached_section(cache_dir, key, notebook_json, num_header_cells,
+                        figure_files, figure_dir=None):
+    """
+    Save the executed notebook for a section along with
+    the figures it saved in `figure_dir` to the cache.
+    """
+
+    section_cache_dir = join(cache_dir, key)
+    if exists(section_cache_dir):
+        return
+
+    # save everything to a temporary directory first so that
+    # we never end up with an incomplete entry in the cache
+    temp_dir = tempfile.mkdtemp(dir=cache_dir)
+    os.makedirs(join(temp_dir, 'figures'))
+    with open(join(temp_dir, 'section.json'), 'w') as infof:
+        json.dump({'num_header_cells': num_header_cells,
+                   'figures': figure_files}, infof)
+    with open(join(temp_dir, 'section.ipynb'), 'w') as notebookf:
+        notebookf.write(notebook_json)
+    for figure_file in figure_files:
+        shutil.copyfile(join(figure_dir, figure_file),
+                        join(temp_dir, 'figures', figure_file))
+
+    try:
+        os.rename(temp_dir, section_cache_dir)
+    except OSError:
+        shutil.rmtree(temp_dir)
+
+
+def execute_and_merge_notebooks(notebook_files, output_file,
+                                num_workers=None, timeout=600,
+                                figure_dir=None, cache_dir=None,
+                                environment={}, input_files=[]):
+    """
+    Execute each of the given section notebooks together with the
+    header (the first notebook) in its own kernel, running up to
+    `num_workers` sections at the same time (by default, as many as
+    there are processors), and merge the executed cells into a single
+    notebook named `output_file`. If a section cannot be executed, an
+    error message is added at the beginning of the section and the
+    other sections are not affected. The figures saved by the sections
+    are saved to `figure_dir`.
+
+    If `cache_dir` is given, the executed sections are saved there and
+    a section is only executed again if the notebooks, the given
+    `environment` variables or the contents of the given `input_files`
+    have changed since it was last executed. Returns a dictionary with
+    the execution time in seconds for each section, which is 0 for the
+    sections taken from the cache.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    header_file, section_files = notebook_files[0], notebook_files[1:]
+    path = dirname(abspath(output_file))
+
+    # get the sections that have already been executed
+    # with exactly the same inputs from the cache
+    results = [None] * len(section_files)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        inputs_hash = hash_files(input_files)
+        section_keys = [get_section_cache_key(header_file,
+                                              section_file,
+                                              environment,
+                                              inputs_hash)
+                        for section_file in section_files]
+        results = [load_cached_section(cache_dir, key, figure_dir)
+                   for key in section_keys]
+
+    # execute all of the other sections in parallel
+    indices_to_execute = [idx for idx, result in enumerate(results) if result is None]
+    if indices_to_execute:
+
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        num_workers = max(1, min(num_workers, len(indices_to_execute)))
+
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(execute_section, header_file,
+                                       section_files[idx], path,
+                                       timeout, figure_dir)
+                       for idx in indices_to_execute]
+            for idx, future in zip(indices_to_execute, futures):
+                results[idx] = future.result()
+
+                # save the sections that were executed successfully
+                notebook_json, num_header_cells, _, error, figure_files = results[idx]
+                if cache_dir and not error:
+                    save_cached_section(cache_dir, section_keys[idx],
+                                        notebook_json, num_header_cells,
+                                        figure_files, figure_dir)
+
+    # we use the header cells that were executed with the first
+    # section that was not in the cache (so that the report shows
+    # the current time) and then add the cells for each section
+    header_idx = indices_to_execute[0] if indices_to_execute else 0
+    notebook_json, num_header_cells = results[header_idx][:2]
+    merged_notebook = nbformat.reads(notebook_json, as_version=4)
+    merged_notebook.cells = merged_notebook.cells[:num_header_cells]
+
+    section_times = OrderedDict()
+    for idx, (section_file, (notebook_json,
+                             num_header_cells,
+                             execution_time,
+                             error,
+                             _)) in enumerate(zip(section_files, results)):
+
+        section_name = splitext(basename(section_file))[0]
+        notebook = nbformat.reads(notebook_json, as_version=4)
+        section_cells = notebook.cells[num_header_cells:]
+
+        if error:
+            logger.warning("The {} section could not be executed: {}".format(section_name,
+                                                                             error))
+            error_markdown = ("**Error**: the *{}* section could not be executed:"
+                              "\n\n```\n{}\n```".format(section_name, error))
+            merged_notebook.cells.append(nbformat.from_dict({'cell_type': 'markdown',
+                                                             'metadata': {},
+                                                             'source': error_markdown}))
+        merged_notebook.cells.extend(section_cells)
+
+        if idx in indices_to_execute:
+            logger.info('Executed the {} section in {:.1f} seconds'.format(section_name,
+                                                                            execution_time))
+        else:
+            logger.info('Using the cached outputs for the {} section'.format(section_name))
+        section_times[section_name] = execution_time
+
+    nbformat.write(merged_notebook, output_file)
+    return section_times
+
+
 def check_section_names(specified_sections,
                         section_type,
                         context='rsmtool'):
@@ -315,7 +589,8 @@ def get_ordered_notebook_files(general_sections,
         ordered_section_list = ordered_section_list_rsmcompare
 
     # add all custom sections to the end of the default ordered list
-    ordered_section_list.extend([splitext(basename(cs))[0] for cs in custom_sections])
+    # without modifying the default list itself
+    ordered_section_list = ordered_section_list + [splitext(basename(cs))[0] for cs in custom_sections]
 
     # get the section file map
     section_file_map = get_section_file_map(special_sections,
@@ -347,33 +622,38 @@ def create_report(experiment_id, description,
                   chosen_notebook_files,
                   feature_subset_file=None,
                   exclude_zero_scores=True,
-                  use_scaled_predictions=False):
+                  use_scaled_predictions=False,
+                  report_cache_dir=None):
     """
     Generate the final RSMTool report the experiment
-    defined by the given arguments.
+    defined by the given arguments. If `report_cache_dir`
+    is given, the executed sections are cached there.
+    Returns the execution time in seconds for each section.
     """
 
     logger = logging.getLogger(__name__)
 
     # set the environment variables we want
-    os.environ['EXPERIMENT_ID'] = experiment_id
-    os.environ['DESCRIPTION'] = description
-    os.environ['TRAIN_FILE_LOCATION'] = train_file_location
-    os.environ['TEST_FILE_LOCATION'] = test_file_location
-    os.environ['OUTPUT_DIR'] = csvdir
-    os.environ['FIGURE_DIR'] = figdir
-    os.environ['MODEL_NAME'] = model_name
-    os.environ['MODEL_TYPE'] = model_type
-    os.environ['SCALED'] = '1' if use_scaled_predictions else '0'
-    os.environ['EXCLUDE_ZEROS'] = '1' if exclude_zero_scores else '0'
-    os.environ['LENGTH_COLUMN'] = '' if length_column == None else length_column
-    os.environ['H2_COLUMN'] = '' if second_human_score_column == None else second_human_score_column
-    os.environ['FEATURE_SUBSET_FILE'] = '' if feature_subset_file == None else feature_subset_file
+    environment = {}
+    environment['EXPERIMENT_ID'] = experiment_id
+    environment['DESCRIPTION'] = description
+    environment['TRAIN_FILE_LOCATION'] = train_file_location
+    environment['TEST_FILE_LOCATION'] = test_file_location
+    environment['OUTPUT_DIR'] = csvdir
+    environment['FIGURE_DIR'] = figdir
+    environment['MODEL_NAME'] = model_name
+    environment['MODEL_TYPE'] = model_type
+    environment['SCALED'] = '1' if use_scaled_predictions else '0'
+    environment['EXCLUDE_ZEROS'] = '1' if exclude_zero_scores else '0'
+    environment['LENGTH_COLUMN'] = '' if length_column == None else length_column
+    environment['H2_COLUMN'] = '' if second_human_score_column == None else second_human_score_column
+    environment['FEATURE_SUBSET_FILE'] = '' if feature_subset_file == None else feature_subset_file
 
     # we define separate groups to allow future flexibility in defining
     # what groups are used for descriptives and evaluations
-    os.environ['GROUPS_FOR_DESCRIPTIVES'] = '%%'.join(subgroups)
-    os.environ['GROUPS_FOR_EVALUATIONS'] = '%%'.join(subgroups)
+    environment['GROUPS_FOR_DESCRIPTIVES'] = '%%'.join(subgroups)
+    environment['GROUPS_FOR_EVALUATIONS'] = '%%'.join(subgroups)
+    os.environ.update(environment)
 
     # get the report directory which is at the same level
     # as the output and the figure directory
@@ -381,15 +661,24 @@ def create_report(experiment_id, description,
     report_name = '{}_report'.format(experiment_id)
     merged_notebook_file = join(reportdir, '{}.ipynb'.format(report_name))
 
-    # merge all the given sections
-    logger.info('Merging sections')
-    merge_notebooks(chosen_notebook_files, merged_notebook_file)
-
-    # run the merged notebook and save the output as
-    # an HTML file in the report directory
+    # execute all the given sections in parallel and merge them
+    logger.info('Executing sections')
+    input_files = get_report_input_files([join(csvdir, '*.csv')], environment)
+    section_times = execute_and_merge_notebooks(chosen_notebook_files,
+                                                merged_notebook_file,
+                                                figure_dir=figdir,
+                                                cache_dir=report_cache_dir,
+                                                environment=environment,
+                                                input_files=input_files)
+
+    # save the executed notebook as an HTML
+    # file in the report directory
     logger.info('Exporting HTML')
     convert_ipynb_to_html(merged_notebook_file,
-                          join(reportdir, '{}.html'.format(report_name)))
+                          join(reportdir, '{}.html'.format(report_name)),
+                          execute=False)
+
+    return section_times
 
 
 def create_comparison_report(experiment_id_old, description_old,
@@ -398,31 +687,36 @@ def create_comparison_report(experiment_id_old, description_old,
                              output_dir, subgroups,
                              chosen_notebook_files,
                              use_scaled_predictions_old=False,
-                             use_scaled_predictions_new=False):
+                             use_scaled_predictions_new=False,
+                             report_cache_dir=None):
     """
     Generate a report comparing the two RSMTool experiments
-    defined by the given arguments.
+    defined by the given arguments. If `report_cache_dir`
+    is given, the executed sections are cached there.
+    Returns the execution time in seconds for each section.
     """
 
     logger = logging.getLogger(__name__)
 
     # set the environment variables we want
-    os.environ['EXPERIMENT_ID_OLD'] = experiment_id_old
-    os.environ['DESCRIPTION_OLD'] = description_old
-    os.environ['OUTPUT_DIR_OLD'] = csvdir_old
-    os.environ['FIGURE_DIR_OLD'] = figdir_old
-    os.environ['SCALED_OLD'] = '1' if use_scaled_predictions_old else '0'
-
-    os.environ['EXPERIMENT_ID_NEW'] = experiment_id_new
-    os.environ['DESCRIPTION_NEW'] = description_new
-    os.environ['OUTPUT_DIR_NEW'] = csvdir_new
-    os.environ['FIGURE_DIR_NEW'] = figdir_new
-    os.environ['SCALED_NEW'] = '1' if use_scaled_predictions_new else '0'
+    environment = {}
+    environment['EXPERIMENT_ID_OLD'] = experiment_id_old
+    environment['DESCRIPTION_OLD'] = description_old
+    environment['OUTPUT_DIR_OLD'] = csvdir_old
+    environment['FIGURE_DIR_OLD'] = figdir_old
+    environment['SCALED_OLD'] = '1' if use_scaled_predictions_old else '0'
+
+    environment['EXPERIMENT_ID_NEW'] = experiment_id_new
+    environment['DESCRIPTION_NEW'] = description_new
+    environment['OUTPUT_DIR_NEW'] = csvdir_new
+    environment['FIGURE_DIR_NEW'] = figdir_new
+    environment['SCALED_NEW'] = '1' if use_scaled_predictions_new else '0'
 
     # we define separate groups to allow future flexibility in defining
     # what groups are used for descriptives and evaluations
-    os.environ['GROUPS_FOR_DESCRIPTIVES'] = '%%'.join(subgroups)
-    os.environ['GROUPS_FOR_EVALUATIONS'] = '%%'.join(subgroups)
+    environment['GROUPS_FOR_DESCRIPTIVES'] = '%%'.join(subgroups)
+    environment['GROUPS_FOR_EVALUATIONS'] = '%%'.join(subgroups)
+    os.environ.update(environment)
 
     # create the output directory
     os.makedirs(output_dir, exist_ok=True)
@@ -430,25 +724,37 @@ def create_comparison_report(experiment_id_old, description_old,
                                            experiment_id_new)
     merged_notebook_file = join(output_dir, '{}.ipynb'.format(report_name))
 
-    # merge all the given sections
-    logger.info('Merging sections')
-    merge_notebooks(chosen_notebook_files, merged_notebook_file)
-
-    # run the merged notebook and save the output as
-    # an HTML file in the report directory
+    # execute all the given sections in parallel and merge them
+    logger.info('Executing sections')
+    input_files = get_report_input_files([join(csvdir_old, '*.csv'),
+                                          join(csvdir_new, '*.csv'),
+                                          join(figdir_old, '*'),
+                                          join(figdir_new, '*')])
+    section_times = execute_and_merge_notebooks(chosen_notebook_files,
+                                                merged_notebook_file,
+                                                cache_dir=report_cache_dir,
+                                                environment=environment,
+                                                input_files=input_files)
+
+    # save the executed notebook as an HTML
+    # file in the report directory
     logger.info('Exporting HTML')
     convert_ipynb_to_html(merged_notebook_file,
-                          join(output_dir, '{}.html'.format(report_name)))
+                          join(output_dir, '{}.html'.format(report_name)),
+                          execute=False)
+
+    return section_times
 
 
-def convert_ipynb_to_html(notebook_file, html_file):
+def convert_ipynb_to_html(notebook_file, html_file, execute=True):
     """
     Convert the given `notebook_file` to HTML and
-    write it to `html_file`.
+    write it to `html_file`. The notebook is executed
+    first unless `execute` is False.
     """
 
     # set a high timeout for datasets with a large number of features
-    report_config = Config({'ExecutePreprocessor': {'enabled': True,
+    report_config = Config({'ExecutePreprocessor': {'enabled': execute,
                                                     'timeout': 600},
                             'HTMLExporter': {'template_path': [template_path],
                                              'template_file': 'report.tpl'}})
@@ -17,24 +17,32 @@ from os.path import abspath, dirname, exists, join, normpath
 
 from rsmtool.input import (read_json_file,
                            check_main_config,
+                           get_report_cache_dir,
                            locate_file,
                            locate_custom_sections)
 
+from rsmtool.profiling import Profiler
+
 from rsmtool.report import (create_comparison_report,
                             get_ordered_notebook_files)
 
 from rsmtool.utils import LogFormatter
 
 
-def run_comparison(config_file, output_dir):
+def run_comparison(config_file, output_dir, profile=False):
     """
     Run a comparison between the two RSMTool experiments
     specified in the config file and write out the
-    comparison report to the output directory.
+    comparison report to the output directory. If `profile`
+    is True, the time and memory used by each stage are
+    saved in the output directory as well.
     """
 
     logger = logging.getLogger(__name__)
 
+    profiler = Profiler(enabled=profile)
+    profiler.start_stage('load')
+
     # load the information from the config file
     # read in the main config file
     config_obj = read_json_file(config_file)
@@ -95,6 +103,9 @@ def run_comparison(config_file, output_dir):
 
     section_order = config_obj['section_order']
 
+    # are we caching the executed report sections?
+    report_cache_dir = get_report_cache_dir(config_obj, configpath)
+
     chosen_notebook_files = get_ordered_notebook_files(general_report_sections,
                                                        special_report_sections,
                                                        custom_report_sections,
@@ -105,13 +116,18 @@ def run_comparison(config_file, output_dir):
 
     # now generate the comparison report
     logger.info('Starting report generation')
-    create_comparison_report(experiment_id_old, description_old,
-                             csvdir_old, figdir_old, experiment_id_new,
-                             description_new, csvdir_new, figdir_new,
-                             output_dir, subgroups,
-                             chosen_notebook_files,
-                             use_scaled_predictions_old=use_scaled_predictions_old,
-                             use_scaled_predictions_new=use_scaled_predictions_new)
+    profiler.start_stage('report')
+    section_times = create_comparison_report(experiment_id_old, description_old,
+                                             csvdir_old, figdir_old, experiment_id_new,
+                                             description_new, csvdir_new, figdir_new,
+                                             output_dir, subgroups,
+                                             chosen_notebook_files,
+                                             use_scaled_predictions_old=use_scaled_predictions_old,
+                                             use_scaled_predictions_new=use_scaled_predictions_new,
+                                             report_cache_dir=report_cache_dir)
+    profiler.end_stage(sections=len(chosen_notebook_files))
+    profiler.add_report_sections('report', section_times)
+    profiler.save('{}_vs_{}'.format(experiment_id_old, experiment_id_new), output_dir)
 
 def main():
 
@@ -135,6 +151,12 @@ def main():
                         help="The output directory where the report "
                              "files for this comparison will be stored")
 
+    parser.add_argument('--profile', dest='profile',
+                        action='store_true', default=False,
+                        help="If true, rsmcompare will save the time and "
+                             "memory used by each stage of the comparison "
+                             "in the output directory.")
+
     # parse given command line arguments
     args = parser.parse_args()
     logger.info('Output directory: {}'.format(args.output_dir))
@@ -150,7 +172,7 @@ def main():
                                 "found.".format(config_file))
 
     # generate a comparison report
-    run_comparison(config_file, output_dir)
+    run_comparison(config_file, output_dir, profile=args.profile)
 
 
 if __name__ == '__main__':
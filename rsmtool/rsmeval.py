@@ -24,8 +24,10 @@ from rsmtool.analysis import (run_data_composition_analyses_for_rsmeval,
 
 from rsmtool.input import (check_main_config,
                            check_subgroups,
+                           get_report_cache_dir,
                            get_trim_min_max,
                            locate_file,
+                           read_data_file,
                            read_json_file,
                            rename_default_columns,
                            check_flag_column,
@@ -33,6 +35,8 @@ from rsmtool.input import (check_main_config,
 
 from rsmtool.predict import process_predictions
 
+from rsmtool.profiling import Profiler
+
 from rsmtool.preprocess import (filter_on_column,
                                 filter_on_flag_columns)
 
@@ -44,14 +48,19 @@ from rsmtool.utils import write_experiment_output
 from rsmtool.utils import LogFormatter
 
 
-def run_evaluation(config_file, output_dir):
+def run_evaluation(config_file, output_dir, profile=False):
     """
     Run RSMTool evaluation experiment using the given configuration
     file and generate all evaluation outputs in the given directory.
+    If `profile` is True, the time and memory used by each stage
+    are saved in the `_timings` files.
     """
 
     logger = logging.getLogger(__name__)
 
+    profiler = Profiler(enabled=profile)
+    profiler.start_stage('data')
+
     # create the 'output' and the 'figure' sub-directories
     # where all the experiment output such as the CSV files
     # and the box plots will be saved
@@ -123,6 +132,9 @@ def run_evaluation(config_file, output_dir):
 
     section_order = config_obj['section_order']
 
+    # are we caching the executed report sections?
+    report_cache_dir = get_report_cache_dir(config_obj, configpath)
+
     #  check all sections values and order and get the
     # ordered list of notebook files
     chosen_notebook_files = get_ordered_notebook_files(general_report_sections,
@@ -187,9 +199,8 @@ def run_evaluation(config_file, output_dir):
     else:
         logger.info('Reading predictions: {}'.format(predictions_file_location))
         string_columns = [id_column, candidate_column] + subgroups
-        converter_dict = dict([(column, str) for column in string_columns if column])
-
-        df_pred = pd.read_csv(predictions_file_location, converters=converter_dict)
+        df_pred = read_data_file(predictions_file_location,
+                                 string_columns=[column for column in string_columns if column])
 
     # make sure that the columns specified in the config file actually exist
     missing_columns = set([id_column,
@@ -346,9 +357,15 @@ def run_evaluation(config_file, output_dir):
                              'test_excluded_responses',
                              'test_responses_with_excluded_flags'],
                             experiment_id,
-                            csvdir)
+                            csvdir,
+                            write_binary=True)
+
+    profiler.end_stage(responses=len(df_pred),
+                       evaluated_responses=len(df_filtered_pred),
+                       excluded_responses=len(df_excluded))
 
     # do the data composition stats
+    profiler.start_stage('analyses')
     (df_test_excluded_analysis,
      df_data_composition,
      data_composition_by_group_dict) = run_data_composition_analyses_for_rsmeval(df_test_metadata,
@@ -357,10 +374,18 @@ def run_evaluation(config_file, output_dir):
                                                                                  candidate_column,
                                                                                  exclude_zero_scores=exclude_zero_scores)
 
+    # save the number of responses in the original predictions
+    # file so that the report does not have to read it again
+    df_original_responses = pd.DataFrame({'partition': ['Evaluation'],
+                                          'responses': [len(df_pred)]},
+                                         columns=['partition', 'responses'])
+
     write_experiment_output([df_test_excluded_analysis,
-                             df_data_composition],
+                             df_data_composition,
+                             df_original_responses],
                             ['test_excluded_composition',
-                             'data_composition'],
+                             'data_composition',
+                             'original_responses'],
                             experiment_id,
                             csvdir)
 
@@ -414,18 +439,25 @@ def run_evaluation(config_file, output_dir):
                                     csvdir,
                                     reset_index=True)
 
+    profiler.end_stage()
+
     # generate the report
     logger.info('Starting report generation')
-    create_report(experiment_id, description,
-                  '', '',
-                  '', predictions_file_location,
-                  csvdir, figdir,
-                  subgroups,
-                  None,
-                  second_human_score_column,
-                  chosen_notebook_files,
-                  exclude_zero_scores=exclude_zero_scores,
-                  use_scaled_predictions=use_scaled_predictions)
+    profiler.start_stage('report')
+    section_times = create_report(experiment_id, description,
+                                  '', '',
+                                  '', predictions_file_location,
+                                  csvdir, figdir,
+                                  subgroups,
+                                  None,
+                                  second_human_score_column,
+                                  chosen_notebook_files,
+                                  exclude_zero_scores=exclude_zero_scores,
+                                  use_scaled_predictions=use_scaled_predictions,
+                                  report_cache_dir=report_cache_dir)
+    profiler.end_stage(sections=len(chosen_notebook_files))
+    profiler.add_report_sections('report', section_times)
+    profiler.save(experiment_id, csvdir)
 
 
 def main():
@@ -456,6 +488,12 @@ def main():
                         help="The output directory where all the files "
                              "for this experiment will be stored")
 
+    parser.add_argument('--profile', dest='profile',
+                        action='store_true', default=False,
+                        help="If true, rsmeval will save the time and "
+                             "memory used by each stage of the experiment "
+                             "in the output directory.")
+
     # parse given command line arguments
     args = parser.parse_args()
     logger.info('Output directory: {}'.format(args.output_dir))
@@ -489,7 +527,7 @@ def main():
                                 "found.".format(config_file))
 
     # run the evaluation experiment
-    run_evaluation(config_file, output_dir)
+    run_evaluation(config_file, output_dir, profile=args.profile)
 
 if __name__ == '__main__':
     main()
@@ -21,26 +21,37 @@ import numpy as np
 import pandas as pd
 
 from rsmtool.input import (check_main_config,
+                           get_data_columns,
                            locate_file,
+                           read_data_file,
                            read_json_file,
                            rename_default_columns,
                            check_flag_column)
 from rsmtool.predict import predict_with_model
-from rsmtool.preprocess import (filter_on_column,
-                                preprocess_feature,
+from rsmtool.preprocess import (FeaturePreprocessor,
+                                filter_on_numeric_columns,
                                 trim)
+from rsmtool.profiling import Profiler
 from rsmtool.utils import LogFormatter
 
 from skll import Learner
 
-def compute_and_save_predictions(config_file, output_file, feats_file):
+def compute_and_save_predictions(config_file, output_file, feats_file,
+                                 chunksize=None, profile=False):
     """
     Generate predictions using the information in the config file
-    and save them into the given output file.
+    and save them into the given output file. If `chunksize` is
+    specified, the input file is read and processed that many
+    responses at a time and the results are appended to the
+    output files so that the memory usage stays bounded.
+    If `profile` is True, the time and memory used by each
+    stage are saved next to the output file.
     """
 
     logger = logging.getLogger(__name__)
 
+    profiler = Profiler(enabled=profile)
+
     # read in the main config file
     config_obj = read_json_file(config_file)
     config_obj = check_main_config(config_obj, context='rsmpredict')
@@ -81,11 +92,173 @@ def compute_and_save_predictions(config_file, output_file, feats_file):
     experiment_dir = locate_file(config_obj['experiment_dir'], configpath)
     if not experiment_dir:
         raise FileNotFoundError('The directory {} does not exist.'.format(config_obj['experiment_dir']))
+
+    # load the pre-processing parameters, the model
+    # and the post-processing parameters
+    profiler.start_stage('model')
+    (preprocessor,
+     model,
+     df_postproc_params) = load_experiment_files(experiment_dir, experiment_id)
+    required_features = preprocessor.features
+    profiler.end_stage(features=len(required_features))
+
+    # read in the given features but make sure that all of the other
+    # columns (e.g., the `id_column`, `candidate_column`, subgroups and
+    # human scores) are read in as strings so that they are copied to
+    # the output files exactly as they appear in the input file.
+    # We only read in the columns that are used for the predictions
+    # or copied to the output files; any of the columns specified in
+    # the config file that are missing will be caught when we check
+    # the columns of the first chunk.
+    # If we were given a chunk size, we read in and process that many
+    # responses at a time to keep the memory usage bounded and append
+    # the results for each chunk to the output files. Since the types
+    # of the columns are not inferred separately for each chunk and
+    # the parameters used to clamp the features with a training mean
+    # or standard deviation of zero are computed on all of the responses
+    # first, the results are the same as when we process all of the
+    # responses at once.
+    logger.info('Reading features from {}'.format(input_features_file))
+    profiler.start_stage('predict')
+    input_columns = get_data_columns(input_features_file)
+    metadata_columns = ([id_column, human_score_column, second_human_score_column,
+                         candidate_column] + subgroups + list(flag_column_dict.keys()))
+    string_columns = [column for column in input_columns
+                      if column in metadata_columns and column not in required_features]
+    usecols = [column for column in input_columns
+               if column in metadata_columns or column in required_features]
+
+    if chunksize:
+        logger.info('Generating predictions for {} responses at a time'.format(chunksize))
+        input_chunks = read_data_file(input_features_file,
+                                      string_columns=string_columns,
+                                      usecols=usecols,
+                                      chunksize=chunksize)
     else:
-        experiment_output_dir = normpath(join(experiment_dir, 'output'))
-        if not exists(experiment_output_dir):
-            raise FileNotFoundError('The directory {} does not contain '
-                                    'the output of an rsmtool experiment.'.format(experiment_dir))
+        input_chunks = [read_data_file(input_features_file,
+                                       string_columns=string_columns,
+                                       usecols=usecols)]
+
+    # create any directories needed for the output files
+    os.makedirs(dirname(output_file), exist_ok=True)
+    if feats_file:
+        logger.info('Saving pre-processed feature values to {}'.format(feats_file))
+        os.makedirs(dirname(feats_file), exist_ok=True)
+
+    excluded_output_file = '{}_excluded_responses{}'.format(*splitext(output_file))
+    logger.info('Saving predictions to {}'.format(output_file))
+
+    seen_ids = set()
+    columns_to_copy = None
+
+    # the outliers for the features with a training mean or standard
+    # deviation of zero are clamped using the mean and standard deviation
+    # of the data itself, so we compute these on all of the responses
+    # with numeric feature values before processing any of the chunks
+    if chunksize and len(preprocessor.fallback_columns):
+        logger.info('Computing the clamping parameters for the features '
+                    'with a training mean or standard deviation of 0')
+        fallback_features = [required_features[idx] for idx in preprocessor.fallback_columns]
+        fallback_values = []
+        for df_input in read_data_file(input_features_file,
+                                       string_columns=string_columns,
+                                       usecols=usecols,
+                                       chunksize=chunksize):
+            if columns_to_copy is None:
+                columns_to_copy = check_input_columns(df_input,
+                                                      id_column,
+                                                      human_score_column,
+                                                      second_human_score_column,
+                                                      candidate_column,
+                                                      subgroups,
+                                                      flag_column_dict,
+                                                      required_features)
+            df_filtered, _ = filter_on_numeric_columns(df_input[required_features],
+                                                       required_features)
+            fallback_values.append(df_filtered[fallback_features].values.astype(np.float64))
+        preprocessor.fit_fallback_parameters(np.concatenate(fallback_values))
+
+    num_predictions = 0
+    num_excluded = 0
+    num_chunks = 0
+    for df_input in input_chunks:
+        num_chunks += 1
+
+        # check the columns using the first chunk since
+        # all of the chunks have the same columns
+        if columns_to_copy is None:
+            columns_to_copy = check_input_columns(df_input,
+                                                  id_column,
+                                                  human_score_column,
+                                                  second_human_score_column,
+                                                  candidate_column,
+                                                  subgroups,
+                                                  flag_column_dict,
+                                                  required_features)
+
+        (df_predictions_with_metadata,
+         df_features_preprocessed,
+         df_excluded) = predict_for_input(df_input,
+                                          model,
+                                          preprocessor,
+                                          df_postproc_params,
+                                          id_column,
+                                          human_score_column,
+                                          second_human_score_column,
+                                          candidate_column,
+                                          columns_to_copy,
+                                          seen_ids)
+
+        # save the pre-processed features and the predictions
+        # for this chunk, writing the header only once
+        if not df_predictions_with_metadata.empty:
+            if feats_file:
+                df_features_preprocessed.to_csv(feats_file,
+                                                index=False,
+                                                mode='a' if num_predictions else 'w',
+                                                header=not num_predictions)
+            df_predictions_with_metadata.to_csv(output_file,
+                                                index=False,
+                                                mode='a' if num_predictions else 'w',
+                                                header=not num_predictions)
+            num_predictions += len(df_predictions_with_metadata)
+
+        # save the excluded responses for this chunk
+        if not df_excluded.empty:
+            df_excluded.to_csv(excluded_output_file,
+                               index=False,
+                               mode='a' if num_excluded else 'w',
+                               header=not num_excluded)
+            num_excluded += len(df_excluded)
+
+    if num_excluded:
+        logger.info('Saved {} excluded responses to {}'.format(num_excluded,
+                                                                excluded_output_file))
+    profiler.end_stage(responses=num_predictions + num_excluded,
+                       excluded_responses=num_excluded,
+                       chunks=num_chunks)
+
+    # make sure that we generated at least one prediction
+    if num_predictions == 0:
+        raise ValueError("There are no responses left after "
+                         "filtering out non-numeric feature values. No analysis "
+                         "will be run")
+
+    profiler.save(experiment_id, dirname(output_file))
+
+
+def load_experiment_files(experiment_dir, experiment_id):
+    """
+    Check that the given directory contains the output of the rsmtool
+    experiment with the given ID and load the files needed to generate
+    new predictions. Returns the feature pre-processor, the SKLL model
+    and the data frame with the post-processing parameters.
+    """
+
+    experiment_output_dir = normpath(join(experiment_dir, 'output'))
+    if not exists(experiment_output_dir):
+        raise FileNotFoundError('The directory {} does not contain '
+                                'the output of an rsmtool experiment.'.format(experiment_dir))
 
     # find all the .model files in the experiment output directory
     model_files = glob.glob(join(experiment_output_dir, '*.model'))
@@ -109,13 +282,35 @@ def compute_and_save_predictions(config_file, output_file, feats_file):
                                     'original model training'.format(experiment_output_dir,
                                                                      expected_file_name))
 
-    # read in the given features but make sure that the
-    # `id_column`, `candidate_column` and subgroups are read in as a string
-    logger.info('Reading features from {}'.format(input_features_file))
-    string_columns = [id_column, candidate_column] + subgroups
-    converter_dict = dict([(column, str) for column in string_columns if column])
+    # now we need to pre-process these features using
+    # the parameters that are already stored in the
+    # _features.csv file.
+    preprocessor = FeaturePreprocessor.from_file(join(experiment_output_dir,
+                                                      '{}_feature.csv'.format(experiment_id)))
+
+    # now load the SKLL model to generate the predictions
+    model = Learner.from_file(join(experiment_output_dir, '{}.model'.format(experiment_id)))
+
+    # read in the post-processing parameters from disk
+    df_postproc_params = pd.read_csv(join(experiment_output_dir, '{}_postprocessing_params.csv'.format(experiment_id)))
+
+    return preprocessor, model, df_postproc_params
+
 
-    df_input = pd.read_csv(input_features_file, converters=converter_dict)
+def check_input_columns(df_input,
+                        id_column,
+                        human_score_column,
+                        second_human_score_column,
+                        candidate_column,
+                        subgroups,
+                        flag_column_dict,
+                        required_features):
+    """
+    Check that the columns specified in the config file and
+    all of the features needed by the model exist in the given
+    input data frame and return the list of the columns that
+    should be copied to the predictions file.
+    """
 
     # make sure that the columns specified in the config file actually exist
     columns_to_check = [id_column] + subgroups + list(flag_column_dict.keys())
@@ -148,6 +343,38 @@ def compute_and_save_predictions(config_file, output_file, feats_file):
         raise KeyError("Columns {} from the config file "
                        "do not exist in the data.".format(missing_columns))
 
+    # ensure that all the features that are needed by the model
+    # are present in the input file
+    input_feature_columns = [c for c in df_input if c != id_column]
+    missing_features = set(required_features).difference(input_feature_columns)
+    if missing_features:
+        raise KeyError('The input file is missing the following features: {}'.format(missing_features))
+    extra_features = set(input_feature_columns).difference(required_features + [id_column])
+    if extra_features:
+        logging.warning('The following extraenous features will be ignored: {}'.format(extra_features))
+
+    return columns_to_copy
+
+
+def predict_for_input(df_input,
+                      model,
+                      preprocessor,
+                      df_postproc_params,
+                      id_column,
+                      human_score_column,
+                      second_human_score_column,
+                      candidate_column,
+                      columns_to_copy,
+                      seen_ids):
+    """
+    Pre-process the features in the given input data frame,
+    generate the predictions and post-process them. The IDs
+    of the responses are added to the set `seen_ids` so that
+    repeated IDs are detected across chunks. Returns the
+    predictions with the metadata columns, the pre-processed
+    features and the excluded responses.
+    """
+
     # rename all columns
     df_input = rename_default_columns(df_input,
                                       [],
@@ -159,30 +386,13 @@ def compute_and_save_predictions(config_file, output_file, feats_file):
                                       candidate_column=candidate_column)
 
     # check that the id_column contains unique values
-    if df_input['spkitemid'].size != df_input['spkitemid'].unique().size:
+    num_seen_ids = len(seen_ids)
+    seen_ids.update(df_input['spkitemid'])
+    if len(seen_ids) - num_seen_ids != df_input['spkitemid'].size:
         raise ValueError("The data contains repeated response IDs in {}. Please make sure all response IDs are unique and re-run the tool.".format(id_column))
 
-
-
-    # now we need to pre-process these features using
-    # the parameters that are already stored in the
-    # _features.csv file.
-    df_feature_info = pd.read_csv(join(experiment_output_dir,
-                                       '{}_feature.csv'.format(experiment_id)),
-                                  index_col=0)
-    required_features = df_feature_info.index.tolist()
-
-    # ensure that all the features that are needed by the model
-    # are present in the input file
-    input_feature_columns = [c for c in df_input if c != id_column]
-    missing_features = set(required_features).difference(input_feature_columns)
-    if missing_features:
-        raise KeyError('{} is missing the following features: {}'.format(feats_file, missing_features))
-    extra_features = set(input_feature_columns).difference(required_features + [id_column])
-    if extra_features:
-        logging.warning('The following extraenous features will be ignored: {}'.format(extra_features))
-
     # keep the required features plus the id
+    required_features = preprocessor.features
     features_to_keep = ['spkitemid'] + required_features
 
     # check if actually have the human scores for this data and add
@@ -193,77 +403,19 @@ def compute_and_save_predictions(config_file, output_file, feats_file):
 
     df_features = df_input[features_to_keep]
 
-    # preprocess the feature values
-    logger.info('Pre-processing input features')
-
     # first we need to filter out NaNs and any other
     # weird features, the same way we did for rsmtool.
-    df_filtered = df_features.copy()
-    df_excluded = pd.DataFrame(columns=df_filtered.columns)
-
-    for feature_name in required_features:
-        newdf, newdf_excluded = filter_on_column(df_filtered, feature_name, 'spkitemid',
-                                                 exclude_zeros=False,
-                                                 exclude_zero_sd=False)
-        del df_filtered
-        df_filtered = newdf
-        df_excluded = pd.merge(df_excluded, newdf_excluded, how='outer')
-
-    # make sure that the remaining data frame is not empty
-    if len(df_filtered) == 0:
-        raise ValueError("There are no responses left after "
-                         "filtering out non-numeric feature values. No analysis "
-                         "will be run")
-
-    df_features = df_filtered.copy()
-    df_features_preprocessed = df_features.copy()
-    for feature_name in required_features:
-
-        feature_values = df_features[feature_name].values
+    df_filtered, df_excluded = filter_on_numeric_columns(df_features, required_features)
+    if df_filtered.empty:
+        return pd.DataFrame(), pd.DataFrame(), df_excluded
 
-        feature_transformation = df_feature_info.loc[feature_name]['transform']
-        feature_weight = df_feature_info.loc[feature_name]['sign']
-
-        train_feature_mean = df_feature_info.loc[feature_name]['train_mean']
-        train_feature_sd = df_feature_info.loc[feature_name]['train_sd']
-
-        train_transformed_mean = df_feature_info.loc[feature_name]['train_transformed_mean']
-        train_transformed_sd = df_feature_info.loc[feature_name]['train_transformed_sd']
-
-        # transform the feature values and remove outliers
-        df_features_preprocessed[feature_name] = preprocess_feature(feature_values,
-                                                                    feature_name,
-                                                                    feature_transformation,
-                                                                    train_feature_mean,
-                                                                    train_feature_sd,
-                                                                    exclude_zero_sd=False)
-
-        # now standardize the feature values
-        df_features_preprocessed[feature_name] = (df_features_preprocessed[feature_name] - train_transformed_mean) / train_transformed_sd
-
-        # Multiply features by weight. Within the
-        # current SR timeline, the mean of the transformed train
-        # feature used to standardize test features has to be
-        # computed before multiplying the train feature by the weight.
-        df_features_preprocessed[feature_name] = df_features_preprocessed[feature_name] * feature_weight
-
-    # save the pre-processed features to disk if we were asked to
-    if feats_file:
-        logger.info('Saving pre-processed feature values to {}'.format(feats_file))
-
-        # create any directories needed for the output file
-        os.makedirs(dirname(feats_file), exist_ok=True)
-        df_features_preprocessed.to_csv(feats_file, index=False)
-
-    # now load the SKLL model to generate the predictions
-    model = Learner.from_file(join(experiment_output_dir, '{}.model'.format(experiment_id)))
+    # transform the feature values, remove outliers and standardize
+    # them using the same pre-processing pipeline as rsmtool
+    df_features_preprocessed = preprocessor.transform(df_filtered)
 
     # now generate the predictions for the features using this model
-    logger.info('Generating predictions')
     df_predictions = predict_with_model(model, df_features_preprocessed)
 
-    # read in the post-processing parameters from disk
-    df_postproc_params = pd.read_csv(join(experiment_output_dir, '{}_postprocessing_params.csv'.format(experiment_id)))
     trim_min = df_postproc_params['trim_min'].values[0]
     trim_max = df_postproc_params['trim_max'].values[0]
     h1_mean = df_postproc_params['h1_mean'].values[0]
@@ -272,13 +424,11 @@ def compute_and_save_predictions(config_file, output_file, feats_file):
     train_predictions_sd = df_postproc_params['train_predictions_sd'].values[0]
 
     # now scale the predictions
-    logger.info('Rescaling predictions')
     scaled_predictions = (df_predictions['raw'] - train_predictions_mean) / train_predictions_sd
     scaled_predictions = scaled_predictions * h1_sd + h1_mean
     df_predictions['scale'] = scaled_predictions
 
     # trim and round the predictions
-    logger.info('Trimming and rounding predictions')
     df_predictions['raw_trim'] = trim(df_predictions['raw'], trim_min, trim_max)
     df_predictions['raw_trim_round'] = np.rint(df_predictions['raw_trim']).astype('int64')
     df_predictions['scale_trim'] = trim(df_predictions['scale'], trim_min, trim_max)
@@ -292,18 +442,7 @@ def compute_and_save_predictions(config_file, output_file, feats_file):
     else:
         df_predictions_with_metadata = df_predictions.copy()
 
-    # create any directories needed for the output file
-    os.makedirs(dirname(output_file), exist_ok=True)
-
-    # save the predictions to disk
-    logger.info('Saving predictions to {}'.format(output_file))
-    df_predictions_with_metadata.to_csv(output_file, index=False)
-
-    # save excluded responses to disk
-    if not df_excluded.empty:
-        excluded_output_file = '{}_excluded_responses{}'.format(*splitext(output_file))
-        logger.info('Saving excluded responses to {}'.format(excluded_output_file))
-        df_excluded.to_csv(excluded_output_file, index=False)
+    return df_predictions_with_metadata, df_features_preprocessed, df_excluded
 
 
 def main():
@@ -333,6 +472,20 @@ def main():
                         required=False,
                         default=None)
 
+    parser.add_argument('--chunksize', dest='chunksize', type=int,
+                        help="Read and process the input file this many "
+                             "responses at a time and append the results "
+                             "to the output files, to keep the memory "
+                             "usage bounded for very large files",
+                        required=False,
+                        default=None)
+
+    parser.add_argument('--profile', dest='profile',
+                        action='store_true', default=False,
+                        help="If true, rsmpredict will save the time and "
+                             "memory used by each stage next to the "
+                             "output file.")
+
     # parse given command line arguments
     args = parser.parse_args()
 
@@ -347,7 +500,9 @@ def main():
     # generate and save the predictions
     compute_and_save_predictions(config_file,
                                  output_file,
-                                 preproc_feats_file)
+                                 preproc_feats_file,
+                                 chunksize=args.chunksize,
+                                 profile=args.profile)
 
 if __name__ == '__main__':
     main()
@@ -11,8 +11,11 @@ The main RSMTool script.
 import argparse
 import logging
 import os
+import shutil
 import sys
 
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
 from os import listdir
 from os.path import abspath, exists, join
 
@@ -21,34 +24,247 @@ import pandas as pd
 from rsmtool.analysis import (run_training_analyses,
                               run_prediction_analyses,
                               run_data_composition_analyses_for_rsmtool)
-from rsmtool.input import load_experiment_data
-from rsmtool.model import train_model
+from rsmtool.input import get_experiment_fingerprint, load_experiment_data
+from rsmtool.model import create_scoring_model, train_model
 from rsmtool.predict import generate_train_and_test_predictions
 from rsmtool.preprocess import preprocess_train_and_test_features
-from rsmtool.report import create_report
-from rsmtool.utils import (scale_coefficients,
+from rsmtool.profiling import Profiler
+from rsmtool.report import create_report, hash_files
+from rsmtool.utils import (get_output_files,
+                           load_checkpoint,
+                           read_binary_frame,
+                           remove_checkpoint,
+                           save_checkpoint,
+                           scale_coefficients,
                            write_experiment_output,
                            write_feature_json)
 from rsmtool.utils import LogFormatter
 
-def run_experiment(config_file, output_dir):
+# the data frames returned by the data stage that it also saves to the
+# output directory, along with the suffixes of their files; these are
+# read back from the binary files when the experiment is resumed rather
+# than being saved again in the checkpoint
+data_stage_frames = {'df_train_features': 'train_features',
+                     'df_train_metadata': 'train_metadata',
+                     'df_train_preprocessed_features': 'train_preprocessed_features',
+                     'df_train_length': 'train_response_lengths',
+                     'df_test_preprocessed_features': 'test_preprocessed_features',
+                     'df_test_metadata': 'test_metadata',
+                     'df_test_human_scores': 'test_human_scores'}
+
+
+def run_experiment(config_file, output_dir, resume=False, profile=False):
     """
     Run RSMTool experiment using the given configuration
     file and generate all outputs in the given directory.
+    The experiment is run in stages and the results of each
+    stage are saved in the `checkpoints` sub-directory. If
+    `resume` is True, the stages that have already been
+    completed with the same inputs are not run again.
+    If `profile` is True, the time and memory used by
+    each stage are saved in the `_timings` files.
+    """
+
+    profiler = Profiler(enabled=profile)
+
+    # compute the fingerprint of the inputs of the experiment
+    # that is used to check whether the saved stages are still valid
+    checkpoint_dir = abspath(join(output_dir, 'checkpoints'))
+    fingerprint = get_experiment_fingerprint(config_file)
+
+    # load and pre-process the data and run the data composition analyses
+    profiler.start_stage('data')
+    (experiment_data,
+     resumed) = run_stage('data', prepare_experiment_data,
+                          (config_file, output_dir),
+                          output_dir, checkpoint_dir, fingerprint,
+                          resume=resume,
+                          saved_frames=data_stage_frames)
+
+    experiment_id = experiment_data['experiment_id']
+    model_name = experiment_data['model_name']
+    model_names = experiment_data['model_names']
+    model_types = experiment_data['model_types']
+    model_output_dirs = experiment_data['model_output_dirs']
+    model_notebook_files = experiment_data['model_notebook_files']
+    profiler.end_stage(resumed=resumed,
+                       train_responses=len(experiment_data['df_train_features']),
+                       test_responses=len(experiment_data['df_test_metadata']),
+                       features=len(experiment_data['feature_specs']['features']))
+
+    # train the appropriate models. This is done before the
+    # descriptive analyses since for models with feature
+    # selection we only do the analysis for the
+    # features selected for the final model
+    profiler.start_stage('train')
+    (models,
+     resumed) = run_stage('train', train_models,
+                          (model_names,
+                           experiment_data['df_train_preprocessed_features'],
+                           experiment_id,
+                           model_output_dirs,
+                           experiment_data['n_jobs']),
+                          output_dir, checkpoint_dir, fingerprint,
+                          resume=resume and resumed)
+    profiler.end_stage(resumed=resumed, models=len(models))
+
+    # run the analyses for each model and generate its report;
+    # the training set analyses only depend on the features
+    # so they are shared by the models with the same features
+    training_analyses_cache = {}
+    eval_short_frames = []
+    for (model,
+         name,
+         mtype,
+         model_output_dir,
+         notebook_files) in zip(models,
+                                model_names,
+                                model_types,
+                                model_output_dirs,
+                                model_notebook_files):
+        stage_suffix = '_{}'.format(name) if isinstance(model_name, list) else ''
+        profiler.start_stage('analyses{}'.format(stage_suffix))
+        (df_eval_short,
+         analyses_resumed) = run_stage('analyses{}'.format(stage_suffix),
+                                       run_model_analyses,
+                                       (model, name, model_output_dir,
+                                        experiment_id,
+                                        experiment_data['feature_specs'],
+                                        experiment_data['df_feature_info'],
+                                        experiment_data['df_train_features'],
+                                        experiment_data['df_train_metadata'],
+                                        experiment_data['df_train_preprocessed_features'],
+                                        experiment_data['df_train_length'],
+                                        experiment_data['df_test_preprocessed_features'],
+                                        experiment_data['df_test_metadata'],
+                                        experiment_data['df_test_human_scores'],
+                                        experiment_data['length_column'],
+                                        experiment_data['second_human_score_column'],
+                                        experiment_data['subgroups'],
+                                        experiment_data['used_trim_min'],
+                                        experiment_data['used_trim_max'],
+                                        experiment_data['use_scaled_predictions'],
+                                        experiment_data['exclude_zero_scores'],
+                                        experiment_data['select_features_automatically'],
+                                        training_analyses_cache),
+                                       output_dir, checkpoint_dir, fingerprint,
+                                       resume=resume and resumed)
+        eval_short_frames.append(df_eval_short)
+        profiler.end_stage(resumed=analyses_resumed)
+
+        # the report also depends on the contents of the notebooks
+        # for its sections, including any custom sections, so that
+        # it is generated again if any of them have been changed
+        report_stage = 'report{}'.format(stage_suffix)
+        report_fingerprint = '{}-{}'.format(fingerprint, hash_files(notebook_files))
+        profiler.start_stage(report_stage)
+        (section_times,
+         report_resumed) = run_stage(report_stage,
+                                     create_model_report,
+                                     (experiment_id,
+                                      experiment_data['description'],
+                                      name, mtype, model_output_dir,
+                                      experiment_data['train_file_location'],
+                                      experiment_data['test_file_location'],
+                                      experiment_data['subgroups'],
+                                      experiment_data['length_column'],
+                                      experiment_data['second_human_score_column'],
+                                      experiment_data['feature_subset_file'],
+                                      notebook_files,
+                                      experiment_data['exclude_zero_scores'],
+                                      experiment_data['use_scaled_predictions'],
+                                      experiment_data['report_cache_dir']),
+                                     output_dir, checkpoint_dir, report_fingerprint,
+                                     resume=resume and analyses_resumed)
+        profiler.end_stage(resumed=report_resumed)
+        if not report_resumed:
+            profiler.add_report_sections(report_stage, section_times)
+
+    # save the short evaluation metrics for all of the models
+    # into a single table so that they can be compared
+    if isinstance(model_name, list):
+        logging.getLogger(__name__).info('Saving the evaluation metrics for all models to disk')
+        df_model_comparison = pd.concat(eval_short_frames,
+                                        keys=model_names,
+                                        names=['model', None])
+        df_model_comparison.reset_index(level='model', inplace=True)
+        write_experiment_output([df_model_comparison],
+                                ['model_comparison'],
+                                experiment_id,
+                                abspath(join(output_dir, 'output')))
+
+    profiler.save(experiment_id, abspath(join(output_dir, 'output')))
+
+
+def run_stage(stage, function, args, output_dir,
+              checkpoint_dir, fingerprint, resume=False,
+              saved_frames=None):
+    """
+    Run the given stage of the experiment by calling `function` with
+    the given arguments and save its results and the list of the files
+    it wrote under `output_dir` as a checkpoint. If `resume` is True
+    and the stage has already been completed with the inputs that have
+    the given fingerprint, its saved results are returned instead.
+    If `saved_frames` is given, the results are a dictionary and the
+    data frames under its keys are not saved in the checkpoint since
+    the stage has already saved them to the binary files with the
+    given suffixes. Returns the results and whether they were taken
+    from the checkpoint.
     """
 
     logger = logging.getLogger(__name__)
 
-    # create the 'output' and the 'figure' sub-directories
-    # where all the experiment output such as the CSV files
-    # and the box plots will be saved
+    if resume:
+        found, results = load_checkpoint(checkpoint_dir, stage, fingerprint, output_dir)
+        if found:
+            logger.info('Skipping the {} stage that has already been '
+                        'completed'.format(stage))
+            if saved_frames:
+                results = dict(results)
+                for key in saved_frames:
+                    if isinstance(results[key], str):
+                        results[key] = read_binary_frame(join(output_dir, results[key]))
+            return results, True
+
+    # remove the previous checkpoint for the stage first so that
+    # it is not used if the stage fails while it is being run
+    remove_checkpoint(checkpoint_dir, stage)
+    output_files_before = get_output_files(output_dir, exclude_dir=checkpoint_dir)
+    results = function(*args)
+    output_files = dict((filename, file_info[0]) for filename, file_info
+                        in get_output_files(output_dir, exclude_dir=checkpoint_dir).items()
+                        if output_files_before.get(filename) != file_info)
+
+    # save the paths of the binary files instead of the data frames
+    # that have already been saved; the empty data frames are not
+    # saved to disk so these are kept in the checkpoint
+    checkpoint_results = results
+    if saved_frames:
+        checkpoint_results = dict(results)
+        for key, suffix in saved_frames.items():
+            if not results[key].empty:
+                checkpoint_results[key] = join('output',
+                                               '{}_{}.npz'.format(results['experiment_id'],
+                                                                  suffix))
+    save_checkpoint(checkpoint_dir, stage, fingerprint, checkpoint_results, output_files)
+    return results, False
+
+
+def prepare_experiment_data(config_file, output_dir):
+    """
+    Load the experiment data, pre-process the features, save them
+    along with the data composition analyses and prepare the output
+    directories for the models. Returns a dictionary with all of the
+    data and the settings needed for the other stages.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # create the 'output' sub-directory where the model-independent
+    # experiment output such as the CSV files will be saved; the
+    # directories for the model outputs are created later
     csvdir = abspath(join(output_dir, 'output'))
-    figdir = abspath(join(output_dir, 'figure'))
-    reportdir = abspath(join(output_dir, 'report'))
-    featuredir = abspath(join(output_dir, 'feature'))
     os.makedirs(csvdir, exist_ok=True)
-    os.makedirs(figdir, exist_ok=True)
-    os.makedirs(reportdir, exist_ok=True)
 
     # load the experiment data
     logger.info('Loading experiment data')
@@ -70,7 +286,10 @@ def run_experiment(config_file, output_dir):
      use_scaled_predictions,
      exclude_zero_scores,
      select_features_automatically,
-     chosen_notebook_files) = load_experiment_data(config_file, output_dir)
+     chosen_notebook_files,
+     n_jobs,
+     report_cache_dir,
+     transform_cache) = load_experiment_data(config_file, output_dir)
 
     # preprocess each feature for the training and testing data
     logger.info('Pre-processing training and test set features')
@@ -78,7 +297,8 @@ def run_experiment(config_file, output_dir):
      df_test_preprocessed_features,
      df_feature_info) = preprocess_train_and_test_features(df_train_features,
                                                            df_test_features,
-                                                           feature_specs)
+                                                           feature_specs,
+                                                           transform_cache=transform_cache)
 
     logger.info('Saving training and test set data to disk')
     write_experiment_output([df_train_features, df_test_features,
@@ -109,7 +329,8 @@ def run_experiment(config_file, output_dir):
                              'train_responses_with_excluded_flags',
                              'test_responses_with_excluded_flags'],
                             experiment_id,
-                            csvdir)
+                            csvdir,
+                            write_binary=True)
 
     # do the data composition stats
     features = [column for column in df_train_features.columns if column not in ['spkitemid', 'sc1']]
@@ -124,12 +345,26 @@ def run_experiment(config_file, output_dir):
                                                                                  subgroups,
                                                                                  candidate_column,
                                                                                  exclude_zero_scores=exclude_zero_scores)
+    # save the number of responses in the original data files so
+    # that the report does not have to read these files again; each
+    # response was either used or excluded in one of the filtering steps
+    df_original_responses = pd.DataFrame({'partition': ['Training', 'Evaluation'],
+                                          'responses': [len(df_train_features) +
+                                                        len(df_train_excluded) +
+                                                        len(df_train_flagged_responses),
+                                                        len(df_test_features) +
+                                                        len(df_test_excluded) +
+                                                        len(df_test_flagged_responses)]},
+                                         columns=['partition', 'responses'])
+
     write_experiment_output([df_train_excluded_analysis,
                              df_test_excluded_analysis,
-                             df_data_composition],
+                             df_data_composition,
+                             df_original_responses],
                             ['train_excluded_composition',
                              'test_excluded_composition',
-                             'data_composition'],
+                             'data_composition',
+                             'original_responses'],
                             experiment_id,
                             csvdir)
 
@@ -137,16 +372,137 @@ def run_experiment(config_file, output_dir):
     for group in subgroups:
         write_experiment_output([data_composition_by_group_dict[group]], ['data_composition_by_{}'.format(group)], experiment_id, csvdir)
 
-    # train the appropriate model. This is done before the
-    # descriptive analyses since for models with feature
-    # selection we only do the analysis for the
-    # features selected for the final model
-    logger.info('Training {} model'.format(model_name))
-    model = train_model(model_name,
-                        df_train_preprocessed_features,
-                        experiment_id,
-                        csvdir,
-                        figdir)
+    # if we were given a list of models, then we train all of them on
+    # the same pre-processed data and save the outputs for each model
+    # in a separate sub-directory, along with the shared outputs
+    if isinstance(model_name, list):
+        model_names, model_types = model_name, model_type
+        model_output_dirs = [join(output_dir, name) for name in model_names]
+        for model_output_dir in model_output_dirs:
+            link_shared_output(csvdir, join(model_output_dir, 'output'))
+        model_notebook_files = chosen_notebook_files
+    else:
+        model_names, model_types = [model_name], [model_type]
+        model_output_dirs = [output_dir]
+        model_notebook_files = [chosen_notebook_files]
+
+    return {'experiment_id': experiment_id,
+            'description': description,
+            'train_file_location': train_file_location,
+            'test_file_location': test_file_location,
+            'feature_specs': feature_specs,
+            'model_name': model_name,
+            'model_names': model_names,
+            'model_types': model_types,
+            'model_output_dirs': model_output_dirs,
+            'model_notebook_files': model_notebook_files,
+            'df_feature_info': df_feature_info,
+            'df_train_features': df_train_features,
+            'df_train_metadata': df_train_metadata,
+            'df_train_preprocessed_features': df_train_preprocessed_features,
+            'df_train_length': df_train_length,
+            'df_test_preprocessed_features': df_test_preprocessed_features,
+            'df_test_metadata': df_test_metadata,
+            'df_test_human_scores': df_test_human_scores,
+            'length_column': length_column,
+            'second_human_score_column': second_human_score_column,
+            'subgroups': subgroups,
+            'feature_subset_file': feature_subset_file,
+            'used_trim_min': used_trim_min,
+            'used_trim_max': used_trim_max,
+            'use_scaled_predictions': use_scaled_predictions,
+            'exclude_zero_scores': exclude_zero_scores,
+            'select_features_automatically': select_features_automatically,
+            'n_jobs': n_jobs,
+            'report_cache_dir': report_cache_dir}
+
+
+def link_shared_output(csvdir, model_csvdir):
+    """
+    Make the model-independent files that have already been saved
+    in `csvdir` available in `model_csvdir` so that they can be
+    used for the report for each model. The files are hard-linked
+    if possible and copied otherwise.
+    """
+
+    os.makedirs(model_csvdir, exist_ok=True)
+    for filename in listdir(csvdir):
+        shared_file = join(csvdir, filename)
+        model_file = join(model_csvdir, filename)
+        if exists(model_file):
+            os.remove(model_file)
+        try:
+            os.link(shared_file, model_file)
+        except OSError:
+            shutil.copy2(shared_file, model_file)
+
+
+def train_models(model_names, df_train, experiment_id,
+                 model_output_dirs, n_jobs=1):
+    """
+    Train each of the given models on the given training data and save
+    it under the corresponding output directory. If there are multiple
+    models and jobs, the models are trained in parallel processes and
+    the jobs are divided between them. Returns the list of the trained
+    SKLL learners in the same order as the model names.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    csvdirs = [abspath(join(model_output_dir, 'output')) for model_output_dir in model_output_dirs]
+    figdirs = [abspath(join(model_output_dir, 'figure')) for model_output_dir in model_output_dirs]
+    for csvdir, figdir in zip(csvdirs, figdirs):
+        os.makedirs(csvdir, exist_ok=True)
+        os.makedirs(figdir, exist_ok=True)
+
+    total_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    num_workers = min(total_jobs, len(model_names))
+
+    # train the models one at a time using all of the jobs
+    if num_workers <= 1:
+        models = []
+        for model_name, csvdir, figdir in zip(model_names, csvdirs, figdirs):
+            logger.info('Training {} model'.format(model_name))
+            models.append(train_model(model_name, df_train, experiment_id,
+                                      csvdir, figdir, n_jobs=n_jobs))
+        return models
+
+    # otherwise train the models in parallel processes
+    logger.info('Training {} models using {} '
+                'processes'.format(', '.join(model_names), num_workers))
+    model_jobs = max(1, total_jobs // num_workers)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(train_model, model_name, df_train,
+                                   experiment_id, csvdir, figdir,
+                                   n_jobs=model_jobs)
+                   for model_name, csvdir, figdir in zip(model_names, csvdirs, figdirs)]
+        return [future.result() for future in futures]
+
+
+def run_model_analyses(model, model_name, model_output_dir,
+                       experiment_id,
+                       feature_specs, df_feature_info,
+                       df_train_features, df_train_metadata,
+                       df_train_preprocessed_features, df_train_length,
+                       df_test_preprocessed_features, df_test_metadata,
+                       df_test_human_scores,
+                       length_column, second_human_score_column,
+                       subgroups,
+                       used_trim_min, used_trim_max,
+                       use_scaled_predictions, exclude_zero_scores,
+                       select_features_automatically,
+                       training_analyses_cache=None):
+    """
+    Run the training set analyses for the features used by the given
+    trained model, generate and evaluate its predictions and save all
+    of the outputs under `model_output_dir`. Returns the data frame
+    with the short evaluation metrics.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    csvdir = abspath(join(model_output_dir, 'output'))
+    featuredir = abspath(join(model_output_dir, 'feature'))
 
     # identify the features used by the model
     selected_features = model.feat_vectorizer.get_feature_names()
@@ -175,8 +531,24 @@ def run_experiment(config_file, output_dir):
                             experiment_id,
                             csvdir)
 
-    # run the training set analyses
-    logger.info('Running analyses on training set')
+    # run the training set analyses unless we have already run
+    # them for another model that uses the same features; we keep
+    # copies since the data frames are modified when they are saved
+    training_analyses_key = tuple(selected_features)
+    if training_analyses_cache and training_analyses_key in training_analyses_cache:
+        logger.info('Re-using the training set analyses for the same features')
+        training_analyses = deepcopy(training_analyses_cache[training_analyses_key])
+    else:
+        logger.info('Running analyses on training set')
+        training_analyses = run_training_analyses(df_train_features,
+                                                  df_train_metadata,
+                                                  df_train_preprocessed_features,
+                                                  df_train_length,
+                                                  length_column,
+                                                  selected_features,
+                                                  subgroups)
+        if training_analyses_cache is not None:
+            training_analyses_cache[training_analyses_key] = deepcopy(training_analyses)
 
     (df_descriptives,
      df_percentiles,
@@ -191,13 +563,7 @@ def run_experiment(config_file, output_dir):
      score_correlation_by_group_dict,
      length_correlation_by_group_dict,
      df_pca_components,
-     df_pca_variance) = run_training_analyses(df_train_features,
-                                              df_train_metadata,
-                                              df_train_preprocessed_features,
-                                              df_train_length,
-                                              length_column,
-                                              selected_features,
-                                              subgroups)
+     df_pca_variance) = training_analyses
 
     write_experiment_output([df_descriptives,
                              df_percentiles,
@@ -288,7 +654,18 @@ def run_experiment(config_file, output_dir):
                              'pred_processed',
                              'postprocessing_params'],
                             experiment_id,
-                            csvdir)
+                            csvdir,
+                            write_binary=True)
+
+    # save the lightweight scoring model that can be
+    # used to score new responses with the linear models
+    scoring_model = create_scoring_model(model,
+                                         df_selected_feature_info,
+                                         df_postproc_params,
+                                         experiment_id)
+    if scoring_model:
+        logger.info('Saving the scoring model to disk')
+        scoring_model.save(join(csvdir, '{}_scoring_model.json'.format(experiment_id)))
 
     # scale coefficients using the predictions and save them
     # into a separate file -
@@ -333,6 +710,9 @@ def run_experiment(config_file, output_dir):
                                               exclude_zero_scores=exclude_zero_scores,
                                               use_scaled_predictions=use_scaled_predictions)
 
+    # keep a copy of the short evaluation metrics to return
+    df_eval_short = df_human_machine_eval_short.copy()
+
     write_experiment_output([df_human_machine_eval,
                              df_human_machine_eval_short,
                              df_human_human_eval,
@@ -357,20 +737,47 @@ def run_experiment(config_file, output_dir):
                                  'consistency_by_{}'.format(group)],
                                 experiment_id, csvdir, reset_index=True)
 
-    # generate the report
+    return df_eval_short
+
+
+def create_model_report(experiment_id, description,
+                        model_name, model_type, model_output_dir,
+                        train_file_location, test_file_location,
+                        subgroups, length_column,
+                        second_human_score_column,
+                        feature_subset_file,
+                        chosen_notebook_files,
+                        exclude_zero_scores,
+                        use_scaled_predictions,
+                        report_cache_dir=None):
+    """
+    Generate the report for the given model from
+    the outputs saved under `model_output_dir` and
+    return the execution time for each section.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    csvdir = abspath(join(model_output_dir, 'output'))
+    figdir = abspath(join(model_output_dir, 'figure'))
+    reportdir = abspath(join(model_output_dir, 'report'))
+    os.makedirs(reportdir, exist_ok=True)
+
     logger.info('Starting report generation')
-    create_report(experiment_id, description,
-                  model_type, model_name,
-                  train_file_location,
-                  test_file_location,
-                  csvdir, figdir,
-                  subgroups,
-                  length_column,
-                  second_human_score_column,
-                  feature_subset_file=feature_subset_file,
-                  chosen_notebook_files=chosen_notebook_files,
-                  exclude_zero_scores=exclude_zero_scores,
-                  use_scaled_predictions=use_scaled_predictions)
+    return create_report(experiment_id, description,
+                         model_type, model_name,
+                         train_file_location,
+                         test_file_location,
+                         csvdir, figdir,
+                         subgroups,
+                         length_column,
+                         second_human_score_column,
+                         feature_subset_file=feature_subset_file,
+                         chosen_notebook_files=chosen_notebook_files,
+                         exclude_zero_scores=exclude_zero_scores,
+                         use_scaled_predictions=use_scaled_predictions,
+                         report_cache_dir=report_cache_dir)
+
 
 def main():
 
@@ -393,6 +800,19 @@ def main():
                              " output directory already contains the "
                              "output of another rsmtool experiment. ")
 
+    parser.add_argument('--resume', dest='resume',
+                        action='store_true', default=False,
+                        help="If true, rsmtool will skip the stages of "
+                             "the experiment that have already been "
+                             "completed in the output directory with "
+                             "the same configuration and data files.")
+
+    parser.add_argument('--profile', dest='profile',
+                        action='store_true', default=False,
+                        help="If true, rsmtool will save the time and "
+                             "memory used by each stage of the experiment "
+                             "in the output directory.")
+
     parser.add_argument('config_file', help="The JSON config file for "
                                             "this experiment")
 
@@ -409,10 +829,11 @@ def main():
     # `--force` was specified, in which case we assume
     # that the user knows what she is doing and simply
     # output a warning saying that the report might
-    # not be correct.
+    # not be correct. If `--resume` was specified, the
+    # output directory is expected to be non-empty.
     csvdir = join(args.output_dir, 'output')
     non_empty_csvdir = exists(csvdir) and listdir(csvdir)
-    if non_empty_csvdir:
+    if non_empty_csvdir and not args.resume:
         if not args.force_write:
             raise IOError("'{}' already contains a non-empty 'output' "
                           "directory.".format(args.output_dir))
@@ -433,7 +854,8 @@ def main():
                                 'not found.'.format(config_file))
 
     # run the experiment
-    run_experiment(config_file, output_dir)
+    run_experiment(config_file, output_dir, resume=args.resume,
+                   profile=args.profile)
 
 
 if __name__ == '__main__':
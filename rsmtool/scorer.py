@@ -0,0 +1,218 @@
+"""
+Lightweight scoring with exported linear RSMTool models.
+
+This module only depends on NumPy so that it can be loaded quickly
+by online scoring services. It scores responses using the scoring
+model file (`<experiment_id>_scoring_model.json`) that RSMTool saves
+for the linear built-in models, which contains all of the parameters
+needed to pre-process the features, generate the predictions and
+post-process them.
+
+:author: Nitin Madnani (nmadnani@ets.org)
+:author: Anastassia Loukina (aloukina@ets.org)
+:organization: ETS
+"""
+
+import json
+
+import numpy as np
+
+# the names of the post-processed scores, in the same order
+# as the columns of the predictions generated by rsmpredict
+score_names = ['raw',
+               'scale',
+               'raw_trim',
+               'raw_trim_round',
+               'scale_trim',
+               'scale_trim_round']
+
+
+class ScoringModel(object):
+    """
+    An exported linear scoring model. The features are pre-processed
+    the same way as by `rsmpredict`: they are clamped, transformed,
+    standardized and multiplied by their signs. The raw predictions
+    are the dot product of the pre-processed features and the
+    coefficients plus the intercept and they are then scaled and
+    trimmed using the post-processing parameters.
+    """
+
+    # the parameters that have one value per feature
+    feature_parameters = ['floors',
+                          'ceilings',
+                          'transformed_means',
+                          'transformed_sds',
+                          'signs',
+                          'coefficients']
+
+    # the scalar post-processing parameters
+    postprocessing_parameters = ['intercept',
+                                 'trim_min',
+                                 'trim_max',
+                                 'h1_mean',
+                                 'h1_sd',
+                                 'train_predictions_mean',
+                                 'train_predictions_sd']
+
+    def __init__(self, model_dict):
+        """
+        Create the scoring model from the given dictionary,
+        which has the same fields as the scoring model file.
+        """
+
+        self.experiment_id = model_dict.get('experiment_id')
+        self.features = list(model_dict['features'])
+        self.transforms = list(model_dict['transforms'])
+        for parameter in self.feature_parameters:
+            setattr(self, parameter, np.array(model_dict[parameter], dtype=np.float64))
+        for parameter in self.postprocessing_parameters:
+            setattr(self, parameter, float(model_dict[parameter]))
+
+        # group the features by transformation so that each
+        # transformation is applied to all of its features at once
+        self.transform_groups = {}
+        for idx, transform in enumerate(self.transforms):
+            if transform not in ['raw', 'org']:
+                self.transform_groups.setdefault(transform, []).append(idx)
+
+    @classmethod
+    def from_file(cls, model_file):
+        """
+        Load the scoring model from the given JSON file.
+        """
+        with open(model_file, 'r') as modelf:
+            return cls(json.load(modelf))
+
+    def to_dict(self):
+        """
+        Return the dictionary with all of the fields
+        of the scoring model file.
+        """
+        model_dict = {'experiment_id': self.experiment_id,
+                      'features': self.features,
+                      'transforms': self.transforms}
+        for parameter in self.feature_parameters:
+            model_dict[parameter] = getattr(self, parameter).tolist()
+        for parameter in self.postprocessing_parameters:
+            model_dict[parameter] = getattr(self, parameter)
+        return model_dict
+
+    def save(self, model_file):
+        """
+        Save the scoring model to the given JSON file.
+        """
+        with open(model_file, 'w') as modelf:
+            json.dump(self.to_dict(), modelf, indent=4, separators=(',', ': '))
+
+    def feature_matrix(self, responses):
+        """
+        Return the N x p array of feature values for the given
+        list of responses, each of which is a dictionary that
+        maps the feature names to their values.
+        """
+        return np.array([[response[feature] for feature in self.features]
+                         for response in responses], dtype=np.float64)
+
+    def preprocess(self, values):
+        """
+        Pre-process the given N x p array of feature values with
+        the columns in the same order as `features` and return
+        the pre-processed values as a new array.
+        """
+
+        values = np.array(values, dtype=np.float64, ndmin=2)
+
+        # clamp any outlier values that are 4 standard deviations
+        # away from the mean of the training set
+        np.clip(values, self.floors, self.ceilings, out=values)
+
+        # apply each of the transformations to all of its features
+        for transform, indices in self.transform_groups.items():
+            values[:, indices] = _transform(values[:, indices],
+                                            transform,
+                                            [self.features[idx] for idx in indices])
+
+        # standardize the values and multiply them by the signs
+        values -= self.transformed_means
+        values /= self.transformed_sds
+        values *= self.signs
+        return values
+
+    def predict(self, values):
+        """
+        Return the raw predictions for the given N x p
+        array of feature values.
+        """
+
+        preprocessed_values = self.preprocess(values)
+
+        # add up the products one feature at a time in the same
+        # order as the predictions generated by RSMTool
+        predictions = np.zeros(len(preprocessed_values))
+        for feature_values, coefficient in zip(preprocessed_values.T, self.coefficients):
+            predictions += feature_values * coefficient
+        predictions += self.intercept
+        return predictions
+
+    def score(self, values):
+        """
+        Return a dictionary with the raw, scaled, trimmed and
+        rounded scores for the given N x p array of feature values.
+        """
+
+        raw = self.predict(values)
+        scale = (raw - self.train_predictions_mean) / self.train_predictions_sd
+        scale = scale * self.h1_sd + self.h1_mean
+
+        raw_trim = self._trim(raw)
+        scale_trim = self._trim(scale)
+        return {'raw': raw,
+                'scale': scale,
+                'raw_trim': raw_trim,
+                'raw_trim_round': np.rint(raw_trim).astype('int64'),
+                'scale_trim': scale_trim,
+                'scale_trim_round': np.rint(scale_trim).astype('int64')}
+
+    def score_responses(self, responses):
+        """
+        Return a list with a dictionary of the scores
+        for each of the given response dictionaries.
+        """
+        scores = self.score(self.feature_matrix(responses))
+        return [dict((name, scores[name][idx].item()) for name in score_names)
+                for idx in range(len(responses))]
+
+    def _trim(self, values):
+        """
+        Trim the given values the same way as `rsmtool.preprocess.trim()`.
+        """
+        return np.clip(values, self.trim_min - 0.49998, self.trim_max + 0.49998)
+
+
+def _transform(values, transform, names):
+    """
+    Apply the given transformation to the N x p array of values for
+    the features with the given names. Unlike the transformations
+    used for training, the values are only checked individually
+    since the responses may be scored one at a time.
+    """
+
+    if transform in ['inv', 'log'] and np.any(values == 0):
+        raise ValueError("The {} transformation cannot be applied to a value "
+                         "of 0 for features {}".format(transform, ', '.join(names)))
+    if transform in ['sqrt', 'log', 'addOneInv', 'addOneLn'] and np.any(values < 0):
+        raise ValueError("The {} transformation cannot be applied to negative "
+                         "values for features {}".format(transform, ', '.join(names)))
+
+    if transform == 'inv':
+        return 1 / values
+    elif transform == 'sqrt':
+        return np.sqrt(values)
+    elif transform == 'log':
+        return np.log(values)
+    elif transform == 'addOneInv':
+        return 1 / (values + 1)
+    elif transform == 'addOneLn':
+        return np.log(values + 1)
+    else:
+        raise ValueError('Unrecognized feature transformation: {}'.format(transform))
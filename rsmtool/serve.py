@@ -0,0 +1,228 @@
+"""
+In-process scoring with existing RSMTool models, along with
+a simple local HTTP or JSON lines front end.
+
+:author: Nitin Madnani (nmadnani@ets.org)
+:author: Anastassia Loukina (aloukina@ets.org)
+:organization: ETS
+"""
+
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import sys
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os.path import abspath
+
+import pandas as pd
+
+from rsmtool.rsmpredict import load_experiment_files, predict_for_input
+from rsmtool.utils import LogFormatter
+
+
+class Scorer(object):
+    """
+    Score responses using existing rsmtool experiments. The files
+    for the most recently used experiments are kept in memory so
+    that repeated requests do not need to read the files or load
+    the models again.
+    """
+
+    def __init__(self, cache_size=8):
+        """
+        Create a scorer that keeps the files for
+        up to `cache_size` experiments in memory.
+        """
+        self.cache_size = cache_size
+        self._experiments = OrderedDict()
+
+    def load(self, experiment_dir, experiment_id):
+        """
+        Return the feature pre-processor, the SKLL model and the
+        post-processing parameters for the given experiment, loading
+        them from disk only if they are not already in the cache.
+        """
+
+        key = (abspath(experiment_dir), experiment_id)
+        if key in self._experiments:
+            self._experiments.move_to_end(key)
+        else:
+            self._experiments[key] = load_experiment_files(*key)
+
+            # evict the least recently used experiment
+            # if we have too many of them
+            if len(self._experiments) > self.cache_size:
+                self._experiments.popitem(last=False)
+
+        return self._experiments[key]
+
+    def score(self, experiment_dir, experiment_id, responses,
+              id_column='spkitemid'):
+        """
+        Score the given list of responses using the given experiment.
+        Each response is a dictionary with the ID of the response and
+        the feature values. Returns a list with a dictionary for each
+        response, in the same order, with the ID and either all of the
+        scores generated by `rsmpredict` or, if the response could not
+        be scored because of non-numeric feature values, an error.
+        """
+
+        (preprocessor,
+         model,
+         df_postproc_params) = self.load(experiment_dir, experiment_id)
+
+        # use the same pre-processing and post-processing as `rsmpredict`
+        columns = [id_column] + preprocessor.features
+        df_input = pd.DataFrame([dict((column, response.get(column)) for column in columns)
+                                 for response in responses],
+                                columns=columns)
+        df_input[id_column] = df_input[id_column].astype(str)
+        response_ids = df_input[id_column].tolist()
+        (df_predictions,
+         _,
+         df_excluded) = predict_for_input(df_input,
+                                          model,
+                                          preprocessor,
+                                          df_postproc_params,
+                                          id_column,
+                                          'sc1',
+                                          None,
+                                          None,
+                                          [],
+                                          set())
+
+        # return the results in the same order as the responses
+        results = dict((prediction['spkitemid'], prediction)
+                       for prediction in df_predictions.to_dict(orient='records'))
+        for response_id in df_excluded.get('spkitemid', []):
+            results[response_id] = {'spkitemid': response_id,
+                                    'error': 'non-numeric feature values'}
+        return [_json_values(results[response_id]) for response_id in response_ids]
+
+    def handle_request(self, request):
+        """
+        Handle the given request dictionary with the `experiment_dir`,
+        the `experiment_id`, the list of `responses` and, optionally,
+        the `id_column` and return the response dictionary with either
+        the list of `scores` or the `error`.
+        """
+        try:
+            scores = self.score(request['experiment_dir'],
+                                request['experiment_id'],
+                                request['responses'],
+                                id_column=request.get('id_column', 'spkitemid'))
+        except Exception as e:
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+        else:
+            return {'scores': scores}
+
+
+def _json_values(result):
+    """
+    Convert any NumPy values in the given dictionary
+    to Python values so that it can be serialized.
+    """
+    return dict((key, value.item() if hasattr(value, 'item') else value)
+                for key, value in result.items())
+
+
+def serve_json_lines(scorer, infile=sys.stdin, outfile=sys.stdout):
+    """
+    Read one JSON request per line from `infile` and
+    write one JSON response per line to `outfile`.
+    """
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'error': 'Invalid JSON: {}'.format(e)}
+        else:
+            response = scorer.handle_request(request)
+        outfile.write(json.dumps(response) + '\n')
+        outfile.flush()
+
+
+def make_request_handler(scorer):
+    """
+    Return the HTTP request handler class that
+    uses the given scorer for POST requests.
+    """
+
+    class ScoringRequestHandler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError as e:
+                response = {'error': 'Invalid JSON: {}'.format(e)}
+            else:
+                response = scorer.handle_request(request)
+
+            body = json.dumps(response).encode('utf-8')
+            self.send_response(400 if 'error' in response else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.getLogger(__name__).debug(format % args)
+
+    return ScoringRequestHandler
+
+
+def main():
+
+    # set up the basic logging config
+    fmt = LogFormatter()
+    hdlr = logging.StreamHandler(sys.stderr)
+    hdlr.setFormatter(fmt)
+    logging.root.addHandler(hdlr)
+    logging.root.setLevel(logging.INFO)
+
+    # get a logger
+    logger = logging.getLogger(__name__)
+
+    # set up an argument parser
+    parser = argparse.ArgumentParser(prog='rsmserve.py')
+
+    parser.add_argument('--port', dest='port', type=int,
+                        help="Serve HTTP POST requests on this local "
+                             "port instead of reading JSON lines from "
+                             "the standard input",
+                        required=False,
+                        default=None)
+
+    parser.add_argument('--host', dest='host',
+                        help="The host name or address for the HTTP server",
+                        required=False,
+                        default='localhost')
+
+    parser.add_argument('--cache-size', dest='cache_size', type=int,
+                        help="The number of experiments to keep in memory",
+                        required=False,
+                        default=8)
+
+    # parse given command line arguments
+    args = parser.parse_args()
+
+    scorer = Scorer(cache_size=args.cache_size)
+    if args.port:
+        server = HTTPServer((args.host, args.port), make_request_handler(scorer))
+        logger.info('Serving scoring requests on http://{}:{}'.format(args.host, args.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        serve_json_lines(scorer)
+
+if __name__ == '__main__':
+    main()
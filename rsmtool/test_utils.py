@@ -45,7 +45,7 @@ def do_run_evaluation(source, experiment_id, config_file):
     run_evaluation(config_file, experiment_dir)
 
 
-def do_run_prediction(source, config_file):
+def do_run_prediction(source, config_file, chunksize=None):
     source_output_dir = 'test_outputs'
     output_file = join(source_output_dir, source, 'output', 'predictions.csv')
     feats_file = join(source_output_dir, source, 'output', 'preprocessed_features.csv')
@@ -55,7 +55,8 @@ def do_run_prediction(source, config_file):
     for f in files:
         remove(f)
 
-    compute_and_save_predictions(config_file, output_file, feats_file)
+    compute_and_save_predictions(config_file, output_file, feats_file,
+                                 chunksize=chunksize)
 
 
 def do_run_comparison(source, config_file):
@@ -1,12 +1,16 @@
 import json
 import logging
 import os
+import pickle
+import tempfile
 
 import numpy as np
 import pandas as pd
 
 from os import makedirs
-from os.path import join
+from os.path import exists, getmtime, join, relpath, splitext
+
+from scipy.linalg import cho_factor, cho_solve, eigh, pinvh, LinAlgError
 
 # get the path to this file
 package_path = os.path.dirname(__file__)
@@ -65,11 +69,64 @@ def covariance_to_correlation(m):
         raise ValueError('Input matrix must be square')
 
     Is = np.sqrt(1/np.diag(m))
-    retval = Is * m * np.repeat(Is, numrows).reshape(numrows, numrows)
+    retval = m * np.outer(Is, Is)
     np.fill_diagonal(retval, 1.0)
     return retval
 
 
+def partial_correlations_from_covariance(covariance, num_observations):
+    """
+    Compute the partial correlations of each pair of variables
+    excluding all other variables from their covariance matrix
+    `covariance` estimated from `num_observations` observations.
+    The covariance matrix is inverted via its Cholesky factor. If
+    it is not positive definite (e.g., if some of the variables
+    are collinear), the pseudo-inverse is used instead. Returns
+    the array of partial correlations along with the rank of the
+    covariance matrix so that callers can report any rank
+    deficiency.
+    """
+
+    covariance = np.asarray(covariance, dtype=np.float64)
+    num_variables = len(covariance)
+
+    # the centered observations cannot span all of the variables
+    # if there are not more observations than variables. It is
+    # not meaningful to compute partial correlations when there
+    # are fewer observations, so we return a matrix of NaNs. When
+    # the numbers are equal, we return the degenerate matrix with
+    # 1s and -1s defined by the single null direction.
+    if num_observations < num_variables or not np.isfinite(covariance).all():
+        pcor = np.full((num_variables, num_variables), np.nan)
+        rank = 0
+    elif num_observations == num_variables:
+        _, eigenvectors = eigh(covariance)
+        null_direction = eigenvectors[:, 0]
+        pcor = -np.sign(np.outer(null_direction, null_direction))
+        rank = num_variables - 1
+    else:
+        try:
+            # treat the matrix as singular if any of the pivots
+            # is negligible, using the same cutoff as `pinvh()`
+            factor = cho_factor(covariance)
+            pivots = np.diag(factor[0]) ** 2
+            if pivots.min() <= pivots.max() * num_variables * np.finfo(np.float64).eps:
+                raise LinAlgError('The covariance matrix is singular')
+            precision = cho_solve(factor, np.eye(num_variables))
+            rank = num_variables
+        except LinAlgError:
+            precision, rank = pinvh(covariance, return_rank=True)
+            logger = logging.getLogger(__name__)
+            logger.warning("The covariance matrix is not positive definite "
+                           "(rank {} < {}). Computing partial correlations "
+                           "using its pseudo-inverse.".format(rank, num_variables))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pcor = -1 * covariance_to_correlation(precision)
+
+    np.fill_diagonal(pcor, 1.0)
+    return pcor, rank
+
+
 def partial_correlations(df):
     """
     This is a python port of the `pcor` function
@@ -78,31 +135,8 @@ def partial_correlations(df):
     of variables in the given data frame `df`,
     excluding all other variables.
     """
-    numrows, numcols = df.shape
-    gp = numcols - 2
-    df_cov = df.cov()
-    columns = df_cov.columns
-
-    # return a matrix of nans if the number of columns is
-    # greater than the number of rows. When the ncol == nrows
-    # we get the degenerate matrix with 1 only. It is not meaningful
-    # to compute partial correlations when ncol > nrows.
-
-    # create empty array for when we cannot compute the
-    # matrix inversion
-    empty_array = np.empty((len(columns), len(columns)))
-    empty_array[:] = np.nan
-    if numcols > numrows:
-        icvx = empty_array
-    else:
-        # we also return nans if there is singularity in the data (e.g. all human scores are the same)
-        try:
-            icvx = np.linalg.inv(df_cov)
-        except np.linalg.LinAlgError:
-            icvx = empty_array
-    pcor = -1 * covariance_to_correlation(icvx)
-    np.fill_diagonal(pcor, 1.0)
-    df_pcor = pd.DataFrame(pcor, columns=columns, index=columns)
+    pcor, _ = partial_correlations_from_covariance(df.cov().values, len(df))
+    df_pcor = pd.DataFrame(pcor, columns=df.columns, index=df.columns)
     return df_pcor
 
 
@@ -113,19 +147,71 @@ def agreement(score1, score2, tolerance=0):
     tolerance.
     """
 
+    return agreement_at_tolerances(score1, score2, tolerances=[tolerance])[0]
+
+
+def agreement_at_tolerances(score1, score2, tolerances=[0, 1],
+                            group_codes=None, num_groups=None):
+    """
+    This function computes the agreement between
+    two raters for each of the given tolerances
+    using a single array of absolute differences.
+    `score2` can either be a vector of scores or a
+    2-D array with one column per set of scores, in
+    which case the agreements are computed for all
+    of the columns at once. Missing scores never
+    count as agreements. Returns an array with one
+    row per tolerance (and one column per set of
+    scores if `score2` was 2-D).
+
+    If `group_codes` is specified, it must contain
+    the integer code (0 to `num_groups` - 1) of the
+    group each item belongs to. The agreements are
+    then computed separately for each group and the
+    returned array has an additional axis for the
+    groups right after the tolerances.
+    """
+
+    score1 = np.asarray(score1, dtype=np.float64)
+    score2 = np.asarray(score2, dtype=np.float64)
+
     # make sure the two sets of scores
     # are for the same number of items
     assert len(score1) == len(score2)
 
-    num_agreements = sum([int(abs(s1-s2) <= tolerance)
-                          for s1, s2 in zip(score1, score2)])
-
-    return (float(num_agreements) / len(score1)) * 100
+    # align the first set of scores with
+    # each of the columns, if necessary
+    if score2.ndim == 2:
+        score1 = score1[:, np.newaxis]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        differences = np.abs(score1 - score2)
+        if group_codes is None:
+            num_agreements = np.array([(differences <= tolerance).sum(axis=0)
+                                       for tolerance in tolerances])
+            num_items = len(score1)
+        else:
+            # count the agreements for each group with a
+            # `bincount` over the group codes for each column
+            group_codes = np.asarray(group_codes, dtype=np.int64)
+            flat_differences = differences.reshape(len(score1), -1)
+            num_agreements = np.array([[np.bincount(group_codes,
+                                                    weights=(flat_differences[:, column] <= tolerance).astype(np.float64),
+                                                    minlength=num_groups)
+                                        for column in range(flat_differences.shape[1])]
+                                       for tolerance in tolerances])
+            num_agreements = num_agreements.transpose(0, 2, 1)
+            num_agreements = num_agreements.reshape((len(tolerances), num_groups) + differences.shape[1:])
+            num_items = np.bincount(group_codes, minlength=num_groups)
+            num_items = num_items.reshape((num_groups,) + (1,) * (differences.ndim - 1))
+
+        return (num_agreements / num_items) * 100
 
 
 def write_experiment_output(data_frames, suffixes,
                             experiment_id, csvdir,
-                            reset_index=False):
+                            reset_index=False,
+                            write_binary=False):
 
     """
     Write out the given data frames in the list
@@ -133,7 +219,10 @@ def write_experiment_output(data_frames, suffixes,
     the experiment to csv files under `csvdir`.
     All files are prefixed with `experiment_id`.
     Indexes in the data frames are reset if
-    `reset_index` is True.
+    `reset_index` is True. If `write_binary` is
+    True, the data frames are also saved in the
+    binary format next to the csv files so that
+    the report notebooks can read them faster.
     """
     for df, suffix in zip(data_frames, suffixes):
 
@@ -150,6 +239,166 @@ def write_experiment_output(data_frames, suffixes,
         outfile = join(csvdir, '{}_{}.csv'.format(experiment_id, suffix))
         df.to_csv(outfile, index=False)
 
+        # write the binary file after the CSV file so
+        # that it is not older than the CSV file
+        if write_binary:
+            write_binary_frame(df, splitext(outfile)[0] + '.npz')
+
+
+def write_binary_frame(df, npz_file):
+    """
+    Save the given data frame to a NumPy `.npz` file. Each
+    column is saved as a separate array and the manifest with
+    the column names and types is saved as a JSON string so
+    that the file can be read without unpickling any objects.
+    Non-numeric columns are saved as strings along with a mask
+    for the missing values.
+    """
+
+    arrays = {}
+    manifest = {'columns': []}
+    for idx in range(len(df.columns)):
+        values = df.iloc[:, idx].values
+        key = 'column_{}'.format(idx)
+        if values.dtype.kind in 'biuf':
+            arrays[key] = values
+            kind = 'numeric'
+        else:
+            missing = pd.isnull(values)
+            strings = df.iloc[:, idx].astype(str).values.astype(np.str_)
+            strings[missing] = ''
+            arrays[key] = strings
+            arrays['{}_missing'.format(key)] = missing
+            kind = 'string'
+        manifest['columns'].append({'name': str(df.columns[idx]),
+                                    'kind': kind})
+
+    arrays['manifest'] = np.array(json.dumps(manifest))
+    np.savez(npz_file, **arrays)
+
+
+def read_binary_frame(npz_file):
+    """
+    Read the data frame saved by `write_binary_frame()`
+    from the given `.npz` file.
+    """
+
+    columns = []
+    with np.load(npz_file) as npz:
+        manifest = json.loads(str(npz['manifest']))
+        for idx, column in enumerate(manifest['columns']):
+            key = 'column_{}'.format(idx)
+            values = npz[key]
+            if column['kind'] == 'string':
+                values = values.astype(object)
+                values[npz['{}_missing'.format(key)]] = np.nan
+            columns.append(values)
+
+    df = pd.DataFrame(dict(enumerate(columns)), columns=range(len(columns)))
+    df.columns = [column['name'] for column in manifest['columns']]
+    return df
+
+
+def read_experiment_frame(csv_file, **kwargs):
+    """
+    Read the data frame that was saved by `write_experiment_output()`
+    to the given CSV file. If the data frame was also saved in the
+    binary format and the binary file is up to date, it is read
+    instead of the CSV file. In this case, the non-numeric columns
+    that only contain numbers are converted to numbers, as
+    `pd.read_csv()` would do, unless `str` is given as their
+    converter. Otherwise, any keyword arguments are passed to
+    `pd.read_csv()`.
+    """
+
+    npz_file = splitext(csv_file)[0] + '.npz'
+    if exists(npz_file) and getmtime(npz_file) >= getmtime(csv_file):
+        df = read_binary_frame(npz_file)
+        converters = kwargs.get('converters', {})
+        for column in df.columns:
+            if df[column].dtype == object and converters.get(column) is not str:
+                try:
+                    df[column] = pd.to_numeric(df[column])
+                except (TypeError, ValueError):
+                    pass
+        return df
+    else:
+        return pd.read_csv(csv_file, **kwargs)
+
+
+def get_output_files(output_dir, exclude_dir=None):
+    """
+    Return a dictionary with the sizes of all of the files
+    under `output_dir`, keyed by their paths relative to
+    `output_dir`. The files under `exclude_dir` are skipped.
+    """
+    output_files = {}
+    for dirpath, dirnames, filenames in os.walk(output_dir):
+        if exclude_dir and os.path.abspath(dirpath) == os.path.abspath(exclude_dir):
+            dirnames[:] = []
+            continue
+        for filename in filenames:
+            filepath = join(dirpath, filename)
+            output_files[relpath(filepath, output_dir)] = (os.path.getsize(filepath),
+                                                           os.stat(filepath).st_mtime_ns)
+    return output_files
+
+
+def save_checkpoint(checkpoint_dir, stage, fingerprint, results, output_files):
+    """
+    Save the results of the given stage of the experiment along
+    with the fingerprint of the experiment inputs and the sizes
+    of the output files written by the stage. Both files are
+    written to temporary files first and the information file
+    is moved into place last so that incomplete checkpoints
+    are ignored.
+    """
+    makedirs(checkpoint_dir, exist_ok=True)
+    remove_checkpoint(checkpoint_dir, stage)
+    with tempfile.NamedTemporaryFile(dir=checkpoint_dir, delete=False) as resultsf:
+        pickle.dump(results, resultsf, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(resultsf.name, join(checkpoint_dir, '{}.pkl'.format(stage)))
+    with tempfile.NamedTemporaryFile('w', dir=checkpoint_dir, delete=False) as infof:
+        json.dump({'fingerprint': fingerprint,
+                   'output_files': output_files}, infof)
+    os.replace(infof.name, join(checkpoint_dir, '{}.json'.format(stage)))
+
+
+def remove_checkpoint(checkpoint_dir, stage):
+    """
+    Remove the information file for the given stage of the
+    experiment, if any, so that its checkpoint is ignored
+    while the stage is being run again.
+    """
+    info_file = join(checkpoint_dir, '{}.json'.format(stage))
+    if exists(info_file):
+        os.remove(info_file)
+
+
+def load_checkpoint(checkpoint_dir, stage, fingerprint, output_dir):
+    """
+    Return a tuple with True and the saved results of the given stage
+    of the experiment if it was completed with the inputs that have
+    the given fingerprint and all of its output files still exist in
+    `output_dir` with the same sizes. Otherwise, return False and None.
+    """
+
+    info_file = join(checkpoint_dir, '{}.json'.format(stage))
+    if not exists(info_file):
+        return False, None
+
+    with open(info_file, 'r') as infof:
+        stage_info = json.load(infof)
+    if stage_info['fingerprint'] != fingerprint:
+        return False, None
+    for filename, size in stage_info['output_files'].items():
+        filepath = join(output_dir, filename)
+        if not exists(filepath) or os.path.getsize(filepath) != size:
+            return False, None
+
+    with open(join(checkpoint_dir, '{}.pkl'.format(stage)), 'rb') as resultsf:
+        return True, pickle.load(resultsf)
+
 
 def write_feature_json(feature_specs, selected_features,
                        experiment_id, featuredir):
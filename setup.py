@@ -26,6 +26,7 @@ setup(name='rsmtool',
                     ['rsmtool = rsmtool.rsmtool:main',
                      'rsmeval = rsmtool.rsmeval:main',
                      'rsmpredict = rsmtool.rsmpredict:main',
+                     'rsmserve = rsmtool.serve:main',
                      'rsmcompare = rsmtool.rsmcompare:main',
                      'render_notebook = rsmtool.report:main']
                    },
@@ -1,10 +1,22 @@
 import pandas as pd
 
 from nose.tools import (assert_almost_equal, assert_equal)
+from numpy import percentile
 from numpy.random import RandomState
-
-from rsmtool.analysis import (correlation_helper,
+from numpy.testing import assert_array_almost_equal
+from scipy.stats import kurtosis, pearsonr
+from skll.metrics import kappa
+
+from rsmtool.analysis import (FeatureStatistics,
+                              batch_metrics_helper,
+                              compute_correlations_by_group,
+                              compute_metrics,
+                              compute_metrics_by_group,
+                              compute_outliers,
+                              compute_percentiles,
+                              correlation_helper,
                               metrics_helper)
+from rsmtool.utils import partial_correlations
 
 prng = RandomState(133)
 df_features = pd.DataFrame({'sc1': [1, 2, 3, 4, 1, 2, 3, 4, 1, 2],
@@ -74,3 +86,109 @@ def test_that_metrics_helper_works_for_data_with_the_same_label():
     # kappas will be 0 or 1
     evals = metrics_helper(same_human_scores, system_scores)
     assert_equal(evals.isnull().values.sum(), 1)
+
+def test_that_metrics_helper_kappas_match_skll():
+    evals = metrics_helper(human_scores, system_scores)
+    assert_almost_equal(evals['kappa'], kappa(human_scores, system_scores))
+    assert_almost_equal(evals['wtkappa'], kappa(human_scores,
+                                                round(system_scores),
+                                                weights='quadratic'))
+
+def test_that_metrics_helper_kappa_is_one_for_single_score_level():
+    evals = metrics_helper(same_human_scores, pd.Series([3.2]*10))
+    assert_equal(evals['kappa'], 1.0)
+    assert_equal(evals['wtkappa'], 1.0)
+
+def test_batch_metrics_helper():
+    # the batched metrics should be the same as computing
+    # the metrics for each column separately
+    df_system_scores = pd.DataFrame({'raw': system_scores,
+                                     'raw_trim': system_scores.clip(1, 4),
+                                     'raw_trim_round': system_scores.clip(1, 4).round()})
+    df_batch_metrics = batch_metrics_helper(human_scores, df_system_scores)
+    for column in df_system_scores:
+        evals = metrics_helper(human_scores, df_system_scores[column])
+        assert_array_almost_equal(df_batch_metrics[column].values,
+                                  evals[df_batch_metrics.index].values)
+
+
+def test_compute_metrics_by_group():
+    # the metrics for each group should be the same
+    # as the metrics computed separately on that group
+    df_scores = pd.DataFrame({'sc1': prng.randint(1, 5, size=30),
+                              'raw_trim': prng.random_sample(30)*5,
+                              'raw_trim_round': prng.randint(1, 5, size=30),
+                              'sc2': prng.randint(1, 5, size=30),
+                              'group': ['b']*10 + ['a']*12 + ['c']*8})
+    df_scores.loc[[0, 3, 15], 'sc2'] = None
+    (df_eval_by_group,
+     df_consistency_by_group) = compute_metrics_by_group(df_scores, 'group',
+                                                         include_second_score=True)
+    assert_equal(list(df_eval_by_group.index), ['All data', 'a', 'b', 'c'])
+    assert_equal(list(df_consistency_by_group.index), ['All data', 'a', 'b', 'c'])
+    for group, df_group in [('All data', df_scores)] + list(df_scores.groupby('group')):
+        (_,
+         df_eval_short,
+         df_consistency) = compute_metrics(df_group.drop('group', axis=1),
+                                           compute_shortened=True,
+                                           include_second_score=True)
+        assert_array_almost_equal(df_eval_by_group.loc[group, df_eval_short.columns].values,
+                                  df_eval_short.iloc[0].values)
+        assert_array_almost_equal(df_consistency_by_group.loc[group, df_consistency.columns].values,
+                                  df_consistency.iloc[0].values)
+
+
+def test_compute_correlations_by_group_with_length():
+    # the partial correlations with length partialled out should be
+    # the same as the ones computed on each group separately
+    df_groups = pd.DataFrame({'sc1': prng.randint(1, 5, size=30),
+                              'f1': prng.normal(0, 1, 30),
+                              'f2': prng.normal(1, 0.1, 30),
+                              'length': prng.normal(100, 10, 30),
+                              'group': ['b']*10 + ['a']*12 + ['c']*8})
+    (df_cors,
+     df_partcors,
+     df_partcors_no_length) = compute_correlations_by_group(df_groups, ['f1', 'f2'],
+                                                            'sc1', 'group',
+                                                            include_length=True)
+    assert_equal(list(df_cors.index), ['All data', 'a', 'b', 'c'])
+    for group, df_group in [('All data', df_groups)] + list(df_groups.groupby('group')):
+        for feature in ['f1', 'f2']:
+            assert_almost_equal(df_cors.loc[group, feature],
+                                df_group[feature].corr(df_group['sc1']))
+            assert_almost_equal(df_partcors.loc[group, feature],
+                                partial_correlations(df_group[['f1', 'f2', 'sc1']])['sc1'][feature])
+            assert_almost_equal(df_partcors_no_length.loc[group, feature],
+                                partial_correlations(df_group[[feature, 'sc1', 'length']])['sc1'][feature])
+
+
+def test_feature_statistics():
+    # the statistics should be the same as the ones
+    # computed separately by pandas, numpy and scipy
+    stats = FeatureStatistics(df_features, ['f1', 'f2', 'sc1'])
+    assert_array_almost_equal(stats.means, df_features[['f1', 'f2', 'sc1']].mean())
+    assert_array_almost_equal(stats.sds, df_features[['f1', 'f2', 'sc1']].std())
+    assert_array_almost_equal(stats.skewness, df_features[['f1', 'f2', 'sc1']].skew())
+    assert_array_almost_equal(stats.kurtosis, kurtosis(df_features[['f1', 'f2', 'sc1']], fisher=False))
+    assert_array_almost_equal(stats.correlation_frame(), df_features[['f1', 'f2', 'sc1']].corr())
+    assert_array_almost_equal(stats.percentiles([1, 25, 50, 99], ['f2']).ravel(),
+                              percentile(df_features['f2'], [1, 25, 50, 99], interpolation='lower'))
+    cors, pvalues = stats.pearson_correlations(['f1', 'f2'], 'sc1')
+    for feature, cor, pvalue in zip(['f1', 'f2'], cors, pvalues):
+        expected_cor, expected_pvalue = pearsonr(df_features[feature], df_features['sc1'])
+        assert_almost_equal(cor, expected_cor)
+        assert_almost_equal(pvalue, expected_pvalue)
+
+
+def test_outlier_counts():
+    # one mild and one extreme outlier in `f1`, one
+    # outlier beyond 4 SDs in `f2` and none in `f3`
+    df_outliers = pd.DataFrame({'f1': list(range(1, 21)) + [45, 80],
+                                'f2': [0]*10 + [1]*11 + [100],
+                                'f3': range(22)})
+    df_percentiles = compute_percentiles(df_outliers, ['f1', 'f2', 'f3'])
+    assert_array_almost_equal(df_percentiles['Mild outliers'], [1, 0, 0])
+    assert_array_almost_equal(df_percentiles['Extreme outliers'], [1, 1, 0])
+    df_sd_outliers = compute_outliers(df_outliers, ['f1', 'f2', 'f3'])
+    assert_array_almost_equal(df_sd_outliers.loc[['f1', 'f2', 'f3'], 'upper'], [0, 1, 0])
+    assert_array_almost_equal(df_sd_outliers.loc[['f1', 'f2', 'f3'], 'both'], [0, 1, 0])
@@ -1,4 +1,5 @@
 import sys
+import warnings
 
 from os.path import dirname, join, normpath
 
@@ -7,6 +8,7 @@ import pandas as pd
 
 from nose.tools import assert_equal, assert_raises, raises
 from numpy.testing import assert_array_equal
+from scipy.stats import pearsonr
 
 
 _my_dir = dirname(__file__)
@@ -16,7 +18,10 @@ sys.path.append(_code_dir)
 from rsmtool.create_features import (select_by_prefix,
                                      select_by_subset,
                                      generate_default_specs,
-                                     generate_specs_from_data)
+                                     generate_specs_from_data,
+                                     find_feature_transformation,
+                                     find_feature_transformations)
+from rsmtool.preprocess import transform_feature
 
 
 def test_select_by_prefix():
@@ -171,4 +176,63 @@ def test_generate_specs_from_data_no_subset_specs():
     assert_equal(feats[1]['sign'], 1)
     assert_equal(feats[2]['sign'], 1)
 
-    
\ No newline at end of file
+    
+
+
+def find_feature_transformation_reference(feature_name, feature_value, scores):
+    # the original implementation that computes the correlation
+    # for each of the applicable transformations separately
+    if any(feature_value < 0):
+        applicable_transformations = ['org', 'inv']
+    else:
+        applicable_transformations = ['org', 'sqrt', 'addOneInv', 'addOneLn']
+    correlations = []
+    for trans in applicable_transformations:
+        try:
+            transformed_value = transform_feature(feature_name, feature_value, trans)
+            correlations.append(abs(pearsonr(transformed_value, scores)[0]))
+        except ValueError:
+            correlations.append(0)
+    return applicable_transformations[np.argmax(correlations)]
+
+
+def test_find_feature_transformations():
+    # the transformations should be the same as the ones
+    # selected by the original implementation, including
+    # for a constant feature, a feature with a 0 for which
+    # `inv` cannot be applied and negative features for which
+    # only `org` and `inv` can be applied
+    np.random.seed(10)
+    r1 = np.random.choice(range(1, 5), 20)
+    feature_values = np.array([r1**2,
+                               1/r1,
+                               np.random.randn(20),
+                               -np.exp(r1),
+                               np.append(r1[:-1], 0),
+                               [2.0] * 20,
+                               np.append(-1/r1[:-1], 0),
+                               -1/r1]).T
+    feature_names = ['f{}'.format(idx) for idx in range(8)]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        transformations = find_feature_transformations(feature_names, feature_values, r1)
+        expected_transformations = [find_feature_transformation_reference(name,
+                                                                          feature_values[:, idx],
+                                                                          r1)
+                                    for idx, name in enumerate(feature_names)]
+    assert_array_equal(transformations, expected_transformations)
+    assert_array_equal(transformations,
+                       ['sqrt', 'addOneInv', 'org', 'inv', 'org', 'org', 'org', 'inv'])
+    assert_equal(find_feature_transformation('f0', feature_values[:, 0], r1), 'sqrt')
+
+
+def test_generate_specs_from_data_with_multiple_jobs():
+    np.random.seed(10)
+    r1 = np.random.choice(range(1, 5), 20)
+    data = dict(('f{}'.format(idx), r1**(idx % 3) + np.random.rand(20)) for idx in range(250))
+    data['r1'] = r1
+    df = pd.DataFrame(data)
+    feature_names = ['f{}'.format(idx) for idx in range(250)]
+    specs = generate_specs_from_data(feature_names, 'r1', df)
+    parallel_specs = generate_specs_from_data(feature_names, 'r1', df, n_jobs=2)
+    assert_equal(specs, parallel_specs)
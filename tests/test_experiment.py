@@ -1,7 +1,21 @@
+import json
+import pickle
+import shutil
+import tempfile
+
 from glob import glob
-from os.path import basename, dirname, exists, join
+from os import remove
+from os.path import abspath, basename, dirname, exists, getmtime, join
+
+import pandas as pd
 
-from nose.tools import raises
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, ok_, raises
+
+from rsmtool import run_experiment
+from rsmtool.input import HAS_PYARROW
+from rsmtool.rsmtool import run_stage
+from rsmtool.utils import load_checkpoint
 
 from rsmtool.test_utils import (check_csv_output,
                                 check_report,
@@ -46,6 +60,203 @@ def test_run_experiment_lr():
     yield check_report, html_report
 
 
+def test_run_experiment_lr_with_parquet():
+    # basic experiment with a LinearRegression model and the
+    # training and evaluation data in Parquet files
+
+    if not HAS_PYARROW:
+        raise SkipTest('pyarrow is not installed')
+
+    source = 'lr-with-parquet'
+    experiment_id = 'lr_with_parquet'
+    config_file = join(test_dir,
+                       'data',
+                       'experiments',
+                       source,
+                       '{}.json'.format(experiment_id))
+    do_run_experiment(source, experiment_id, config_file)
+    output_dir = join('test_outputs', source, 'output')
+    expected_output_dir = join(test_dir, 'data', 'experiments', source, 'output')
+    html_report = join('test_outputs', source, 'report', '{}_report.html'.format(experiment_id))
+
+    csv_files = glob(join(output_dir, '*.csv'))
+    for csv_file in csv_files:
+        csv_filename = basename(csv_file)
+        expected_csv_file = join(expected_output_dir, csv_filename)
+
+        if exists(expected_csv_file):
+            yield check_csv_output, csv_file, expected_csv_file
+
+    yield check_all_csv_exist, csv_files, experiment_id, 'rsmtool'
+    yield check_scaled_coefficients, source, experiment_id
+    yield check_report, html_report
+
+
+def test_run_experiment_lr_resume():
+    # resuming a completed experiment should not run the stages
+    # again unless the files they saved have been removed; the
+    # stages that depend on them should then also be run again
+
+    source = 'lr-resume'
+    experiment_id = 'lr'
+    config_file = join(test_dir,
+                       'data',
+                       'experiments',
+                       'lr',
+                       '{}.json'.format(experiment_id))
+    do_run_experiment(source, experiment_id, config_file)
+    experiment_dir = join('test_outputs', source)
+    model_file = join(experiment_dir, 'output', '{}.model'.format(experiment_id))
+    eval_file = join(experiment_dir, 'output', '{}_eval.csv'.format(experiment_id))
+    html_report = join(experiment_dir, 'report', '{}_report.html'.format(experiment_id))
+    model_mtime = getmtime(model_file)
+    report_mtime = getmtime(html_report)
+
+    # the data frames that have already been saved to the
+    # output directory should not be saved in the checkpoint
+    with open(join(experiment_dir, 'checkpoints', 'data.pkl'), 'rb') as resultsf:
+        eq_(pickle.load(resultsf)['df_train_features'],
+            join('output', '{}_train_features.npz'.format(experiment_id)))
+
+    run_experiment(config_file, experiment_dir, resume=True)
+    eq_(getmtime(model_file), model_mtime)
+    eq_(getmtime(html_report), report_mtime)
+
+    # the timings should show which stages were run again
+    remove(eval_file)
+    run_experiment(config_file, experiment_dir, resume=True, profile=True)
+    eq_(getmtime(model_file), model_mtime)
+    ok_(getmtime(html_report) > report_mtime)
+    expected_eval_file = join(test_dir, 'data', 'experiments', 'lr', 'output', 'lr_eval.csv')
+    check_csv_output(eval_file, expected_eval_file)
+    df_timings = pd.read_csv(join(experiment_dir, 'output', '{}_timings.csv'.format(experiment_id)))
+    eq_(df_timings['stage'][:4].tolist(), ['data', 'train', 'analyses', 'report'])
+    eq_(df_timings['resumed'][:4].tolist(), [True, True, False, False])
+    eq_(df_timings['train_responses'][0], 500)
+
+
+def test_run_stage_failed_again():
+    # the checkpoint of a stage should not be used
+    # if the stage failed while it was run again
+    tempdir = tempfile.mkdtemp()
+    try:
+        checkpoint_dir = join(tempdir, 'checkpoints')
+        run_stage('data', lambda: {'x': 1}, (), tempdir, checkpoint_dir, 'abc')
+        eq_(load_checkpoint(checkpoint_dir, 'data', 'abc', tempdir), (True, {'x': 1}))
+
+        def fail():
+            raise ValueError()
+
+        try:
+            run_stage('data', fail, (), tempdir, checkpoint_dir, 'abc')
+        except ValueError:
+            pass
+        eq_(load_checkpoint(checkpoint_dir, 'data', 'abc', tempdir), (False, None))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_run_experiment_lr_resume_with_changed_custom_section():
+    # the report should be generated again if one of the
+    # custom sections has been changed since it was generated
+
+    source = 'lr-resume-with-changed-custom-section'
+    experiment_id = 'lr_with_custom_sections'
+    source_dir = join(test_dir, 'data', 'experiments', 'lr-with-custom-sections')
+    tempdir = tempfile.mkdtemp()
+    try:
+        for filename in ['custom1.ipynb', 'custom2.ipynb', 'features.json']:
+            shutil.copy(join(source_dir, filename), tempdir)
+        with open(join(source_dir, '{}.json'.format(experiment_id))) as configf:
+            config = json.load(configf)
+        for field in ['train_file', 'test_file']:
+            config[field] = abspath(join(source_dir, config[field]))
+        config_file = join(tempdir, '{}.json'.format(experiment_id))
+        with open(config_file, 'w') as configf:
+            json.dump(config, configf)
+
+        experiment_dir = join('test_outputs', source)
+        run_experiment(config_file, experiment_dir)
+        html_report = join(experiment_dir, 'report', '{}_report.html'.format(experiment_id))
+        report_mtime = getmtime(html_report)
+
+        run_experiment(config_file, experiment_dir, resume=True)
+        eq_(getmtime(html_report), report_mtime)
+
+        with open(join(tempdir, 'custom1.ipynb'), 'a') as notebookf:
+            notebookf.write('\n')
+        run_experiment(config_file, experiment_dir, resume=True)
+        ok_(getmtime(html_report) > report_mtime)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_run_experiment_lr_sweep():
+    # experiment with LinearRegression and NNLR models trained on
+    # the same data; the outputs for each model should be the same
+    # as for the experiments with just that model
+
+    source = 'lr-sweep'
+    experiment_id = 'lr'
+    config_file = join(test_dir,
+                       'data',
+                       'experiments',
+                       source,
+                       '{}.json'.format(experiment_id))
+    do_run_experiment(source, experiment_id, config_file)
+
+    for model_name, model_source in [('LinearRegression', 'lr'), ('NNLR', 'nnlr')]:
+        output_dir = join('test_outputs', source, model_name, 'output')
+        expected_output_dir = join(test_dir, 'data', 'experiments', model_source, 'output')
+        html_report = join('test_outputs', source, model_name, 'report',
+                           '{}_report.html'.format(experiment_id))
+
+        csv_files = glob(join(output_dir, '*.csv'))
+        for csv_file in csv_files:
+            csv_filename = basename(csv_file).replace(experiment_id, model_source, 1)
+            expected_csv_file = join(expected_output_dir, csv_filename)
+
+            if exists(expected_csv_file):
+                yield check_csv_output, csv_file, expected_csv_file
+
+        yield check_all_csv_exist, csv_files, experiment_id, 'rsmtool'
+        yield check_report, html_report
+
+    assert exists(join('test_outputs', source, 'output',
+                       '{}_model_comparison.csv'.format(experiment_id)))
+
+
+def test_run_experiment_lr_without_other_columns():
+    # basic experiment with a LinearRegression model that only reads
+    # the columns used in the analysis; the outputs should be the
+    # same except that the other columns are not saved
+
+    source = 'lr-without-other-columns'
+    experiment_id = 'lr'
+    config_file = join(test_dir,
+                       'data',
+                       'experiments',
+                       source,
+                       '{}.json'.format(experiment_id))
+    do_run_experiment(source, experiment_id, config_file)
+    output_dir = join('test_outputs', source, 'output')
+    expected_output_dir = join(test_dir, 'data', 'experiments', 'lr', 'output')
+    html_report = join('test_outputs', source, 'report', '{}_report.html'.format(experiment_id))
+
+    csv_files = glob(join(output_dir, '*.csv'))
+    for csv_file in csv_files:
+        expected_csv_file = join(expected_output_dir, basename(csv_file))
+
+        if exists(expected_csv_file):
+            yield check_csv_output, csv_file, expected_csv_file
+
+    yield check_all_csv_exist, csv_files, experiment_id, 'rsmtool'
+    yield check_report, html_report
+
+    assert not exists(join(output_dir, '{}_train_other_columns.csv'.format(experiment_id)))
+    assert not exists(join(output_dir, '{}_test_other_columns.csv'.format(experiment_id)))
+
+
 def test_run_experiment_lr_old_config():
     # basic experiment with a LinearRegression model but using an
     # old style configuration file
@@ -357,6 +568,29 @@ def test_run_experiment_lr_predict_missing_values():
         yield check_csv_output, output_file, expected_output_file
 
 
+def test_run_experiment_lr_predict_missing_values_in_chunks():
+
+    # rsmpredict experiment that reads the feature file in chunks
+    # should give the same results as reading it all at once
+
+    source = 'lr-predict-missing-values'
+    config_file = join(test_dir,
+                       'data',
+                       'experiments',
+                       source,
+                       'rsmpredict.json')
+    do_run_prediction(source, config_file, chunksize=3)
+
+    output_dir = join('test_outputs', source, 'output')
+    expected_output_dir = join(test_dir, 'data', 'experiments', source, 'output')
+
+    for csv_file in ['predictions.csv', 'preprocessed_features.csv']:
+        output_file = join(output_dir, csv_file)
+        expected_output_file = join(expected_output_dir, csv_file)
+
+        yield check_csv_output, output_file, expected_output_file
+
+
 def test_run_experiment_lr_predict_with_subgroups():
 
     # basic experiment using rsmpredict with subgroups and other columns
@@ -1643,6 +1877,19 @@ def test_run_experiment_lr_predict_with_repeated_ids():
     do_run_prediction(source, config_file)
 
 
+@raises(ValueError)
+def test_run_experiment_lr_predict_with_repeated_ids_in_chunks():
+
+    # rsmpredict experiment with non-unique ids in different chunks
+    source = 'lr-predict-with-repeated-ids'
+    config_file = join(test_dir,
+                       'data',
+                       'experiments',
+                       source,
+                       'rsmpredict.json')
+    do_run_prediction(source, config_file, chunksize=5)
+
+
 @raises(ValueError)
 def test_run_experiment_lr_with_sc1_as_feature_name():
 
@@ -1,10 +1,21 @@
+import tempfile
+
+import numpy as np
 import pandas as pd
 
+from os.path import join
+from shutil import rmtree
+
+from nose.plugins.skip import SkipTest
 from nose.tools import assert_equal, assert_raises, eq_, ok_, raises
 from numpy.testing import assert_array_equal
 from pandas.util.testing import assert_frame_equal
 
-from rsmtool.input import (normalize_json_fields,
+from rsmtool.input import (HAS_PYARROW,
+                           get_data_columns,
+                           get_file_format,
+                           normalize_json_fields,
+                           read_data_file,
                            process_json_fields,
                            rename_default_columns,
                            validate_and_populate_json_fields,
@@ -54,6 +65,14 @@ def test_normalize_fields():
     ok_('use_scaled_predictions' not in newdata.keys())
 
 
+def test_normalize_model_list():
+    # old model names should also be converted in a list of models
+    data = {'experiment_id': 'experiment_1',
+            'model': ['empWt', 'NNLR']}
+    newdata = normalize_json_fields(data)
+    assert_equal(newdata['model'], ['LinearRegression', 'NNLR'])
+
+
 @raises(ValueError)
 def test_validate_and_populate_missing_fields():
     data = {'expID': 'test'}
@@ -71,6 +90,8 @@ def test_validate_and_populate_unspecified_fields():
     assert_equal(newdata['select_transformations'], False)
     assert_equal(newdata['general_sections'], 'all')
     assert_equal(newdata['description'], '')
+    assert_equal(newdata['n_jobs'], 1)
+    assert_equal(newdata['save_other_columns'], True)
 
 
 @raises(ValueError)
@@ -83,6 +104,17 @@ def test_validate_and_populate_unknown_fields():
             'output': 'foobar'}
     validate_and_populate_json_fields(data)
 
+
+@raises(ValueError)
+def test_validate_and_populate_invalid_n_jobs():
+    data = {'experiment_id': 'experiment_1',
+            'train_file': 'data/rsmtool_smTrain.csv',
+            'test_file': 'data/rsmtool_smEval.csv',
+            'model': 'LinearRegression',
+            'n_jobs': 0}
+    validate_and_populate_json_fields(data)
+
+
 def test_process_fields():
     data = {'experiment_id': 'experiment_1',
             'train_file': 'data/rsmtool_smTrain.csv',
@@ -239,3 +271,105 @@ def test_check_feature_subset_file_wrong_values_in_sign():
     feature_specs = pd.DataFrame({'Feature': ['f1', 'f2', 'f3'],
                                   'sign_SYS1': ['+1', '-1', '+1']})
     check_feature_subset_file(feature_specs, sign='SYS1')
+
+
+def test_get_file_format():
+    eq_(get_file_format('data/train.csv'), 'csv')
+    eq_(get_file_format('data/train.TSV'), 'tsv')
+    eq_(get_file_format('data/train.tsv.gz'), 'tsv')
+    eq_(get_file_format('data/train.csv.bz2'), 'csv')
+    eq_(get_file_format('data/train.parquet'), 'parquet')
+    eq_(get_file_format('data/train.feather'), 'feather')
+    eq_(get_file_format('data/train.txt'), 'csv')
+
+
+def test_get_file_format_unsupported_compression():
+    assert_raises(ValueError, get_file_format, 'data/train.csv.xz')
+    assert_raises(ValueError, get_file_format, 'data/train.tsv.zip')
+
+
+def check_read_data_file(extension, write_function):
+    # the string columns should be read in exactly
+    # as they appear in the file and only the requested
+    # columns should be read in
+    df = pd.DataFrame({'ID': ['001', '002', '003'],
+                       'sc1': [1, 2, 3],
+                       'FEATURE1': [0.1, 0.2, 0.3],
+                       'L1': ['Esperanto', 'Klingon', 'Esperanto']},
+                      columns=['ID', 'sc1', 'FEATURE1', 'L1'])
+    tempdir = tempfile.mkdtemp()
+    try:
+        data_file = join(tempdir, 'data.{}'.format(extension))
+        write_function(df, data_file)
+        columns = get_data_columns(data_file)
+        df_read = read_data_file(data_file,
+                                 string_columns=['ID'],
+                                 usecols=['ID', 'FEATURE1'])
+        df_chunks = list(read_data_file(data_file,
+                                        string_columns=['ID'],
+                                        chunksize=2))
+    finally:
+        rmtree(tempdir)
+    eq_(columns, ['ID', 'sc1', 'FEATURE1', 'L1'])
+    assert_frame_equal(df_read, df[['ID', 'FEATURE1']])
+    eq_([len(df_chunk) for df_chunk in df_chunks], [2, 1])
+    assert_frame_equal(pd.concat(df_chunks, ignore_index=True), df)
+
+
+def test_read_data_file_csv():
+    check_read_data_file('csv', lambda df, filename: df.to_csv(filename, index=False))
+
+
+def test_read_data_file_with_missing_values():
+    # missing values should only be recognized in the columns
+    # that are not read in as strings
+    tempdir = tempfile.mkdtemp()
+    try:
+        data_file = join(tempdir, 'data.csv')
+        with open(data_file, 'w') as dataf:
+            dataf.write('ID,L1,FEATURE1\nNA,,NA\n002,NA,0.5\n')
+        df_read = read_data_file(data_file, string_columns=['ID', 'L1'])
+    finally:
+        rmtree(tempdir)
+    eq_(df_read['ID'].tolist(), ['NA', '002'])
+    eq_(df_read['L1'].tolist(), ['', 'NA'])
+    assert_array_equal(df_read['FEATURE1'], [np.nan, 0.5])
+
+
+def test_read_data_file_same_missing_values_as_pandas():
+    # the values that are not read in as strings should be
+    # recognized as missing exactly as pandas does by default
+    tempdir = tempfile.mkdtemp()
+    try:
+        data_file = join(tempdir, 'data.csv')
+        with open(data_file, 'w') as dataf:
+            dataf.write('ID,L1\n')
+            for idx, value in enumerate(['NA', 'null', 'n/a', '<NA>', 'none', '-']):
+                dataf.write('{},{}\n'.format(idx, value))
+        df_read = read_data_file(data_file, string_columns=['ID'])
+        df_expected = pd.read_csv(data_file, dtype={'ID': str})
+    finally:
+        rmtree(tempdir)
+    assert_frame_equal(df_read, df_expected)
+
+
+def test_read_data_file_compressed_tsv():
+    check_read_data_file('tsv.gz',
+                         lambda df, filename: df.to_csv(filename, sep='\t', index=False,
+                                                        compression='gzip'))
+
+
+def test_read_data_file_parquet():
+    if not HAS_PYARROW:
+        raise SkipTest('pyarrow is not installed')
+    from pyarrow import Table, parquet
+    check_read_data_file('parquet',
+                         lambda df, filename: parquet.write_table(Table.from_pandas(df), filename))
+
+
+def test_read_data_file_feather():
+    if not HAS_PYARROW:
+        raise SkipTest('pyarrow is not installed')
+    from pyarrow import Table, feather
+    check_read_data_file('feather',
+                         lambda df, filename: feather.write_feather(Table.from_pandas(df), filename))
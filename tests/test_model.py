@@ -1,6 +1,13 @@
+import numpy as np
+import pandas as pd
+
 from nose.tools import eq_, raises
+from numpy.testing import assert_array_equal
 
-from rsmtool.model import check_model_name
+from rsmtool.model import (check_model_name,
+                           create_fake_skll_learner,
+                           create_featureset_from_dataframe)
+from rsmtool.predict import predict_with_model
 
 def test_model_name_builtin_model():
     model_name = 'LinearRegression'
@@ -16,3 +23,32 @@ def test_model_name_skll_model():
 def test_model_name_wrong_name():
     model_name = 'random_model'
     _ = check_model_name(model_name)
+
+def test_create_featureset_from_feature_matrix():
+    # the FeatureSet built from the feature matrix should be
+    # the same as the one built from the feature dictionaries
+    df = pd.DataFrame({'spkitemid': ['a', 'b', 'c'],
+                       'f2': [1.5, 0.0, -2.0],
+                       'f1': [0.5, 3.0, 1.0],
+                       'sc1': [1, 2, 3]})
+    fs = create_featureset_from_dataframe(df)
+    fs_dict = create_featureset_from_dataframe(df, use_feature_matrix=False)
+    eq_(fs.vectorizer.get_feature_names(), fs_dict.vectorizer.get_feature_names())
+    assert_array_equal(fs.features.toarray(), fs_dict.features.toarray())
+    assert_array_equal(fs.labels, fs_dict.labels)
+
+def test_predict_with_linear_model():
+    # the predictions computed directly from the coefficients
+    # should be exactly the same as the ones computed by SKLL
+    prng = np.random.RandomState(123)
+    df_coefficients = pd.DataFrame({'feature': ['Intercept', 'f1', 'f2', 'f3'],
+                                    'coefficient': [0.5, 1.2, -0.3, 0.7]},
+                                   columns=['feature', 'coefficient'])
+    learner = create_fake_skll_learner(df_coefficients)
+    df = pd.DataFrame({'spkitemid': ['r{}'.format(i) for i in range(20)],
+                       'f3': prng.normal(0, 1, 20),
+                       'f1': prng.normal(0, 1, 20),
+                       'f2': prng.normal(0, 1, 20)})
+    df_predictions = predict_with_model(learner, df)
+    df_dict_predictions = predict_with_model(learner, df, use_feature_matrix=False)
+    assert_array_equal(df_predictions['raw'], df_dict_predictions['raw'])
@@ -14,13 +14,18 @@ _my_dir = dirname(__file__)
 _code_dir = normpath(join(_my_dir, '..', 'code'))
 sys.path.append(_code_dir)
 
-from rsmtool.preprocess import (apply_inverse_transform,
+from rsmtool.create_features import generate_specs_from_data
+from rsmtool.preprocess import (FeaturePreprocessor,
+                                TransformCache,
+                                apply_inverse_transform,
                                 apply_sqrt_transform,
                                 apply_log_transform,
                                 apply_add_one_log_transform,
                                 apply_add_one_inverse_transform,
                                 filter_on_column,
                                 filter_on_flag_columns,
+                                filter_on_numeric_columns,
+                                preprocess_feature,
                                 remove_outliers,
                                 transform_feature)
 
@@ -69,6 +74,38 @@ def test_filter_on_column_std_epsilon_zero():
     ok_(output_excluded_df.empty)
 
 
+def test_filter_on_numeric_columns():
+    df = pd.DataFrame({'spkitemid': ['a', 'b', 'c', 'd'],
+                       'f1': ['1', 'x', '3', '4'],
+                       'f2': [1, 2, 3, np.nan],
+                       'f3': ['TD', 'y', 'z', 'w']})
+    df_filtered, df_excluded = filter_on_numeric_columns(df, ['f1', 'f2'])
+    assert_frame_equal(df_filtered, pd.DataFrame({'spkitemid': ['a', 'c'],
+                                                  'f1': [1.0, 3.0],
+                                                  'f2': [1.0, 3.0],
+                                                  'f3': ['TD', 'z']}))
+    assert_frame_equal(df_excluded, pd.DataFrame({'spkitemid': ['b', 'd'],
+                                                  'f1': [np.nan, 4.0],
+                                                  'f2': [2.0, np.nan],
+                                                  'f3': ['y', 'w']}))
+
+
+def test_filter_on_numeric_columns_zero_sd():
+    # the standard deviation is checked after all of
+    # the rows with non-numeric values are excluded
+    df = pd.DataFrame({'spkitemid': ['a', 'b', 'c', 'd'],
+                       'f1': [1, 2, 3, 4],
+                       'f2': [1.5601, 1.5601, 1.5601, 'x'],
+                       'f3': ['2', '2', '2', '5']})
+    df_filtered, df_excluded = filter_on_numeric_columns(df,
+                                                         ['f1', 'f2', 'f3'],
+                                                         exclude_zero_sd=True)
+    assert_frame_equal(df_filtered, pd.DataFrame({'spkitemid': ['a', 'b', 'c'],
+                                                  'f1': [1.0, 2.0, 3.0]}))
+    assert_frame_equal(df_excluded, pd.DataFrame({'spkitemid': ['d'],
+                                                  'f1': [4.0]}))
+
+
 def test_transform_feature():
     name = 'dpsec'
     data = random.gauss(0, 1)
@@ -114,7 +151,9 @@ def test_filter_on_flag_column_nothing_to_exclude():
                        'flag2': [1, 2, 2, 1]})
     flag_dict = {'flag1': [0], 'flag2': [1, 2]}
     df_new, df_excluded = filter_on_flag_columns(df, flag_dict)
-    assert_frame_equal(df_new, df)
+    df_expected = df.copy()
+    df_expected[['flag1', 'flag2']] = df_expected[['flag1', 'flag2']].astype(float)
+    assert_frame_equal(df_new, df_expected)
     eq_(len(df_excluded), 0)
 
 
@@ -169,6 +208,35 @@ def test_filter_on_flag_column():
     assert_array_equal(df_excluded['spkitemid'], ['a1', 'b1', 'c1', 'd1'])
 
 
+def test_filter_on_flag_column_mixed_types():
+    # numeric strings are not the same as numbers
+    # and the original index is preserved
+    df = pd.DataFrame({'spkitemid': ['a', 'b', 'c', 'd', 'e'],
+                       'flag1': [0, 1, 0, 0, 0],
+                       'flag2': [1, 'TD', '1', None, 2.0]},
+                      index=[0, 1, 0, 1, 2])
+    flag_dict = {'flag1': [0], 'flag2': [1, 2, 'TD']}
+    df_new, df_excluded = filter_on_flag_columns(df, flag_dict)
+    assert_array_equal(df_new['spkitemid'], ['a', 'e'])
+    assert_array_equal(df_new['flag2'], [1.0, 2.0])
+    assert_array_equal(df_new.index, [0, 2])
+    assert_array_equal(df_excluded['spkitemid'], ['b', 'c', 'd'])
+    eq_(df_excluded['flag2'].tolist()[:2], ['TD', '1'])
+
+
+def test_filter_on_flag_column_integer_column_converted_to_float():
+    # the integer flag columns are converted to floats
+    # in both of the data frames as they were before
+    df = pd.DataFrame({'spkitemid': ['a', 'b', 'c'],
+                       'flag1': [0, 1, 0],
+                       'flag2': [1.0, 1.0, 2.0]})
+    df_new, df_excluded = filter_on_flag_columns(df, {'flag1': [0], 'flag2': [1]})
+    eq_(df_new['flag1'].dtype, np.float64)
+    eq_(df_excluded['flag1'].dtype, np.float64)
+    assert_array_equal(df_new['spkitemid'], ['a'])
+    assert_array_equal(df_excluded['flag1'], [1.0, 0.0])
+
+
 @raises(KeyError)
 def test_filter_on_flag_column_missing_columns():
     df = pd.DataFrame({'spkitemid': ['a', 'b', 'c', 'd'],
@@ -200,3 +268,106 @@ def test_remove_outliers():
     ceiling = np.mean(data) + 4*np.std(data)
     clamped_data = remove_outliers(data)
     assert_almost_equal(clamped_data[-1], ceiling)
+
+
+def test_feature_preprocessor():
+    # the compiled pipeline should give the same values as
+    # pre-processing and standardizing each feature separately
+    prng = np.random.RandomState(123)
+    df_train = pd.DataFrame({'f1': prng.lognormal(1, 0.5, 50),
+                             'f2': prng.lognormal(1, 0.5, 50),
+                             'f3': prng.normal(0, 1, 50)})
+    df_train.loc[0, 'f3'] = 10
+    df_test = pd.DataFrame({'f1': prng.lognormal(1, 0.5, 10),
+                            'f2': prng.lognormal(1, 0.5, 10),
+                            'f3': prng.normal(0, 1, 10)})
+    feature_specs = {'features': [{'feature': 'f1', 'transform': 'log', 'sign': 1},
+                                  {'feature': 'f2', 'transform': 'addOneInv', 'sign': -1},
+                                  {'feature': 'f3', 'transform': 'raw', 'sign': 1}]}
+    preprocessor, df_train_preprocessed = FeaturePreprocessor.fit_transform(df_train, feature_specs)
+    df_feature_info = preprocessor.feature_info
+    df_test_preprocessed = FeaturePreprocessor(df_feature_info).transform(df_test)
+    for fdict in feature_specs['features']:
+        name = fdict['feature']
+        train_values = preprocess_feature(df_train[name].values, name, fdict['transform'],
+                                          df_train[name].mean(), df_train[name].std())
+        test_values = preprocess_feature(df_test[name].values, name, fdict['transform'],
+                                         df_train[name].mean(), df_train[name].std(),
+                                         exclude_zero_sd=False)
+        for values, df_preprocessed in [(train_values, df_train_preprocessed),
+                                        (test_values, df_test_preprocessed)]:
+            assert_almost_equal(df_preprocessed[name].values,
+                                (values - train_values.mean()) / train_values.std(ddof=1) * fdict['sign'])
+    eq_(df_feature_info['sign'].tolist(), [1, -1, 1])
+
+
+def test_feature_preprocessor_fallback_parameters():
+    # the features with a training mean of zero are clamped using the
+    # mean of the data itself, so transforming the data in chunks
+    # gives the same results only with the fitted fallback parameters
+    prng = np.random.RandomState(123)
+    df_feature_info = pd.DataFrame({'feature': ['f1', 'f2'],
+                                    'transform': ['raw', 'raw'],
+                                    'sign': [1, 1],
+                                    'train_mean': [0, 1],
+                                    'train_sd': [1, 1],
+                                    'train_transformed_mean': [0, 1],
+                                    'train_transformed_sd': [1, 1]})
+    df_test = pd.DataFrame({'f1': prng.normal(3, 1, 20),
+                            'f2': prng.normal(1, 1, 20)})
+    df_test.loc[15, 'f1'] = 9
+    preprocessor = FeaturePreprocessor(df_feature_info)
+    eq_(preprocessor.fallback_columns.tolist(), [0])
+    df_expected = preprocessor.transform(df_test)
+    df_chunks = pd.concat([preprocessor.transform(df_test[:10]),
+                           preprocessor.transform(df_test[10:])])
+    ok_(not np.array_equal(df_chunks['f1'].values, df_expected['f1'].values))
+    preprocessor.fit_fallback_parameters(df_test[['f1']].values)
+    df_chunks = pd.concat([preprocessor.transform(df_test[:10]),
+                           preprocessor.transform(df_test[10:])])
+    assert_frame_equal(df_chunks, df_expected)
+
+
+def test_feature_preprocessor_with_transform_cache():
+    # the transformed values saved while selecting the transformations
+    # should give exactly the same results as transforming the features
+    prng = np.random.RandomState(123)
+    scores = prng.randint(1, 5, 50)
+    df_train = pd.DataFrame({'f1': np.exp(scores + prng.normal(0, 0.5, 50)),
+                             'f2': scores + prng.lognormal(1, 0.5, 50),
+                             'f3': 1 / scores + prng.lognormal(1, 0.5, 50),
+                             'sc1': scores})
+    df_train.loc[0, 'f3'] = 100
+    transform_cache = TransformCache()
+    feature_specs = generate_specs_from_data(['f1', 'f2', 'f3'],
+                                             'sc1',
+                                             df_train,
+                                             transform_cache=transform_cache)
+    ok_(len(transform_cache) > 0)
+    ok_(not any(key[0] == 'f3' for key in transform_cache._entries))
+    preprocessor, df_train_preprocessed = FeaturePreprocessor.fit_transform(df_train, feature_specs)
+    (cached_preprocessor,
+     df_train_preprocessed_cached) = FeaturePreprocessor.fit_transform(df_train,
+                                                                       feature_specs,
+                                                                       transform_cache=transform_cache)
+    assert_frame_equal(df_train_preprocessed_cached, df_train_preprocessed)
+    assert_frame_equal(cached_preprocessor.feature_info, preprocessor.feature_info)
+
+
+def test_transform_cache_eviction():
+    # the least recently used values are evicted
+    # once the cache is larger than the maximum size
+    transform_cache = TransformCache(max_bytes=8 * 20)
+    transform_cache.put('f1', 'sqrt', 1.0, 1.0, np.arange(10))
+    transform_cache.put('f2', 'sqrt', 1.0, 1.0, np.arange(10))
+    ok_(transform_cache.get('f1', 'sqrt', 1.0, 1.0) is not None)
+    transform_cache.put('f3', 'inv', 1.0, 1.0, np.arange(10))
+    eq_(len(transform_cache), 2)
+    eq_(transform_cache.size, 8 * 20)
+    ok_(transform_cache.get('f2', 'sqrt', 1.0, 1.0) is None)
+    values, mean, sd = transform_cache.get('f1', 'sqrt', 1.0, 1.0)
+    assert_array_equal(values, np.arange(10))
+    eq_(mean, 4.5)
+    ok_(transform_cache.get('f1', 'sqrt', 1.0, 2.0) is None)
+    transform_cache.put('f4', 'inv', 1.0, 1.0, np.arange(30))
+    eq_(len(transform_cache), 2)
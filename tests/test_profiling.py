@@ -0,0 +1,63 @@
+import json
+import tempfile
+
+from os.path import join
+from shutil import rmtree
+
+import numpy as np
+import pandas as pd
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, ok_
+
+from rsmtool.profiling import Profiler, reset_peak_rss
+
+
+def test_profiler_save():
+    # each stage should be saved with its counts and the
+    # report sections should be saved after their stage
+    profiler = Profiler()
+    profiler.start_stage('data')
+    profiler.end_stage(responses=10, features=2)
+    profiler.start_stage('report')
+    profiler.end_stage()
+    profiler.add_report_sections('report', {'data_description': 1.5})
+    tempdir = tempfile.mkdtemp()
+    try:
+        profiler.save('test', tempdir)
+        df_timings = pd.read_csv(join(tempdir, 'test_timings.csv'))
+        with open(join(tempdir, 'test_timings.json')) as timingsf:
+            timings = json.load(timingsf)
+    finally:
+        rmtree(tempdir)
+    eq_(df_timings.columns.tolist(), ['stage', 'seconds', 'peak_rss_mb',
+                                      'cumulative_peak_rss_mb', 'features', 'responses'])
+    eq_(df_timings['stage'].tolist(), ['data', 'report', 'report/data_description'])
+    eq_(df_timings['seconds'][2], 1.5)
+    ok_((df_timings['cumulative_peak_rss_mb'][:2] > 0).all())
+    eq_(timings['experiment_id'], 'test')
+    eq_(timings['stages'][0]['responses'], 10)
+    ok_('responses' not in timings['stages'][1])
+
+
+def test_profiler_peak_rss_per_stage():
+    # the peak memory use of a stage should not include
+    # the memory used by the previous stages
+    if not reset_peak_rss():
+        raise SkipTest('the peak memory use cannot be reset on this platform')
+    profiler = Profiler()
+    profiler.start_stage('large')
+    values = np.ones(25 * 1024 * 1024)
+    del values
+    profiler.start_stage('small')
+    profiler.end_stage()
+    large_stage, small_stage = profiler.stages
+    ok_(large_stage['peak_rss_mb'] - small_stage['peak_rss_mb'] > 100)
+    ok_(small_stage['cumulative_peak_rss_mb'] >= large_stage['peak_rss_mb'])
+
+
+def test_profiler_not_enabled():
+    profiler = Profiler(enabled=False)
+    profiler.start_stage('data')
+    profiler.end_stage(responses=10)
+    eq_(profiler.stages, [])
@@ -1,11 +1,20 @@
+import os
+import tempfile
+
+import nbformat
+
 from nose.tools import eq_, raises, ok_
 
-from os.path import join, normpath
+from os import remove
+from os.path import exists, join, normpath
+from shutil import rmtree
 
 from rsmtool.report import (check_section_names,
                             check_section_order,
                             determine_chosen_sections,
+                            execute_and_merge_notebooks,
                             get_ordered_notebook_files,
+                            get_report_input_files,
                             get_section_file_map,
                             master_section_dict,
                             notebook_path,
@@ -574,3 +583,144 @@ def test_get_section_file_map_rsmcompare():
     eq_(section_file_map['evaluation'], join(comparison_notebook_path, 'evaluation.ipynb'))
     eq_(section_file_map['notebook'], '/path/notebook.ipynb')
     eq_(section_file_map['placeholder'], normpath('special_notebook_path/placeholder.ipynb'))
+
+
+def write_notebook(notebook_file, source):
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_code_cell(source))
+    nbformat.write(notebook, notebook_file)
+
+
+def test_execute_and_merge_notebooks():
+    # each section is executed after the header in its own kernel
+    # and the section with an error does not affect the others
+    tempdir = tempfile.mkdtemp()
+    try:
+        notebook_files = []
+        for name, source in [('header', 'x = 1'),
+                             ('first', 'print(x + 1)'),
+                             ('broken', 'raise ValueError()'),
+                             ('last', 'print(x + 2)')]:
+            notebook_file = join(tempdir, '{}.ipynb'.format(name))
+            write_notebook(notebook_file, source)
+            notebook_files.append(notebook_file)
+
+        merged_file = join(tempdir, 'merged.ipynb')
+        section_times = execute_and_merge_notebooks(notebook_files,
+                                                    merged_file,
+                                                    num_workers=2)
+        merged_notebook = nbformat.read(merged_file, as_version=4)
+    finally:
+        rmtree(tempdir)
+
+    eq_(list(section_times.keys()), ['first', 'broken', 'last'])
+    eq_([cell.cell_type for cell in merged_notebook.cells],
+        ['code', 'code', 'markdown', 'code', 'code'])
+    eq_(merged_notebook.cells[1].outputs[0].text, '2\n')
+    eq_(merged_notebook.cells[4].outputs[0].text, '3\n')
+
+
+def test_execute_and_merge_notebooks_with_cache():
+    # the sections should only be executed again if their
+    # notebooks or the input files have changed and the
+    # figures should be restored from the cache
+    tempdir = tempfile.mkdtemp()
+    try:
+        figure_dir = join(tempdir, 'figure')
+        cache_dir = join(tempdir, 'cache')
+        os.makedirs(figure_dir)
+        input_file = join(tempdir, 'input.csv')
+        with open(input_file, 'w') as inputf:
+            inputf.write('a\n1\n')
+
+        notebook_files = [join(tempdir, '{}.ipynb'.format(name))
+                          for name in ['header', 'first', 'second']]
+        write_notebook(notebook_files[0],
+                       "import os\nfigure_dir = os.environ['FIGURE_DIR']")
+        write_notebook(notebook_files[1],
+                       "open(os.path.join(figure_dir, 'first.svg'), 'w').write('')")
+        write_notebook(notebook_files[2], 'print(1)')
+
+        def execute():
+            return execute_and_merge_notebooks(notebook_files,
+                                               join(tempdir, 'merged.ipynb'),
+                                               figure_dir=figure_dir,
+                                               cache_dir=cache_dir,
+                                               environment={'FIGURE_DIR': figure_dir},
+                                               input_files=[input_file])
+
+        execute()
+        remove(join(figure_dir, 'first.svg'))
+        section_times = execute()
+        eq_(list(section_times.values()), [0, 0])
+        ok_(exists(join(figure_dir, 'first.svg')))
+
+        write_notebook(notebook_files[2], 'print(2)')
+        section_times = execute()
+        eq_(section_times['first'], 0)
+        ok_(section_times['second'] > 0)
+
+        with open(input_file, 'w') as inputf:
+            inputf.write('a\n2\n')
+        section_times = execute()
+        ok_(section_times['first'] > 0)
+    finally:
+        rmtree(tempdir)
+
+
+def test_execute_and_merge_notebooks_with_changed_feature_subset_file():
+    # the sections should be executed again if the feature subset
+    # file read by the header is changed, even if its path is not
+    tempdir = tempfile.mkdtemp()
+    try:
+        output_dir = join(tempdir, 'output')
+        cache_dir = join(tempdir, 'cache')
+        os.makedirs(output_dir)
+        with open(join(output_dir, 'lr_eval.csv'), 'w') as outf:
+            outf.write('a\n1\n')
+        feature_subset_file = join(tempdir, 'feature_subset.csv')
+        with open(feature_subset_file, 'w') as subsetf:
+            subsetf.write('Feature,A\nFEATURE1,1\n')
+
+        notebook_files = [join(tempdir, '{}.ipynb'.format(name))
+                          for name in ['header', 'section']]
+        write_notebook(notebook_files[0],
+                       "import os\n"
+                       "subset = open(os.environ['FEATURE_SUBSET_FILE']).read()")
+        write_notebook(notebook_files[1], 'print(subset)')
+        environment = {'FEATURE_SUBSET_FILE': feature_subset_file}
+        os.environ.update(environment)
+
+        def execute():
+            input_files = get_report_input_files([join(output_dir, '*.csv')],
+                                                 environment)
+            return execute_and_merge_notebooks(notebook_files,
+                                               join(tempdir, 'merged.ipynb'),
+                                               cache_dir=cache_dir,
+                                               environment=environment,
+                                               input_files=input_files)
+
+        execute()
+        eq_(execute()['section'], 0)
+
+        with open(feature_subset_file, 'w') as subsetf:
+            subsetf.write('Feature,A\nFEATURE2,1\n')
+        section_times = execute()
+        merged_notebook = nbformat.read(join(tempdir, 'merged.ipynb'), as_version=4)
+    finally:
+        rmtree(tempdir)
+
+    ok_(section_times['section'] > 0)
+    ok_('FEATURE2' in merged_notebook.cells[-1].outputs[0].text)
+
+
+def test_get_report_input_files_skips_timings():
+    tempdir = tempfile.mkdtemp()
+    try:
+        for filename in ['lr_eval.csv', 'lr_timings.csv', 'lr_timings.json']:
+            with open(join(tempdir, filename), 'w') as outf:
+                outf.write('a\n1\n')
+        eq_(get_report_input_files([join(tempdir, '*.csv'), join(tempdir, '*.json')]),
+            [join(tempdir, 'lr_eval.csv')])
+    finally:
+        rmtree(tempdir)
@@ -0,0 +1,82 @@
+import json
+import tempfile
+
+from os.path import join
+from shutil import rmtree
+
+import numpy as np
+import pandas as pd
+
+from nose.tools import assert_raises, eq_
+from numpy.testing import assert_array_equal
+
+from rsmtool.model import create_fake_skll_learner, create_scoring_model
+from rsmtool.predict import predict_with_model
+from rsmtool.preprocess import FeaturePreprocessor, trim
+from rsmtool.scorer import ScoringModel
+
+prng = np.random.RandomState(123)
+df_train = pd.DataFrame({'spkitemid': ['r{}'.format(i) for i in range(50)],
+                         'f1': prng.lognormal(1, 0.5, 50),
+                         'f2': prng.lognormal(1, 0.5, 50),
+                         'f3': prng.normal(0, 1, 50)})
+df_test = pd.DataFrame({'spkitemid': ['t{}'.format(i) for i in range(10)],
+                        'f1': prng.lognormal(1, 0.5, 10),
+                        'f2': prng.lognormal(1, 0.5, 10),
+                        'f3': prng.normal(0, 1, 10)})
+feature_specs = {'features': [{'feature': 'f1', 'transform': 'log', 'sign': 1},
+                              {'feature': 'f2', 'transform': 'inv', 'sign': -1},
+                              {'feature': 'f3', 'transform': 'raw', 'sign': 1}]}
+df_coefficients = pd.DataFrame({'feature': ['Intercept', 'f1', 'f2', 'f3'],
+                                'coefficient': [3.1, 0.4, 0.2, -0.3]},
+                               columns=['feature', 'coefficient'])
+df_postproc_params = pd.DataFrame([{'trim_min': 1,
+                                    'trim_max': 6,
+                                    'h1_mean': 3.5,
+                                    'h1_sd': 1.1,
+                                    'train_predictions_mean': 3.2,
+                                    'train_predictions_sd': 0.6}])
+
+
+def make_scoring_model():
+    preprocessor, _ = FeaturePreprocessor.fit_transform(df_train, feature_specs)
+    learner = create_fake_skll_learner(df_coefficients)
+    scoring_model = create_scoring_model(learner,
+                                         preprocessor.feature_info,
+                                         df_postproc_params,
+                                         'test')
+    return preprocessor, learner, scoring_model
+
+
+def test_scoring_model_matches_rsmpredict():
+    # the scores should be exactly the same as the ones
+    # computed with the pre-processor and the SKLL learner
+    preprocessor, learner, scoring_model = make_scoring_model()
+    df_predictions = predict_with_model(learner, preprocessor.transform(df_test))
+    scale = (df_predictions['raw'] - 3.2) / 0.6 * 1.1 + 3.5
+    scores = scoring_model.score(df_test[scoring_model.features].values)
+    assert_array_equal(scores['raw'], df_predictions['raw'])
+    assert_array_equal(scores['scale'], scale)
+    assert_array_equal(scores['raw_trim'], trim(df_predictions['raw'].values, 1, 6))
+    assert_array_equal(scores['scale_trim_round'], np.rint(trim(scale.values, 1, 6)))
+
+
+def test_scoring_model_save_and_load():
+    _, _, scoring_model = make_scoring_model()
+    tempdir = tempfile.mkdtemp()
+    try:
+        model_file = join(tempdir, 'test_scoring_model.json')
+        scoring_model.save(model_file)
+        with open(model_file) as modelf:
+            eq_(json.load(modelf)['features'], ['f1', 'f2', 'f3'])
+        loaded_model = ScoringModel.from_file(model_file)
+    finally:
+        rmtree(tempdir)
+    responses = df_test[['f3', 'f1', 'f2']].to_dict(orient='records')
+    eq_(loaded_model.score_responses(responses), scoring_model.score_responses(responses))
+
+
+def test_scoring_model_with_invalid_values():
+    # the inverse transformation cannot be applied to zeros
+    _, _, scoring_model = make_scoring_model()
+    assert_raises(ValueError, scoring_model.score_responses, [{'f1': 1, 'f2': 0, 'f3': 1}])
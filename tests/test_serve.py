@@ -0,0 +1,67 @@
+import io
+import json
+
+from os.path import dirname, join
+
+import pandas as pd
+
+from nose.tools import eq_, ok_
+from numpy.testing import assert_array_almost_equal
+
+from rsmtool.serve import Scorer, serve_json_lines
+
+# get the directory containing the tests
+test_dir = dirname(__file__)
+
+experiment_dir = join(test_dir, 'data', 'experiments',
+                      'lr-predict-missing-values', 'existing_experiment')
+
+
+def get_responses():
+    df = pd.read_csv(join(test_dir, 'data', 'files', 'test_with_non_numeric.csv'),
+                     dtype={'ID': str})
+    df = df.astype(object).where(df.notnull(), None)
+    return df.to_dict(orient='records')
+
+
+def test_scorer_matches_rsmpredict():
+    # the scores should be the same as the ones generated by
+    # rsmpredict and responses with non-numeric values are
+    # returned with errors in the same order
+    responses = get_responses()
+    scores = Scorer().score(experiment_dir, 'lr', responses, id_column='ID')
+    eq_([score['spkitemid'] for score in scores], [response['ID'] for response in responses])
+    df_scores = pd.DataFrame([score for score in scores if 'error' not in score])
+    df_expected = pd.read_csv(join(test_dir, 'data', 'experiments',
+                                   'lr-predict-missing-values', 'output',
+                                   'predictions.csv'))
+    eq_(df_scores['spkitemid'].tolist(), df_expected['spkitemid'].tolist())
+    for column in ['raw', 'scale', 'raw_trim', 'raw_trim_round', 'scale_trim', 'scale_trim_round']:
+        assert_array_almost_equal(df_scores[column], df_expected[column], decimal=3)
+    eq_(len(scores) - len(df_scores), 5)
+
+
+def test_scorer_cache():
+    # the experiment files should only be loaded once
+    # and the least recently used one should be evicted
+    scorer = Scorer(cache_size=1)
+    experiment = scorer.load(experiment_dir, 'lr')
+    ok_(scorer.load(experiment_dir, 'lr') is experiment)
+    other_experiment_dir = join(test_dir, 'data', 'experiments',
+                                'lr-predict', 'existing_experiment')
+    scorer.load(other_experiment_dir, 'lr')
+    eq_(len(scorer._experiments), 1)
+    ok_(scorer.load(experiment_dir, 'lr') is not experiment)
+
+
+def test_serve_json_lines():
+    request = {'experiment_dir': experiment_dir,
+               'experiment_id': 'lr',
+               'id_column': 'ID',
+               'responses': get_responses()[:2]}
+    infile = io.StringIO('{}\nnot json\n'.format(json.dumps(request)))
+    outfile = io.StringIO()
+    serve_json_lines(Scorer(), infile, outfile)
+    responses = [json.loads(line) for line in outfile.getvalue().splitlines()]
+    eq_(len(responses[0]['scores']), 2)
+    ok_('error' in responses[1])
@@ -0,0 +1,208 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from os.path import exists, join
+from shutil import rmtree
+
+from nose.tools import assert_almost_equal, eq_
+from numpy.testing import assert_array_almost_equal
+from pandas.util.testing import assert_frame_equal
+
+from rsmtool.utils import (agreement,
+                           agreement_at_tolerances,
+                           get_output_files,
+                           load_checkpoint,
+                           partial_correlations_from_covariance,
+                           read_binary_frame,
+                           read_experiment_frame,
+                           remove_checkpoint,
+                           save_checkpoint,
+                           write_binary_frame,
+                           write_experiment_output)
+
+
+def test_agreement():
+    score1 = [1, 2, 3, 4]
+    score2 = [1, 3, 5, 4]
+    eq_(agreement(score1, score2), 50.0)
+    eq_(agreement(score1, score2, tolerance=1), 75.0)
+    eq_(agreement(score1, score2, tolerance=2), 100.0)
+
+
+def test_agreement_with_missing_scores():
+    # missing scores should never count as agreements
+    # but they are still included in the total
+    score1 = [1, 2, 3, 4]
+    score2 = [1, np.nan, 3, np.nan]
+    eq_(agreement(score1, score2, tolerance=1), 50.0)
+
+
+def test_agreement_with_float_scores():
+    score1 = [1, 2, 3, 4]
+    score2 = [1.2, 2.9, 1.5, 4.0]
+    assert_almost_equal(agreement(score1, score2), 25.0)
+    assert_almost_equal(agreement(score1, score2, tolerance=1), 75.0)
+
+
+def test_agreement_at_tolerances():
+    score1 = [1, 2, 3, 4]
+    score2 = [1, 3, 5, 4]
+    assert_array_almost_equal(agreement_at_tolerances(score1, score2, [0, 1, 2]),
+                              [50.0, 75.0, 100.0])
+
+
+def test_agreement_at_tolerances_with_multiple_columns():
+    score1 = [1, 2, 3, 4]
+    score2 = np.array([[1, 1],
+                       [3, 2],
+                       [5, 3],
+                       [4, 2]])
+    assert_array_almost_equal(agreement_at_tolerances(score1, score2, [0, 1]),
+                              [[50.0, 75.0], [75.0, 75.0]])
+
+
+def test_agreement_at_tolerances_by_group():
+    score1 = [1, 2, 3, 4]
+    score2 = [1, 3, 5, 4]
+    group_codes = [0, 1, 1, 0]
+    assert_array_almost_equal(agreement_at_tolerances(score1, score2, [0, 1],
+                                                      group_codes=group_codes,
+                                                      num_groups=2),
+                              [[100.0, 0.0], [100.0, 50.0]])
+
+
+def test_partial_correlations_from_covariance():
+    prng = np.random.RandomState(123)
+    values = prng.normal(0, 1, (50, 3))
+    covariance = np.cov(values, rowvar=0)
+    pcor, rank = partial_correlations_from_covariance(covariance, 50)
+    precision = np.linalg.inv(covariance)
+    expected = -precision[0, 1] / np.sqrt(precision[0, 0] * precision[1, 1])
+    eq_(rank, 3)
+    assert_almost_equal(pcor[0, 1], expected)
+    assert_array_almost_equal(np.diag(pcor), [1, 1, 1])
+
+
+def test_partial_correlations_from_covariance_with_collinear_variables():
+    # the pseudo-inverse should be used instead of returning NaNs
+    prng = np.random.RandomState(123)
+    values = prng.normal(0, 1, (50, 2))
+    values = np.column_stack([values, values[:, 0] + values[:, 1]])
+    pcor, rank = partial_correlations_from_covariance(np.cov(values, rowvar=0), 50)
+    eq_(rank, 2)
+    eq_(np.isnan(pcor).sum(), 0)
+
+
+def test_partial_correlations_from_covariance_with_too_few_observations():
+    covariance = np.cov(np.random.RandomState(123).normal(0, 1, (2, 3)), rowvar=0)
+    pcor, rank = partial_correlations_from_covariance(covariance, 2)
+    eq_(rank, 0)
+    eq_(np.isnan(pcor).sum(), 6)
+
+
+def test_write_and_read_binary_frame():
+    # the column types and missing values should be preserved
+    df = pd.DataFrame({'spkitemid': ['001', '002', '003'],
+                       'sc1': [1, 2, 3],
+                       'FEATURE1': [0.1, np.nan, 1e-20],
+                       'L1': ['Esperanto', np.nan, 'Klingon'],
+                       'flag': [True, False, True]},
+                      columns=['spkitemid', 'sc1', 'FEATURE1', 'L1', 'flag'])
+    tempdir = tempfile.mkdtemp()
+    try:
+        npz_file = join(tempdir, 'test.npz')
+        write_binary_frame(df, npz_file)
+        df_read = read_binary_frame(npz_file)
+    finally:
+        rmtree(tempdir)
+    assert_frame_equal(df_read, df)
+
+
+def test_read_experiment_frame_same_types_as_csv():
+    # the non-numeric columns should be read back with the same
+    # types as from the CSV file, including the numeric strings
+    df = pd.DataFrame({'spkitemid': ['001', '002', '003'],
+                       'L1': ['1', '2', '10'],
+                       'mixed': [1, 'a', np.nan],
+                       'flag': ['1', np.nan, '2.5']},
+                      columns=['spkitemid', 'L1', 'mixed', 'flag'])
+    tempdir = tempfile.mkdtemp()
+    try:
+        write_experiment_output([df], ['test_metadata'], 'test', tempdir,
+                                write_binary=True)
+        csv_file = join(tempdir, 'test_test_metadata.csv')
+        df_expected = pd.read_csv(csv_file, converters={'spkitemid': str})
+        df_read = read_experiment_frame(csv_file, converters={'spkitemid': str})
+    finally:
+        rmtree(tempdir)
+    assert_frame_equal(df_read, df_expected)
+    eq_(df_read['L1'].dtype, np.int64)
+
+
+def test_read_experiment_frame():
+    # the binary file should only be used if it is up to date
+    df = pd.DataFrame({'spkitemid': ['001', '002'],
+                       'sc1': [1, 2]},
+                      columns=['spkitemid', 'sc1'])
+    tempdir = tempfile.mkdtemp()
+    try:
+        write_experiment_output([df], ['pred_processed'], 'test', tempdir,
+                                write_binary=True)
+        csv_file = join(tempdir, 'test_pred_processed.csv')
+        npz_file = join(tempdir, 'test_pred_processed.npz')
+        eq_(exists(npz_file), True)
+        assert_frame_equal(read_experiment_frame(csv_file, converters={'spkitemid': str}), df)
+
+        # overwrite the CSV file so that the binary file is out of date
+        df_new = df.copy()
+        df_new['sc1'] = [3, 4]
+        df_new.to_csv(csv_file, index=False)
+        os.utime(npz_file, (0, 0))
+        df_read = read_experiment_frame(csv_file, converters={'spkitemid': str})
+    finally:
+        rmtree(tempdir)
+    assert_frame_equal(df_read, df_new)
+
+
+def test_save_and_load_checkpoint():
+    # the checkpoint should only be loaded if the fingerprint
+    # is the same and the output files have not been changed
+    tempdir = tempfile.mkdtemp()
+    try:
+        checkpoint_dir = join(tempdir, 'checkpoints')
+        csv_file = join(tempdir, 'test.csv')
+        with open(csv_file, 'w') as csvf:
+            csvf.write('a,b\n1,2\n')
+        output_files = dict((filename, file_info[0]) for filename, file_info
+                            in get_output_files(tempdir, exclude_dir=checkpoint_dir).items())
+        eq_(list(output_files), ['test.csv'])
+        save_checkpoint(checkpoint_dir, 'data', 'abc', {'x': 1}, output_files)
+        eq_(list(get_output_files(tempdir, exclude_dir=checkpoint_dir)), ['test.csv'])
+        eq_(load_checkpoint(checkpoint_dir, 'data', 'abc', tempdir), (True, {'x': 1}))
+        eq_(load_checkpoint(checkpoint_dir, 'data', 'abd', tempdir), (False, None))
+        eq_(load_checkpoint(checkpoint_dir, 'train', 'abc', tempdir), (False, None))
+        with open(csv_file, 'a') as csvf:
+            csvf.write('3,4\n')
+        eq_(load_checkpoint(checkpoint_dir, 'data', 'abc', tempdir), (False, None))
+    finally:
+        rmtree(tempdir)
+
+
+def test_save_checkpoint_again_and_remove_checkpoint():
+    # saving a checkpoint again should replace it without leaving
+    # any temporary files and a removed checkpoint should be ignored
+    tempdir = tempfile.mkdtemp()
+    try:
+        checkpoint_dir = join(tempdir, 'checkpoints')
+        save_checkpoint(checkpoint_dir, 'data', 'abc', {'x': 1}, {})
+        save_checkpoint(checkpoint_dir, 'data', 'abc', {'x': 2}, {})
+        eq_(sorted(os.listdir(checkpoint_dir)), ['data.json', 'data.pkl'])
+        eq_(load_checkpoint(checkpoint_dir, 'data', 'abc', tempdir), (True, {'x': 2}))
+        remove_checkpoint(checkpoint_dir, 'data')
+        eq_(load_checkpoint(checkpoint_dir, 'data', 'abc', tempdir), (False, None))
+        remove_checkpoint(checkpoint_dir, 'data')
+    finally:
+        rmtree(tempdir)